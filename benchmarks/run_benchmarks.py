@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import time
+import traceback
+from dataclasses import asdict, replace
+from typing import Any, Callable, Optional
+
+import polars as pl
+
+from benchmarks.synthetic import RetailSpec, generate_customers, generate_sales, write_sales_parquet
+from src.pipeline.features import customer_features, daily_store_sales, fill_missing_time_series
+from src.pipeline.model import forecast, train_baseline
+from src.pipeline.transform import clean_customers, clean_sales
+
+
+DEFAULT_SIZES = [100_000, 1_000_000, 10_000_000, 100_000_000]
+# From this many rows the sales input is streamed to a Parquet file once (in chunks) and
+# read from there, instead of being generated in memory
+PARQUET_FROM_ROWS = 10_000_000
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> tuple[float, Any]:
+    # Best of `repeat` runs; the last result is handed to dependent stages
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def _rows(value: Any) -> Optional[int]:
+    return value.height if isinstance(value, pl.DataFrame) else None
+
+
+def sales_parquet(spec: RetailSpec, data_dir: str) -> str:
+    # The spec's sales as Parquet under data_dir, written on first use and reused by later runs
+    key = hashlib.sha256(json.dumps(asdict(spec), default=str, sort_keys=True).encode()).hexdigest()[:16]
+    path = os.path.join(data_dir, f"sales-{spec.n_rows}-{key}.parquet")
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}"
+        write_sales_parquet(spec, tmp)
+        os.replace(tmp, path)
+        print(f"Wrote {spec.n_rows} sales rows to {path}", file=sys.stderr)
+    return path
+
+
+def bench_size(
+    spec: RetailSpec, repeat: int, horizon: int, parquet_from: int = PARQUET_FROM_ROWS, data_dir: str = "bench_data",
+) -> list[dict]:
+    if spec.n_rows >= parquet_from:
+        # clean_sales then includes the streaming Parquet read
+        raw = pl.scan_parquet(sales_parquet(spec, data_dir))
+        clean = lambda: clean_sales(raw).collect(streaming=True)  # noqa: E731
+    else:
+        raw = generate_sales(spec)
+        clean = lambda: clean_sales(raw)  # noqa: E731
+    customers = clean_customers(generate_customers(spec))
+    ctx: dict[str, Any] = {}
+    stages: list[tuple[str, Callable[[], Any]]] = [
+        ("clean_sales", clean),
+        ("daily_store_sales", lambda: daily_store_sales(ctx["clean_sales"])),
+        ("customer_features", lambda: customer_features(ctx["clean_sales"], customers)),
+        ("fill_missing_time_series", lambda: fill_missing_time_series(
+            ctx["daily_store_sales"], "store_id", "date", ["qty_sum", "rev_sum", "num_txn"],
+        )),
+        ("train_baseline", lambda: train_baseline(ctx["daily_store_sales"])),
+        ("forecast", lambda: forecast(ctx["train_baseline"], ctx["daily_store_sales"], horizon)),
+    ]
+    results = []
+    for name, fn in stages:
+        entry = {"size": spec.n_rows, "stage": name}
+        try:
+            seconds, value = _time(fn, repeat)
+            ctx[name] = value
+            entry.update({"seconds": seconds, "rows_out": _rows(value)})
+        except Exception as exc:  # keep benchmarking the remaining stages
+            entry.update({"error": f"{type(exc).__name__}: {exc}"})
+            traceback.print_exc()
+        results.append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+    return results
+
+
+def run(
+    sizes: list[int], spec: RetailSpec, repeat: int = 3, horizon: int = 14,
+    parquet_from: int = PARQUET_FROM_ROWS, data_dir: str = "bench_data",
+) -> dict:
+    results = []
+    for n in sizes:
+        results.extend(bench_size(replace(spec, n_rows=n), repeat, horizon, parquet_from, data_dir))
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "polars": pl.__version__,
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "spec": {k: str(v) for k, v in asdict(spec).items() if k != "n_rows"},
+            "repeat": repeat,
+            "horizon": horizon,
+            "parquet_from": parquet_from,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    # A stage regresses when it is more than `threshold` (fractional) slower than baseline,
+    # when it failed, or when a stage the baseline timed is missing at a size benchmarked now
+    base = {(r["size"], r["stage"]): r for r in baseline["results"] if "seconds" in r}
+    seen = {(r["size"], r["stage"]) for r in current["results"]}
+    sizes = {r["size"] for r in current["results"]}
+    regressions = []
+    for r in current["results"]:
+        old = base.get((r["size"], r["stage"]))
+        if "seconds" not in r:
+            regressions.append({**r, "reason": "error", "baseline_seconds": old["seconds"] if old else None})
+            continue
+        if old is None or old["seconds"] <= 0:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        if ratio > 1.0 + threshold:
+            regressions.append({**r, "reason": "slower", "baseline_seconds": old["seconds"], "ratio": ratio})
+    for (size, stage), old in base.items():
+        if size in sizes and (size, stage) not in seen:
+            regressions.append({"size": size, "stage": stage, "reason": "missing", "baseline_seconds": old["seconds"]})
+    return regressions
+
+
+def format_regression(r: dict) -> str:
+    # One line per compare() entry; only "slower" entries carry seconds and a ratio
+    where = r["stage"] if r.get("size") is None else f"{r['stage']} @ {r['size']}"
+    if r["reason"] == "slower":
+        return f"REGRESSION {where}: {r['baseline_seconds']:.4f}s -> {r['seconds']:.4f}s (x{r['ratio']:.2f})"
+    if r["reason"] == "error":
+        return f"REGRESSION {where}: failed ({r.get('error')})"
+    return f"REGRESSION {where}: missing from this run"
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic retail data")
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES[:2]),
+                        help="comma-separated sales row counts, e.g. 1e5,1e6,1e7")
+    parser.add_argument("--stores", type=int, default=RetailSpec.n_stores)
+    parser.add_argument("--products", type=int, default=RetailSpec.n_products)
+    parser.add_argument("--customers", type=int, default=RetailSpec.n_customers)
+    parser.add_argument("--days", type=int, default=RetailSpec.n_days)
+    parser.add_argument("--skew", type=float, default=RetailSpec.skew)
+    parser.add_argument("--seed", type=int, default=RetailSpec.seed)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--horizon", type=int, default=14)
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, e.g. 0.10 = 10%%")
+    parser.add_argument("--parquet-from", type=float, default=PARQUET_FROM_ROWS,
+                        help="sizes from this many rows read their sales from a Parquet file written once")
+    parser.add_argument("--data-dir", default="bench_data", help="where those Parquet inputs are kept")
+    args = parser.parse_args(argv)
+
+    sizes = [int(float(s)) for s in args.sizes.split(",") if s]
+    spec = RetailSpec(
+        n_stores=args.stores, n_products=args.products, n_customers=args.customers,
+        n_days=args.days, skew=args.skew, seed=args.seed,
+    )
+    current = run(
+        sizes, spec, repeat=args.repeat, horizon=args.horizon,
+        parquet_from=int(args.parquet_from), data_dir=args.data_dir,
+    )
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(current, json.load(f), args.threshold)
+        for r in regressions:
+            print(format_regression(r))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Optional
+
+from benchmarks.run_benchmarks import compare, format_regression
+
+
+# Cold-start benchmark: every measurement runs in a fresh interpreter, so it pays the
+# full import cost a new Cloud Function instance or Dataproc driver pays.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = ["functions.main", "src.pipeline.trigger", "src.pipeline.dataproc_job", "src.pipeline.orchestrate"]
+HEAVY = ["polars", "pyarrow", "numpy", "pandas", "scipy", "sklearn", "google.cloud.storage", "google.auth"]
+
+# Imports `module`; for the trigger also times the first request, with a fake transport
+# standing in for the metadata server and the Dataproc API
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module} as target
+imported = time.perf_counter()
+first = None
+if {respond}:
+    from src.pipeline import trigger
+    trigger.set_transport(lambda method, url, headers, body: {{
+        "access_token": "token", "expires_in": 3600, "reference": {{"jobId": "bench"}},
+    }})
+    # The 202 with the run id, once the job is submitted
+    target.trigger(None)
+    first = time.perf_counter() - t0
+print(json.dumps({{
+    "import": imported - t0, "first_response": first,
+    "heavy": sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+
+def probe(module: str, respond: bool = False) -> dict:
+    env = {
+        **os.environ,
+        # Submission path of the trigger (no network: the transport is faked)
+        "GCP_PROJECT_ID": os.getenv("GCP_PROJECT_ID", "bench-project"),
+        "DATAPROC_CLUSTER": os.getenv("DATAPROC_CLUSTER", "bench-cluster"),
+        "DATAPROC_MAIN_URI": os.getenv("DATAPROC_MAIN_URI", "gs://bench/run_dataproc_job.py"),
+    }
+    code = _PROBE.format(module=module, respond=respond, heavy=HEAVY)
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True, timeout=120
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def run(targets: Optional[list[str]] = None, repeat: int = 5) -> dict:
+    results = []
+    for module in targets or TARGETS:
+        respond = module in ("functions.main", "src.pipeline.trigger")
+        probes = [probe(module, respond) for _ in range(repeat)]
+        entry = {"size": None, "stage": f"import:{module}", "seconds": min(p["import"] for p in probes),
+                 "heavy_modules": probes[0]["heavy"]}
+        results.append(entry)
+        print(json.dumps(entry), file=sys.stderr)
+        if respond:
+            entry = {"size": None, "stage": f"first_response:{module}",
+                     "seconds": min(p["first_response"] for p in probes)}
+            results.append(entry)
+            print(json.dumps(entry), file=sys.stderr)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "machine": platform.machine(),
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark cold-start import time of the entry points")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma-separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--out", default="startup_results.json")
+    parser.add_argument("--baseline", help="previous results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, e.g. 0.10 = 10%%")
+    args = parser.parse_args(argv)
+
+    current = run([t for t in args.targets.split(",") if t], repeat=args.repeat)
+    with open(args.out, "w") as f:
+        json.dump(current, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(current, json.load(f), args.threshold)
+        for r in regressions:
+            print(format_regression(r))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
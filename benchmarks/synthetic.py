@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from typing import Iterator
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+
+@dataclass(frozen=True)
+class RetailSpec:
+    n_rows: int = 100_000
+    n_stores: int = 50
+    n_products: int = 1_000
+    n_customers: int = 20_000
+    n_days: int = 365
+    # Zipf-like exponent for store/product/customer popularity; 0 = uniform
+    skew: float = 1.1
+    # Fraction of sales rows without a customer_id (anonymous checkouts)
+    anonymous_share: float = 0.2
+    start: date = date(2023, 1, 1)
+    seed: int = 42
+
+
+def _weights(n: int, skew: float) -> np.ndarray:
+    w = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** skew
+    return w / w.sum()
+
+
+def _labels(prefix: str, n: int) -> pl.Series:
+    width = len(str(n - 1))
+    return pl.Series([f"{prefix}{i:0{width}d}" for i in range(n)], dtype=pl.Utf8)
+
+
+def generate_customers(spec: RetailSpec) -> pl.DataFrame:
+    rng = np.random.default_rng(spec.seed + 1)
+    offsets = rng.integers(-3 * 365, spec.n_days, spec.n_customers)
+    return pl.DataFrame({
+        "customer_id": _labels("c", spec.n_customers),
+        "signup_date": np.datetime64(spec.start, "D") + offsets.astype("timedelta64[D]"),
+    }).with_columns(pl.col("signup_date").cast(pl.Date))
+
+
+def iter_sales(spec: RetailSpec, chunk_rows: int = 5_000_000) -> Iterator[pl.DataFrame]:
+    # Deterministic for a given spec and chunk size; chunks keep peak memory bounded
+    # when writing very large (1e8 row) inputs
+    rng = np.random.default_rng(spec.seed)
+    stores, products, customers = (
+        _labels("s", spec.n_stores), _labels("p", spec.n_products), _labels("c", spec.n_customers),
+    )
+    store_p, product_p, customer_p = (
+        _weights(spec.n_stores, spec.skew), _weights(spec.n_products, spec.skew), _weights(spec.n_customers, spec.skew),
+    )
+    base_price = np.round(rng.lognormal(mean=2.0, sigma=0.6, size=spec.n_products), 2)
+    start = np.datetime64(spec.start, "D")
+
+    remaining = spec.n_rows
+    while remaining > 0:
+        n = min(chunk_rows, remaining)
+        remaining -= n
+        product_idx = rng.choice(spec.n_products, size=n, p=product_p)
+        customer_idx = rng.choice(spec.n_customers, size=n, p=customer_p)
+        anonymous = rng.random(n) < spec.anonymous_share
+        yield pl.DataFrame({
+            "date": start + rng.integers(0, spec.n_days, n).astype("timedelta64[D]"),
+            "store_id": stores.gather(rng.choice(spec.n_stores, size=n, p=store_p)),
+            "product_id": products.gather(product_idx),
+            "quantity": rng.poisson(1.5, n) + 1,
+            "price": np.round(base_price[product_idx] * rng.uniform(0.9, 1.1, n), 2),
+            "customer_id": customers.gather(customer_idx),
+        }).with_columns(
+            pl.when(pl.Series(anonymous)).then(None).otherwise(pl.col("customer_id")).alias("customer_id"),
+            pl.col("date").cast(pl.Date),
+        )
+
+
+def generate_sales(spec: RetailSpec) -> pl.DataFrame:
+    return pl.concat(list(iter_sales(spec)), rechunk=True)
+
+
+def write_sales_parquet(spec: RetailSpec, path: str, chunk_rows: int = 5_000_000) -> None:
+    writer = None
+    try:
+        for chunk in iter_sales(spec, chunk_rows):
+            table = chunk.to_arrow()
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema, compression="zstd")
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
@@ -1,18 +1,7 @@
 from __future__ import annotations
 
-import os
-
-from src.pipeline.config import gcp, paths
-from src.pipeline.dataproc_job import main as run_dataproc_job, main as run_dataproc_job_with_auth
-
-
-def trigger(request):  # Google Cloud Functions HTTP entrypoint
-    _ = request  # unused
-    run_dataproc_job()
-    return ("Triggered Dataproc pipeline", 200)
-
-def trigger_with_auth(request):  # Google Cloud Functions HTTP entrypoint
-    _ = request  # unused
-    run_dataproc_job_with_auth()
-    return ("Triggered Dataproc pipeline", 200)
+# Only the lightweight trigger is imported at cold start; see src/pipeline/trigger.py
+from src.pipeline.trigger import status, trigger
 
+# Caller authentication is enforced by Cloud Functions IAM; both entry points submit the same job
+trigger_with_auth = trigger
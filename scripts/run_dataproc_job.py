@@ -0,0 +1,13 @@
+from __future__ import annotations
+
+# Main file of the Dataproc job (DATAPROC_MAIN_URI). dataproc_job uses package-relative
+# imports, so it cannot be the main file itself; this launcher imports it from the zip of
+# src/ shipped in pythonFileUris (DATAPROC_PYTHON_FILES), built from the repo root with
+# `zip -r src.zip src -x '*/__pycache__/*'`.
+from src.pipeline.dataproc_job import main, parse_args
+from src.pipeline.profiling import RunReport
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.sales_blob, args.customers_blob, RunReport(run_id=args.run_id) if args.run_id else None)
@@ -5,24 +5,62 @@ Modules:
 - config: centralized configuration
 - logging_utils: structured logging setup
 - ingest: read CSV/Parquet from local or GCS
+- filesystems: resolve local paths and gs:// URIs to pyarrow filesystems
+- datasets: hive-partitioned Parquet datasets with atomic manifest commits
+- schemas: dtype registry for pipeline tables (categorical ids, downcast numerics)
 - transform: cleaning and canonical transformations
+- validation: rule bitmasks, quarantined rejects and streaming column sketches
 - features: feature engineering for forecasting
+- outofcore: customer features over disk-spilled customer_id hash buckets
+- single_pass: every sales-derived output from one scan of sales (spill + batched fold)
+- feature_specs: declarative model features compiled to window expressions
 - model: training, evaluation, forecasting
+- estimators: pluggable estimator backends and batched prediction
+- partitioned: per-store / per-cluster model training across processes
+- hierarchy: sparse store x product forecasts reconciled to store and chain totals
+- backtest: rolling-origin cross-validation and candidate search
+- model_store: versioned model artifacts and warm-start refits
+- dag: stage DAG executor (concurrent stages and writes, per-stage retry)
 - orchestrate: end-to-end orchestration entrypoint
+- cache: content-addressed cache of stage outputs
+- profiling: per-stage timing/memory/IO metrics and run reports
+- incremental: mergeable aggregate state for append-only runs
+- forecast_service: in-memory forecast query service (HTTP) with hot reload
 - gcp_utils: helpers for GCS, Dataproc
 - dataproc_job: entrypoint for Dataproc cluster jobs
+- trigger: lightweight Cloud Function entrypoint submitting Dataproc jobs
+- runs: run queue, de-duplication and per-stage progress tracking for the trigger
 """
 
 __all__ = [
     "config",
     "logging_utils",
     "ingest",
+    "filesystems",
+    "datasets",
+    "schemas",
     "transform",
+    "validation",
     "features",
+    "outofcore",
+    "single_pass",
+    "feature_specs",
     "model",
+    "estimators",
+    "partitioned",
+    "hierarchy",
+    "backtest",
+    "model_store",
+    "dag",
     "orchestrate",
+    "cache",
+    "profiling",
+    "incremental",
+    "forecast_service",
     "gcp_utils",
     "dataproc_job",
+    "trigger",
+    "runs",
 ]
 
 
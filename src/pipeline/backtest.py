@@ -0,0 +1,264 @@
+from __future__ import annotations
+
+import itertools
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import date, timedelta
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import polars as pl
+import pyarrow as pa
+from threadpoolctl import threadpool_limits
+
+from .config import Backtest
+from .config import backtest as backtest_config
+from .config import modeling
+from .estimators import fit_estimator
+from .feature_specs import FeatureSpec, parse_spec
+from .logging_utils import get_logger
+from .model import TARGET_COL, ModelArtifacts, forecast, supervised_frame, time_split
+from .partitioned import _to_shared_memory
+from .schemas import DAILY, ID, conform
+
+
+logger = get_logger(__name__)
+
+
+SCORED_SCHEMA = {
+    "candidate": pl.Utf8,
+    "fold": pl.Int32,
+    "cutoff": pl.Date,
+    "store_id": ID,
+    "date": pl.Date,
+    TARGET_COL: pl.Float64,
+    "rev_fcst": pl.Float64,
+}
+
+
+@dataclass(frozen=True)
+class Candidate:
+    name: str
+    model_type: str
+    spec_text: str = ""  # empty = FEATURE_SPEC
+    params: tuple[tuple[str, Any], ...] = ()
+
+
+@dataclass
+class BacktestResult:
+    scored: pl.DataFrame  # one row per candidate, fold, store and test date
+    folds: pl.DataFrame  # metrics per candidate and fold
+    stores: pl.DataFrame  # metrics per candidate and store, over all folds
+    summary: pl.DataFrame  # metrics per candidate, best (lowest WAPE) first
+
+    @property
+    def best(self) -> Optional[str]:
+        return self.summary.get_column("candidate")[0] if self.summary.height else None
+
+
+def _number(value: str) -> Any:
+    value = value.strip()
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_grid(text: str) -> list[dict[str, Any]]:
+    # "learning_rate=0.05,0.1;max_leaf_nodes=15,31" -> the cartesian product of settings
+    axes = []
+    for term in filter(None, (t.strip() for t in text.split(";"))):
+        key, values = term.split("=", 1)
+        axes.append([(key.strip(), _number(v)) for v in values.split(",")])
+    return [dict(combo) for combo in itertools.product(*axes)]
+
+
+def candidates_from_config(config: Backtest = backtest_config) -> list[Candidate]:
+    specs = config.specs or ("",)
+    out = []
+    for model_type in config.models:
+        # Hyperparameter grids only apply to the boosted backends
+        grid = [{}] if model_type == "linear" else parse_grid(config.grid)
+        for i, spec_text in enumerate(specs):
+            for params in grid:
+                name = model_type + "".join(f",{k}={v}" for k, v in params.items())
+                if len(specs) > 1:
+                    name += f"/spec{i}"
+                out.append(Candidate(name, model_type, spec_text, tuple(sorted(params.items()))))
+    return out
+
+
+def fold_cutoffs(daily: pl.DataFrame, n_folds: int, horizon: int, step: int) -> list[date]:
+    # Rolling origins shared by all stores: fold k trains on dates <= cutoff_k and is
+    # scored on the following `horizon` days; the last fold ends on the last date
+    if daily.height == 0:
+        return []
+    first, last = daily.get_column("date").min(), daily.get_column("date").max()
+    cutoffs = [last - timedelta(days=horizon + k * step) for k in range(n_folds)]
+    return sorted(c for c in cutoffs if c > first)
+
+
+def error_metrics(scored: pl.DataFrame, by: list[str]) -> pl.DataFrame:
+    err = (pl.col("rev_fcst") - pl.col(TARGET_COL)).abs()
+    actual = pl.col(TARGET_COL).abs()
+    return (
+        scored.group_by(by)
+        .agg([
+            pl.len().alias("n"),
+            err.mean().alias("mae"),
+            # MAPE skips zero-revenue days; WAPE (sum |error| / sum |actual|) does not need to
+            (err / actual).filter(actual > 0).mean().alias("mape"),
+            (err.sum() / actual.sum()).alias("wape"),
+        ])
+        .sort(by)
+    )
+
+
+def _evaluate(
+    cand: Candidate,
+    spec: FeatureSpec,
+    fold: int,
+    cutoff: date,
+    daily: pl.DataFrame,
+    sup: pl.DataFrame,
+    horizon: int,
+    validation_days: int,
+    store_mix: Optional[pl.DataFrame],
+) -> pl.DataFrame:
+    # Fit on the precomputed feature rows up to the cutoff (features only look back, so
+    # rows are valid for every fold), then forecast recursively from the cutoff
+    train = sup.filter(pl.col("date") <= cutoff)
+    if train.height == 0:
+        return pl.DataFrame()
+    X = train.select(spec.names).to_numpy()
+    y = train.get_column(TARGET_COL).to_numpy()
+    fit = time_split(train.get_column("date"), validation_days)
+    model = fit_estimator(cand.model_type, X[fit], y[fit], X[~fit], y[~fit], **dict(cand.params))
+    artifacts = ModelArtifacts(
+        model=model,
+        feature_cols=spec.names,
+        target_col=TARGET_COL,
+        spec=spec,
+        store_mix=store_mix if spec.needs_mix else None,
+    )
+    fcst = forecast(artifacts, daily.filter(pl.col("date") <= cutoff), horizon)
+    return fcst.join(daily.select(["store_id", "date", TARGET_COL]), on=["store_id", "date"], how="inner").select([
+        pl.lit(cand.name).alias("candidate"),
+        pl.lit(fold).alias("fold"),
+        pl.lit(cutoff).alias("cutoff"),
+        pl.col("store_id"),
+        pl.col("date"),
+        pl.col(TARGET_COL),
+        pl.col("rev_fcst"),
+    ])
+
+
+def _run_tasks(
+    daily_ref: tuple[str, int],
+    frame_refs: dict[str, tuple[str, int]],
+    tasks: list[tuple[Candidate, FeatureSpec, int, date]],
+    horizon: int,
+    validation_days: int,
+    store_mix: Optional[pl.DataFrame],
+    threads: Optional[int] = None,
+) -> list[pl.DataFrame]:
+    # Worker: attach to the parent's shared-memory Arrow buffers (daily history plus one
+    # feature frame per spec) and evaluate a batch of (candidate, fold) tasks
+    shms = {key: shared_memory.SharedMemory(name=name) for key, (name, _) in [("", daily_ref), *frame_refs.items()]}
+    sizes = {"": daily_ref[1], **{k: size for k, (_, size) in frame_refs.items()}}
+    try:
+        tables = {
+            key: pl.from_arrow(pa.ipc.open_file(pa.py_buffer(shm.buf)[: sizes[key]]).read_all())
+            for key, shm in shms.items()
+        }
+        out = []
+        with threadpool_limits(limits=threads):
+            for cand, spec, fold, cutoff in tasks:
+                out.append(_evaluate(
+                    cand, spec, fold, cutoff, tables[""], tables["f:" + cand.spec_text],
+                    horizon, validation_days, store_mix,
+                ))
+        del tables
+        return out
+    finally:
+        for shm in shms.values():
+            shm.close()
+
+
+def run_backtest(
+    daily: pl.DataFrame,
+    candidates: Optional[list[Candidate]] = None,
+    n_folds: Optional[int] = None,
+    horizon: Optional[int] = None,
+    step: Optional[int] = None,
+    n_workers: Optional[int] = None,
+    store_mix: Optional[pl.DataFrame] = None,
+) -> BacktestResult:
+    candidates = candidates or candidates_from_config()
+    n_folds = n_folds or backtest_config.n_folds
+    horizon = horizon or backtest_config.horizon_days or modeling.forecast_horizon_days
+    step = step or backtest_config.step_days
+    n_workers = n_workers or backtest_config.workers or os.cpu_count() or 1
+    validation_days = modeling.validation_days
+
+    daily = conform(daily, DAILY).sort(["store_id", "date"])
+    cutoffs = fold_cutoffs(daily, n_folds, horizon, step)
+    # Feature frames are built once per distinct spec and shared by every fold and model
+    specs: dict[str, FeatureSpec] = {}
+    for cand in candidates:
+        if cand.spec_text not in specs:
+            spec = parse_spec(cand.spec_text or modeling.feature_spec)
+            specs[cand.spec_text] = spec if store_mix is not None else spec.without_mix()
+    tasks = [(c, specs[c.spec_text], i, cutoff) for c in candidates for i, cutoff in enumerate(cutoffs)]
+    logger.info("Backtest: %s candidates x %s folds (horizon %s days)", len(candidates), len(cutoffs), horizon)
+
+    buffers = {"": _to_shared_memory(daily.to_arrow())}
+    try:
+        for text, spec in specs.items():
+            buffers["f:" + text] = _to_shared_memory(supervised_frame(daily, spec, store_mix).to_arrow())
+        daily_ref = (buffers[""][0].name, buffers[""][1])
+        frame_refs = {key: (shm.name, size) for key, (shm, size) in buffers.items() if key}
+
+        n_batches = max(1, min(len(tasks), n_workers * 2))
+        batches = [tasks[i::n_batches] for i in range(n_batches)]
+        frames: list[pl.DataFrame] = []
+        if n_workers <= 1 or len(tasks) <= 1:
+            for batch in batches:
+                frames.extend(_run_tasks(daily_ref, frame_refs, batch, horizon, validation_days, store_mix))
+        else:
+            # spawn for the same reason as partitioned training: no fork under live thread pools
+            n_procs = min(n_workers, n_batches)
+            threads = max(1, (os.cpu_count() or 1) // n_procs)
+            ctx = mp.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=n_procs, mp_context=ctx) as pool:
+                futures = [
+                    pool.submit(
+                        _run_tasks, daily_ref, frame_refs, batch, horizon, validation_days, store_mix, threads
+                    )
+                    for batch in batches
+                ]
+                for fut in futures:
+                    frames.extend(fut.result())
+    finally:
+        for shm, _ in buffers.values():
+            shm.close()
+            shm.unlink()
+
+    frames = [f for f in frames if f.height]
+    scored = (
+        pl.concat(frames).sort(["candidate", "fold", "store_id", "date"]) if frames else pl.DataFrame(schema=SCORED_SCHEMA)
+    )
+    result = BacktestResult(
+        scored=scored,
+        folds=error_metrics(scored, ["candidate", "fold", "cutoff"]),
+        stores=error_metrics(scored, ["candidate", "store_id"]),
+        summary=error_metrics(scored, ["candidate"]).sort("wape", nulls_last=True),
+    )
+    for row in result.summary.iter_rows(named=True):
+        logger.info(
+            "Backtest %s: MAE %.4f MAPE %.4f WAPE %.4f over %s points",
+            row["candidate"], row["mae"], row["mape"] or float("nan"), row["wape"], row["n"],
+        )
+    return result
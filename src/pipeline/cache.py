@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import pickle
+import threading
+from typing import Any, Callable, Optional
+
+import polars as pl
+import pyarrow.fs as pafs
+
+from .config import cache as cache_config
+from .filesystems import is_remote, resolve
+from .logging_utils import get_logger
+
+
+logger = get_logger(__name__)
+
+_code_version: Optional[str] = None
+
+
+def code_version() -> str:
+    # Hash of the pipeline sources, so any code change invalidates every cached stage.
+    # Deployments can pin it explicitly with PIPELINE_CODE_VERSION (e.g. a git sha).
+    global _code_version
+    if _code_version is None:
+        pinned = os.getenv("PIPELINE_CODE_VERSION")
+        if pinned:
+            _code_version = pinned
+        else:
+            h = hashlib.sha256()
+            pkg_dir = os.path.dirname(os.path.abspath(__file__))
+            for fname in sorted(os.listdir(pkg_dir)):
+                if fname.endswith(".py"):
+                    h.update(fname.encode())
+                    with open(os.path.join(pkg_dir, fname), "rb") as f:
+                        h.update(f.read())
+            _code_version = h.hexdigest()[:16]
+    return _code_version
+
+
+def fingerprint(uri: str, hash_contents: bool | None = None) -> str:
+    # Cheap size/mtime fingerprint by default; content hashing is opt-in for local files
+    hash_contents = cache_config.hash_contents if hash_contents is None else hash_contents
+    if hash_contents and not is_remote(uri) and os.path.isfile(uri):
+        h = hashlib.sha256()
+        with open(uri, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return f"sha256:{h.hexdigest()}"
+    fs, path = resolve(uri)
+    info = fs.get_file_info(path)
+    if info.type == pafs.FileType.Directory:
+        # Datasets / shard directories: fingerprint every file under them
+        entries = fs.get_file_info(pafs.FileSelector(path, recursive=True))
+        parts = sorted(f"{e.path}:{e.size}:{e.mtime_ns}" for e in entries if e.type == pafs.FileType.File)
+        return "dir:" + hashlib.sha256("\n".join(parts).encode()).hexdigest()
+    if info.type == pafs.FileType.NotFound:
+        raise FileNotFoundError(uri)
+    return f"{uri}:{info.size}:{info.mtime_ns}"
+
+
+class StageCache:
+    # Content-addressed store of stage outputs: the key of a stage hashes its input
+    # fingerprints or upstream stage keys, its parameters and the code version.
+    # DataFrames are stored as Arrow IPC files, other values (model artifacts) pickled.
+    # Least recently used entries are evicted once the directory exceeds max_bytes.
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None, enabled: bool = True):
+        self.cache_dir = cache_dir or cache_config.cache_dir
+        self.max_bytes = cache_config.max_bytes if max_bytes is None else max_bytes
+        self.enabled = enabled
+        self.events: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    @classmethod
+    def disabled(cls) -> "StageCache":
+        return cls(enabled=False)
+
+    def key(self, stage: str, *parts: Any) -> str:
+        if not self.enabled:
+            return ""
+        payload = json.dumps([stage, code_version(), *parts], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def _path(self, stage: str, key: str, ext: str) -> str:
+        return os.path.join(self.cache_dir, stage, f"{key}.{ext}")
+
+    def get(self, stage: str, key: str) -> Any:
+        if not self.enabled:
+            return None
+        for ext in ("arrow", "pkl"):
+            path = self._path(stage, key, ext)
+            if os.path.exists(path):
+                os.utime(path)  # LRU clock
+                self._record(stage, "hit")
+                if ext == "arrow":
+                    # Memory-mapped: a hit costs no parse or copy. Entries are only ever
+                    # replaced or unlinked, which leaves an existing mapping intact.
+                    return pl.read_ipc(path, memory_map=True)
+                with open(path, "rb") as f:
+                    return pickle.load(f)
+        self._record(stage, "miss")
+        return None
+
+    def put(self, stage: str, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        ext = "arrow" if isinstance(value, pl.DataFrame) else "pkl"
+        path = self._path(stage, key, ext)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        if ext == "arrow":
+            value.write_ipc(tmp, compression="uncompressed")
+        else:
+            with open(tmp, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self.evict()
+
+    def get_or_compute(self, stage: str, key: str, compute: Callable[[], Any]) -> Any:
+        value = self.get(stage, key)
+        if value is None:
+            value = compute()
+            self.put(stage, key, value)
+        return value
+
+    def evict(self) -> None:
+        # Stages put concurrently (dag.DAG): one eviction pass at a time, and files that
+        # another thread is still writing (.tmp-) or already removed are skipped
+        with self._evict_lock:
+            entries = []
+            for dirpath, _, files in os.walk(self.cache_dir):
+                for fname in files:
+                    path = os.path.join(dirpath, fname)
+                    try:
+                        st = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    if ".tmp-" not in fname:
+                        entries.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                logger.info("Evicted cached stage output %s", path)
+
+    def _record(self, stage: str, event: str) -> None:
+        with self._lock:
+            self.events[stage] = event
+        logger.info("Stage cache %s: %s", event, stage)
+
+    def report(self) -> dict[str, str]:
+        return dict(self.events)
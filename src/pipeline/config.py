@@ -19,17 +19,213 @@ class GCPConfig:
     bucket_processed: Optional[str] = os.getenv("GCS_BUCKET_PROCESSED")
     region: str = os.getenv("GCP_REGION", "us-central1")
     dataproc_cluster: Optional[str] = os.getenv("DATAPROC_CLUSTER")
+    # gs:// URIs of the job's main file (scripts/run_dataproc_job.py) and of a zip of src/
+    # it imports the pipeline from, for trigger submissions
+    dataproc_main_uri: Optional[str] = os.getenv("DATAPROC_MAIN_URI")
+    dataproc_python_files: tuple[str, ...] = tuple(
+        u.strip() for u in os.getenv("DATAPROC_PYTHON_FILES", "").split(",") if u.strip()
+    )
+
+
+@dataclass(frozen=True)
+class Transfer:
+    max_workers: int = int(os.getenv("GCS_TRANSFER_WORKERS", "8"))
+    # Blobs at least this large are fetched as concurrent byte-range slices
+    sliced_threshold_bytes: int = int(os.getenv("GCS_SLICED_THRESHOLD_MB", "64")) * 1024 * 1024
+    slice_bytes: int = int(os.getenv("GCS_SLICE_MB", "32")) * 1024 * 1024
+    # Files at least this large are uploaded through a resumable session in chunks
+    # (chunk size must be a multiple of 256 KiB)
+    resumable_threshold_bytes: int = int(os.getenv("GCS_RESUMABLE_THRESHOLD_MB", "16")) * 1024 * 1024
+    upload_chunk_bytes: int = int(os.getenv("GCS_UPLOAD_CHUNK_MB", "16")) * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Ingestion:
+    # Inputs may be a file, a directory/prefix of shards, a glob or a JSON manifest;
+    # shards are read concurrently by this many threads
+    read_workers: int = int(os.getenv("INGEST_WORKERS", "8"))
+    # Convert raw CSV (incl. .csv.gz) shards to Parquet here on first read; later runs
+    # read the Parquet copy. Empty = off.
+    parquet_cache_dir: str = os.getenv("INGEST_PARQUET_CACHE", "")
+    # Remote Arrow IPC inputs are downloaded here, mapped and removed; empty = system temp dir
+    stage_dir: str = os.getenv("INGEST_STAGE_DIR", "")
 
 
 @dataclass(frozen=True)
 class Modeling:
     forecast_horizon_days: int = int(os.getenv("FORECAST_HORIZON_DAYS", "14"))
     validation_days: int = int(os.getenv("VALIDATION_DAYS", "28"))
-    model_type: str = os.getenv("MODEL_TYPE", "linear")  # linear | xgboost
+    model_type: str = os.getenv("MODEL_TYPE", "linear")  # linear | hist_gb | xgboost
+    model_threads: int = int(os.getenv("MODEL_THREADS", "0"))  # 0 = all cores
+    gb_max_iter: int = int(os.getenv("GB_MAX_ITER", "500"))
+    gb_learning_rate: float = float(os.getenv("GB_LEARNING_RATE", "0.05"))
+    early_stopping_rounds: int = int(os.getenv("EARLY_STOPPING_ROUNDS", "30"))
+    # Declarative feature spec (see feature_specs.parse_spec); empty = the baseline lags
+    feature_spec: str = os.getenv("FEATURE_SPEC", "")
+    # global | store | cluster: one model overall, per store, or per cluster of similar stores
+    granularity: str = os.getenv("MODEL_GRANULARITY", "global")
+    n_clusters: int = int(os.getenv("MODEL_CLUSTERS", "8"))
+    train_workers: int = int(os.getenv("TRAIN_WORKERS", "0"))  # 0 = os.cpu_count()
+    # Stores (or clusters) with fewer supervised rows use the global model
+    min_store_rows: int = int(os.getenv("MIN_STORE_ROWS", "30"))
+    # Save trained artifacts under MODELS_DIR; warm-start from the latest compatible one
+    persist: bool = os.getenv("MODEL_PERSIST", "0") == "1"
+    warm_start: bool = os.getenv("MODEL_WARM_START", "0") == "1"
+    refit_iter: int = int(os.getenv("MODEL_REFIT_ITER", "50"))  # trees per boosted refit
+    refit_decay: float = float(os.getenv("MODEL_REFIT_DECAY", "1.0"))  # weight kept by old rows
+    # Gap-fill each store's daily series (forward-fill over its own date span) before training
+    fill_gaps: bool = os.getenv("FILL_MISSING_DAYS", "0") == "1"
+
+
+def _csv_env(name: str, default: str) -> tuple[str, ...]:
+    return tuple(c.strip() for c in os.getenv(name, default).split(",") if c.strip())
+
+
+@dataclass(frozen=True)
+class Backtest:
+    # Rolling-origin backtest of candidate models/feature sets before training
+    enabled: bool = os.getenv("BACKTEST", "0") == "1"
+    n_folds: int = int(os.getenv("BACKTEST_FOLDS", "4"))
+    horizon_days: int = int(os.getenv("BACKTEST_HORIZON_DAYS", "0"))  # 0 = FORECAST_HORIZON_DAYS
+    step_days: int = int(os.getenv("BACKTEST_STEP_DAYS", "7"))
+    # Candidate grid: model types x feature specs ('|'-separated; empty = FEATURE_SPEC) x
+    # boosted hyperparameters ("learning_rate=0.05,0.1;max_leaf_nodes=15,31")
+    models: tuple[str, ...] = _csv_env("BACKTEST_MODELS", "linear")
+    specs: tuple[str, ...] = tuple(s.strip() for s in os.getenv("BACKTEST_SPECS", "").split("|"))
+    grid: str = os.getenv("BACKTEST_GRID", "")
+    workers: int = int(os.getenv("BACKTEST_WORKERS", "0"))  # 0 = os.cpu_count()
+
+
+@dataclass(frozen=True)
+class OutOfCore:
+    # customer_features via customer_id hash buckets spilled to disk, written straight
+    # into a customer_features/ dataset partitioned by bucket
+    enabled: bool = os.getenv("CUSTOMER_FEATURES_OUT_OF_CORE", "0") == "1"
+    memory_budget_mb: int = int(os.getenv("CUSTOMER_MEMORY_BUDGET_MB", "1024"))
+    n_buckets: int = int(os.getenv("CUSTOMER_BUCKETS", "0"))  # minimum; 0 = sized from the budget
+    workers: int = int(os.getenv("CUSTOMER_BUCKET_WORKERS", "0"))  # 0 = os.cpu_count()
+    spill_dir: str = os.getenv("CUSTOMER_SPILL_DIR", "")  # empty = system temp dir
+    spill_row_group_size: int = int(os.getenv("CUSTOMER_SPILL_ROW_GROUP", "65536"))
+
+
+@dataclass(frozen=True)
+class Validation:
+    # Per-rule violation counts, quarantined rows and column sketches for the raw inputs
+    enabled: bool = os.getenv("DATA_VALIDATION", "0") == "1"
+    quarantine_dir: str = os.getenv("QUARANTINE_DIR", "")  # empty = <output_dir>/quarantine
+    hll_precision: int = int(os.getenv("VALIDATION_HLL_PRECISION", "14"))  # 2**p one-byte registers
+    quantile_accuracy: float = float(os.getenv("VALIDATION_QUANTILE_ACCURACY", "0.01"))  # relative error
+
+
+@dataclass(frozen=True)
+class Hierarchy:
+    # Store x product forecasts reconciled with the store and chain levels
+    enabled: bool = os.getenv("HIERARCHICAL_FORECAST", "0") == "1"
+    # Smoothing of the per-series level (an EWMA over days, days without sales count as 0)
+    alpha: float = float(os.getenv("HIERARCHY_ALPHA", "0.1"))
+    # Series with a sale in this many trailing days are forecast; older ones are inactive
+    active_days: int = int(os.getenv("HIERARCHY_ACTIVE_DAYS", "56"))
+    reconcile: str = os.getenv("HIERARCHY_RECONCILE", "wls")  # wls | ols | bottom_up
+
+
+@dataclass(frozen=True)
+class Output:
+    # Write processed datasets as hive-partitioned Parquet directories with a commit manifest
+    partitioned: bool = os.getenv("OUTPUT_PARTITIONED", "0") == "1"
+    partition_daily: tuple[str, ...] = _csv_env("PARTITION_DAILY", "date")
+    partition_customers: tuple[str, ...] = _csv_env("PARTITION_CUSTOMERS", "")
+    partition_forecast: tuple[str, ...] = _csv_env("PARTITION_FORECAST", "date")
+    row_group_size: int = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "131072"))
+    compression: str = os.getenv("PARQUET_COMPRESSION", "zstd")
+    statistics: bool = os.getenv("PARQUET_STATISTICS", "1") == "1"
+    # Uncompressed Arrow IPC copy (<name>.arrow) of each local output, memory-mapped on read
+    ipc: bool = os.getenv("OUTPUT_IPC", "1") == "1"
+    # Outputs also written as CSV during the run; others are exported on demand (export_csv)
+    csv: tuple[str, ...] = _csv_env("OUTPUT_CSV", "forecast")
+
+
+@dataclass(frozen=True)
+class Execution:
+    # Stream sales once (lazy scan, streaming engine) to a spill and fold it batch by batch
+    # into every feature, instead of reading whole inputs into memory
+    lazy: bool = os.getenv("PIPELINE_LAZY", "0") == "1"
+    explain_plan: bool = os.getenv("PIPELINE_EXPLAIN", "0") == "1"
+    batch_rows: int = int(os.getenv("PIPELINE_BATCH_ROWS", "1000000"))  # rows per folded batch
+    # Merge only new raw sales partitions into persisted aggregate state
+    incremental: bool = os.getenv("PIPELINE_INCREMENTAL", "0") == "1"
+    # Copy raw inputs to a temp dir before reading instead of reading gs:// URIs directly
+    stage_locally: bool = os.getenv("GCS_STAGE_LOCAL", "0") == "1"
+    # Forecast published daily_store_sales with the latest saved model, without training
+    forecast_only: bool = os.getenv("PIPELINE_FORECAST_ONLY", "0") == "1"
+
+
+@dataclass(frozen=True)
+class Scheduler:
+    # Stage DAG executor: independent stages and output writes run concurrently
+    workers: int = int(os.getenv("DAG_WORKERS", "8"))
+    retries: int = int(os.getenv("STAGE_RETRIES", "0"))  # per failed stage, upstream outputs are reused
+    retry_backoff_seconds: float = float(os.getenv("STAGE_RETRY_BACKOFF_SECONDS", "1"))
+
+
+@dataclass(frozen=True)
+class Cache:
+    # Content-addressed stage cache for run_local_pipeline
+    enabled: bool = os.getenv("STAGE_CACHE", "0") == "1"
+    cache_dir: str = os.getenv("STAGE_CACHE_DIR", os.path.join(Paths.project_root, ".stage_cache"))
+    max_bytes: int = int(os.getenv("STAGE_CACHE_MAX_MB", "2048")) * 1024 * 1024
+    # Hash file contents instead of size/mtime when fingerprinting local inputs
+    hash_contents: bool = os.getenv("STAGE_CACHE_HASH", "0") == "1"
+
+
+@dataclass(frozen=True)
+class Metrics:
+    # Per-stage run report written next to the outputs
+    run_report: bool = os.getenv("RUN_REPORT", "1") == "1"
+    openmetrics: bool = os.getenv("RUN_REPORT_OPENMETRICS", "0") == "1"
+    rss_sample_seconds: float = float(os.getenv("RSS_SAMPLE_SECONDS", "0.05"))
+    # Name of a single stage to run under cProfile (e.g. train_baseline)
+    profile_stage: Optional[str] = os.getenv("PROFILE_STAGE")
+    profile_dir: str = os.getenv("PROFILE_DIR", Paths.reports_dir)
+
+
+@dataclass(frozen=True)
+class Service:
+    # Forecast query service: published forecast (file, dataset dir or gs:// URI)
+    # Empty = the published forecast under DATA_PROCESSED_DIR (its .arrow copy when present)
+    source: str = os.getenv("FORECAST_SOURCE", "")
+    host: str = os.getenv("FORECAST_SERVICE_HOST", "0.0.0.0")
+    port: int = int(os.getenv("FORECAST_SERVICE_PORT", "8080"))
+    reload_seconds: float = float(os.getenv("FORECAST_RELOAD_SECONDS", "5"))
+
+
+@dataclass(frozen=True)
+class Runs:
+    # Run tracking for the HTTP trigger. Bounds apply to both modes; the SQLite file (or
+    # sqlite:/// URL) only holds local runs, Dataproc jobs are tracked by Dataproc
+    store: str = os.getenv("RUN_STORE", os.path.join(Paths.project_root, ".runs", "runs.sqlite"))
+    max_concurrent: int = int(os.getenv("RUN_MAX_CONCURRENT", "2"))
+    # Further submissions wait in the queue up to this many, then are refused
+    max_queued: int = int(os.getenv("RUN_MAX_QUEUED", "16"))
+    # Queued/running runs not updated for this long are presumed lost (crashed instance)
+    stale_seconds: float = float(os.getenv("RUN_STALE_SECONDS", "21600"))
+    # Dataproc job ids are derived from the run key and this time bucket, so identical
+    # submissions within it map to the same job on every instance
+    dedup_window_seconds: int = int(os.getenv("RUN_DEDUP_WINDOW_SECONDS", "3600"))
 
 
 paths = Paths()
 gcp = GCPConfig()
+transfer = Transfer()
+ingestion = Ingestion()
 modeling = Modeling()
-
-
+backtest = Backtest()
+outofcore = OutOfCore()
+validation = Validation()
+hierarchy = Hierarchy()
+output = Output()
+cache = Cache()
+metrics = Metrics()
+execution = Execution()
+scheduler = Scheduler()
+service = Service()
+runs = Runs()
@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import polars as pl
+
+from .config import scheduler
+from .logging_utils import get_logger
+from .profiling import RunReport
+
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Stage:
+    name: str
+    fn: Callable[..., Any]  # called with the values named by `inputs`, in order
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()  # fn returns one value per output (a tuple when several)
+    after: tuple[str, ...] = ()  # ordering-only dependencies, by stage name
+    # Uses every core itself (process pools): never runs alongside another exclusive stage,
+    # while non-exclusive (I/O-bound) stages may still overlap it
+    exclusive: bool = False
+    retries: Optional[int] = None  # None = scheduler.retries
+
+
+class DAG:
+    # Stages declare the values they read and produce; each stage runs on a thread pool
+    # as soon as its inputs exist, so independent stages and output writes overlap with
+    # each other and with training. Values already present (seeded from the stage cache,
+    # or produced by an earlier run() of this DAG) skip the stages producing them, and
+    # upstream stages nothing needs any more are pruned. A failed stage is retried on
+    # its own with the same inputs; after a final failure, calling run() again resumes
+    # from the failed stage instead of redoing its upstream.
+    def __init__(
+        self,
+        report: Optional[RunReport] = None,
+        workers: Optional[int] = None,
+        retries: Optional[int] = None,
+    ):
+        self.report = report or RunReport()
+        self.workers = workers or scheduler.workers
+        self.retries = scheduler.retries if retries is None else retries
+        self.stages: dict[str, Stage] = {}
+        self.values: dict[str, Any] = {}
+        self.done: set[str] = set()
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        inputs: tuple[str, ...] = (),
+        outputs: tuple[str, ...] = (),
+        after: tuple[str, ...] = (),
+        exclusive: bool = False,
+        retries: Optional[int] = None,
+    ) -> Stage:
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        stage = Stage(name, fn, tuple(inputs), tuple(outputs), tuple(after), exclusive, retries)
+        self.stages[name] = stage
+        return stage
+
+    def _producers(self) -> dict[str, str]:
+        producers = {}
+        for stage in self.stages.values():
+            for out in stage.outputs:
+                if out in producers:
+                    raise ValueError(f"Value {out} is produced by both {producers[out]} and {stage.name}")
+                producers[out] = stage.name
+        return producers
+
+    def _order(self, producers: dict[str, str]) -> list[str]:
+        deps = {
+            s.name: {producers[i] for i in s.inputs if i in producers} | set(s.after) for s in self.stages.values()
+        }
+        order, seen, visiting = [], set(), set()
+
+        def visit(name: str) -> None:
+            if name in seen:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            if name not in self.stages:
+                raise ValueError(f"Unknown stage: {name}")
+            visiting.add(name)
+            for dep in sorted(deps[name]):
+                visit(dep)
+            visiting.discard(name)
+            seen.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def _needed(self, order: list[str], producers: dict[str, str]) -> set[str]:
+        # Walk from the sinks: a stage runs if it is not done, its outputs are missing
+        # and it is a sink or something that runs reads (or waits on) it
+        needed: set[str] = set()
+        for name in reversed(order):
+            stage = self.stages[name]
+            if name in self.done or (stage.outputs and all(o in self.values for o in stage.outputs)):
+                continue
+            waits = [
+                s for s in self.stages.values()
+                if name in s.after or any(producers.get(i) == name and i not in self.values for i in s.inputs)
+            ]
+            is_sink = not any(name in s.after or name in map(producers.get, s.inputs) for s in self.stages.values())
+            if is_sink or any(s.name in needed for s in waits):
+                needed.add(name)
+        for name in needed:
+            missing = [i for i in self.stages[name].inputs if i not in self.values and i not in producers]
+            if missing:
+                raise ValueError(f"Stage {name} reads values nothing produces: {missing}")
+        return needed
+
+    def _execute(self, stage: Stage, attempt: int) -> dict[str, Any]:
+        if attempt:
+            time.sleep(scheduler.retry_backoff_seconds * 2 ** (attempt - 1))
+        # Each stage gets its own shallow clone of a frame (buffers are shared): polars
+        # writers borrow the frame mutably, so one frame object can't be used by two
+        # stages at once
+        args = [v.clone() if isinstance(v, pl.DataFrame) else v for v in (self.values[i] for i in stage.inputs)]
+        frames = [a for a in args if isinstance(a, pl.DataFrame)]
+        with self.report.stage(stage.name, rows_in=sum(f.height for f in frames) if frames else None) as m:
+            result = stage.fn(*args)
+            if len(stage.outputs) == 1:
+                result = (result,)
+            values = dict(zip(stage.outputs, result)) if stage.outputs else {}
+            out_frames = [v for v in values.values() if isinstance(v, pl.DataFrame)]
+            if out_frames and m.rows_out is None:
+                m.rows_out = sum(f.height for f in out_frames)
+        return values
+
+    def run(self, values: Optional[dict[str, Any]] = None) -> dict[str, Any]:
+        self.values.update(values or {})
+        producers = self._producers()
+        order = self._order(producers)
+        pending = self._needed(order, producers)
+        needed = set(pending)
+        running: dict[Future, str] = {}
+        attempts: dict[str, int] = {}
+        failure: Optional[BaseException] = None
+
+        def ready(stage: Stage) -> bool:
+            return all(i in self.values for i in stage.inputs) and all(
+                a in self.done or a not in needed for a in stage.after
+            )
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stage") as pool:
+            while pending or running:
+                if failure is None:
+                    for name in order:
+                        stage = self.stages[name]
+                        if name not in pending or not ready(stage):
+                            continue
+                        if stage.exclusive and any(self.stages[r].exclusive for r in running.values()):
+                            continue
+                        pending.discard(name)
+                        running[pool.submit(self._execute, stage, attempts.get(name, 0))] = name
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        self.values.update(future.result())
+                    except Exception as exc:
+                        attempts[name] = attempts.get(name, 0) + 1
+                        limit = self.stages[name].retries
+                        limit = self.retries if limit is None else limit
+                        if failure is None and attempts[name] <= limit:
+                            logger.warning("Stage %s failed (%s); retry %s of %s", name, exc, attempts[name], limit)
+                            pending.add(name)
+                        elif failure is None:
+                            # Let running stages finish, start nothing new
+                            failure = exc
+                    else:
+                        self.done.add(name)
+        if failure is not None:
+            raise failure
+        if pending:
+            raise RuntimeError(f"Stages never became ready: {sorted(pending)}")
+        return self.values
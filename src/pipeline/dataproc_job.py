@@ -1,44 +1,173 @@
 from __future__ import annotations
 
+import argparse
 import os
 import tempfile
+from typing import Optional
 
-from .config import gcp, paths
-from .gcp_utils import gcs_download, gcs_upload
+from .config import backtest, execution, gcp, hierarchy, output, paths, validation
+from .config import metrics as metrics_config
+from .dag import DAG
+from .datasets import MANIFEST
+from .filesystems import makedirs
+from .gcp_utils import gcs_download_if_exists, gcs_download_many, gcs_list, gcs_upload_many
+from .incremental import STATE_FILES, load_state, new_partitions
 from .logging_utils import configure_logging, get_logger
-from .orchestrate import run_local_pipeline
+from .orchestrate import pipeline_dag, run_forecast_only, run_incremental_pipeline, run_local_pipeline
+from .profiling import RunReport
 
 
 logger = get_logger(__name__)
 
+OUTPUT_DATASETS = ["daily_store_sales", "customer_features", "forecast"]
+OUTPUT_FILES = [f"{name}.parquet" for name in OUTPUT_DATASETS]
+BACKTEST_DATASETS = ["backtest_folds", "backtest_stores"]
+HIERARCHY_DATASETS = ["forecast_store_product", "forecast_hierarchy"]
+QUARANTINE = "quarantine"
+# Stages other than write_<name> that write an output
+EXTRA_WRITERS = {"customer_features": ("customer_features_out_of_core",)}
 
-def main():
+
+def main(
+    sales_blob: Optional[str] = None,
+    customers_blob: Optional[str] = None,
+    report: Optional[RunReport] = None,
+) -> None:
     configure_logging()
-    # Expect GCS paths via env
-    sales_blob = os.getenv("GCS_SALES_BLOB", "raw/sales.csv")
-    customers_blob = os.getenv("GCS_CUSTOMERS_BLOB", "raw/customers.csv")
+    # Expect GCS paths via env unless given (trigger runs pass them per request)
+    sales_blob = sales_blob or os.getenv("GCS_SALES_BLOB", "raw/sales.csv")
+    customers_blob = customers_blob or os.getenv("GCS_CUSTOMERS_BLOB", "raw/customers.csv")
 
     if not gcp.bucket_raw or not gcp.bucket_processed:
         raise RuntimeError("GCS buckets not configured")
 
+    report = report or RunReport()
+    try:
+        if execution.forecast_only:
+            # Score the published daily_store_sales with the latest model under MODELS_DIR
+            daily = "daily_store_sales" if output.partitioned else "daily_store_sales.parquet"
+            run_forecast_only(
+                f"gs://{gcp.bucket_processed}/processed/{daily}",
+                f"gs://{gcp.bucket_processed}/processed",
+                report=report,
+            )
+        elif execution.incremental:
+            main_incremental(customers_blob, report)
+        elif not execution.stage_locally:
+            # Read inputs and write outputs directly against the buckets
+            run_local_pipeline(
+                f"gs://{gcp.bucket_raw}/{sales_blob}",
+                f"gs://{gcp.bucket_raw}/{customers_blob}",
+                f"gs://{gcp.bucket_processed}/processed",
+                report=report,
+            )
+        else:
+            main_staged(sales_blob, customers_blob, report)
+    finally:
+        # Emitted for failed runs too; failed stages carry status "failed"
+        if metrics_config.run_report:
+            report.write(f"gs://{gcp.bucket_processed}/processed")
+
+
+def main_staged(sales_blob: str, customers_blob: str, report: RunReport) -> None:
     with tempfile.TemporaryDirectory() as tmp:
         local_sales = os.path.join(tmp, "sales.csv")
         local_customers = os.path.join(tmp, "customers.csv")
         out_dir = os.path.join(tmp, "processed")
+        makedirs(out_dir)
 
-        gcs_download(gcp.bucket_raw, sales_blob, local_sales)
-        gcs_download(gcp.bucket_raw, customers_blob, local_customers)
+        with report.stage("download_inputs"):
+            gcs_download_many(gcp.bucket_raw, [(sales_blob, local_sales), (customers_blob, local_customers)])
 
-        run_local_pipeline(local_sales, local_customers, out_dir)
+        # The local pipeline's DAG plus one upload per output, started as soon as that
+        # output is written, so uploads overlap with training and forecasting
+        dag = pipeline_dag(local_sales, local_customers, out_dir, report=report)
+        add_upload_stages(dag, out_dir)
+        dag.run()
 
-        # Upload outputs
-        for fname in ["daily_store_sales.parquet", "customer_features.parquet", "forecast.parquet"]:
-            src = os.path.join(out_dir, fname)
-            dst = f"processed/{fname}"
-            gcs_upload(gcp.bucket_processed, src, dst)
 
+def add_upload_stages(dag: DAG, out_dir: str) -> None:
+    for name in _output_names():
+        writers = tuple(s for s in (f"write_{name}", *EXTRA_WRITERS.get(name, ())) if s in dag.stages)
+        dag.add(f"upload_{name}", lambda name=name: _upload(out_dir, [name]), after=writers)
+    if validation.enabled:
+        writers = tuple(s for s in ("clean_sales", "clean_customers", "features_lazy") if s in dag.stages)
+        dag.add(f"upload_{QUARANTINE}", lambda: _upload(out_dir, [QUARANTINE]), after=writers)
+
+
+def _upload(out_dir: str, names: list[str]) -> None:
+    # Dataset manifests go last so they only ever name uploaded files
+    data, manifests = _output_pairs(out_dir, names)
+    gcs_upload_many(gcp.bucket_processed, data)
+    gcs_upload_many(gcp.bucket_processed, manifests)
+
+
+def _output_names() -> list[str]:
+    return (
+        OUTPUT_DATASETS
+        + (BACKTEST_DATASETS if backtest.enabled else [])
+        + (HIERARCHY_DATASETS if hierarchy.enabled else [])
+    )
 
-if __name__ == "__main__":
-    main()
 
+def _output_pairs(out_dir: str, names: list[str] | None = None) -> tuple[list[tuple[str, str]], list[tuple[str, str]]]:
+    data, manifests = [], []
+    for name in _output_names() if names is None else names:
+        root = os.path.join(out_dir, name)
+        if not os.path.isdir(root):
+            if name == QUARANTINE:
+                continue
+            # Single-file output (customer_features is a dataset whenever it is built out of core)
+            data.append((os.path.join(out_dir, f"{name}.parquet"), f"processed/{name}.parquet"))
+            continue
+        for dirpath, _, files in os.walk(root):
+            for fname in files:
+                local = os.path.join(dirpath, fname)
+                blob = "processed/" + os.path.relpath(local, out_dir).replace(os.sep, "/")
+                (manifests if fname == MANIFEST else data).append((local, blob))
+    return data, manifests
 
+
+def main_incremental(customers_blob: str, report: RunReport) -> None:
+    # Raw sales arrive as many partition files under a prefix; only the ones missing
+    # from the state manifest are read and merged. The (small) state files are staged
+    # locally, raw inputs and outputs are read and written in place.
+    sales_prefix = os.getenv("GCS_SALES_PREFIX", "raw/sales/")
+    state_prefix = os.getenv("GCS_STATE_PREFIX", "processed/state/")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_dir = os.path.join(tmp, "state")
+        with report.stage("download_state"):
+            for fname in STATE_FILES:
+                gcs_download_if_exists(gcp.bucket_processed, state_prefix + fname, os.path.join(state_dir, fname))
+            available = gcs_list(gcp.bucket_raw, sales_prefix)
+            todo = new_partitions(load_state(state_dir), available)
+        parts = {blob: f"gs://{gcp.bucket_raw}/{blob}" for blob in todo}
+        run_incremental_pipeline(
+            parts,
+            f"gs://{gcp.bucket_raw}/{customers_blob}",
+            f"gs://{gcp.bucket_processed}/processed",
+            state_dir=state_dir,
+            fingerprints=todo,
+            report=report,
+        )
+        # State last, so a failed run leaves the previous state in place
+        with report.stage("upload_state"):
+            gcs_upload_many(
+                gcp.bucket_processed,
+                [(os.path.join(state_dir, fname), state_prefix + fname) for fname in STATE_FILES],
+            )
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    # Job arguments set by trigger submissions; both default to the env blobs
+    parser = argparse.ArgumentParser(description="Run the pipeline against the GCS buckets")
+    parser.add_argument("--sales-blob")
+    parser.add_argument("--customers-blob")
+    parser.add_argument("--run-id", help="run id of the submitting trigger, used for the run report")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(args.sales_blob, args.customers_blob, RunReport(run_id=args.run_id) if args.run_id else None)
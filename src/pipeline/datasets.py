@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+import uuid
+from typing import Optional
+from urllib.parse import quote
+
+import polars as pl
+import pyarrow as pa
+import pyarrow.dataset as pads
+import pyarrow.fs as pafs
+
+from .config import output
+from .filesystems import ensure_parent, resolve
+from .logging_utils import get_logger
+
+
+logger = get_logger(__name__)
+
+MANIFEST = "_manifest.json"
+STAGING = "_staging"
+
+
+def parquet_options() -> dict:
+    return {
+        "compression": output.compression,
+        "row_group_size": output.row_group_size,
+        "statistics": output.statistics,
+    }
+
+
+def load_manifest(root: str) -> Optional[dict]:
+    fs, base = resolve(root)
+    path = f"{base}/{MANIFEST}"
+    if fs.get_file_info(path).type == pafs.FileType.NotFound:
+        return None
+    with fs.open_input_stream(path) as f:
+        return json.loads(f.read())
+
+
+def is_dataset(root: str) -> bool:
+    return load_manifest(root) is not None
+
+
+def _parse_type(text: str) -> pa.DataType:
+    # Manifest schemas store str(arrow type); dictionary-encoded (Categorical) columns
+    # have no alias and are rebuilt from their index/value types
+    match = re.fullmatch(r"dictionary<values=(\w+), indices=(\w+), ordered=([01])>", text)
+    if match:
+        values, indices, ordered = match.groups()
+        return pa.dictionary(pa.type_for_alias(indices), pa.type_for_alias(values), ordered == "1")
+    return pa.type_for_alias(text)
+
+
+def _partition_dir(keys: list[str], values: tuple) -> str:
+    return "/".join(f"{k}={quote(str(v), safe='')}" for k, v in zip(keys, values))
+
+
+class DatasetWriter:
+    # Hive-partitioned Parquet dataset committed through a manifest:
+    #  1. every partition file is written under <root>/_staging/<run_id>/
+    #  2. on commit, staged files are moved to <root>/<k=v>/part-<run_id>.parquet
+    #  3. <root>/_manifest.json is replaced; it alone defines the dataset contents
+    # Readers only follow the manifest, so they never see a half-written run.
+    # mode="partitions" replaces just the partitions written by this run and keeps the
+    # rest. write() is thread-safe, so partitions can be produced concurrently.
+    def __init__(self, root: str, partition_by: list[str] | tuple[str, ...] = (), mode: str = "overwrite"):
+        if mode not in ("overwrite", "partitions"):
+            raise ValueError(f"Unsupported write mode: {mode}")
+        self.root = root
+        self.partition_by = list(partition_by)
+        self.mode = mode
+        self.fs, self.base = resolve(root)
+        self.run_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.staging = f"{self.base}/{STAGING}/{self.run_id}"
+        self.opts = parquet_options()
+        self.files: list[dict] = []
+        self._lock = threading.Lock()
+
+    def write(self, part: pl.DataFrame, values: tuple = ()) -> None:
+        rel_dir = _partition_dir(self.partition_by, values)
+        rel = f"{rel_dir}/part-{self.run_id}.parquet" if rel_dir else f"part-{self.run_id}.parquet"
+        staged = f"{self.staging}/{rel}"
+        ensure_parent(self.fs, staged)
+        with self.fs.open_output_stream(staged) as f:
+            part.drop(self.partition_by, strict=False).write_parquet(f, **self.opts)
+        with self._lock:
+            self.files.append({
+                "path": rel,
+                "partition": {k: str(v) for k, v in zip(self.partition_by, values)},
+                "rows": part.height,
+            })
+
+    def commit(self, schema: pa.Schema) -> dict:
+        # schema: the full dataset schema, partition columns included
+        fs, base, partition_by = self.fs, self.base, self.partition_by
+        files = sorted(self.files, key=lambda f: f["path"])
+        previous = load_manifest(self.root)
+        kept = []
+        if previous is not None and self.mode == "partitions":
+            if previous["partition_by"] != partition_by:
+                raise ValueError(f"Partition columns {partition_by} do not match dataset {previous['partition_by']}")
+            replaced = {tuple(f["partition"].get(k) for k in partition_by) for f in files}
+            kept = [f for f in previous["files"] if tuple(f["partition"].get(k) for k in partition_by) not in replaced]
+
+        for entry in files:
+            dst = f"{base}/{entry['path']}"
+            ensure_parent(fs, dst)
+            fs.move(f"{self.staging}/{entry['path']}", dst)
+
+        manifest = {
+            "run_id": self.run_id,
+            "committed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "partition_by": partition_by,
+            "schema": {f.name: str(f.type) for f in schema},
+            "parquet": self.opts,
+            "files": kept + files,
+        }
+        tmp = f"{self.staging}/{MANIFEST}"
+        ensure_parent(fs, tmp)
+        with fs.open_output_stream(tmp) as f:
+            f.write(json.dumps(manifest, indent=2).encode())
+        fs.move(tmp, f"{base}/{MANIFEST}")
+
+        # Superseded files are only removed after the new manifest is committed
+        live = {f["path"] for f in manifest["files"]}
+        for old in (previous or {}).get("files", []):
+            if old["path"] not in live:
+                fs.delete_file(f"{base}/{old['path']}")
+        fs.delete_dir(self.staging)
+        logger.info(
+            "Committed dataset %s: %s files (%s new), %s rows written",
+            self.root, len(manifest["files"]), len(files), sum(f["rows"] for f in files),
+        )
+        return manifest
+
+
+def write_dataset(
+    df: pl.DataFrame,
+    root: str,
+    partition_by: list[str] | tuple[str, ...] = (),
+    mode: str = "overwrite",
+) -> dict:
+    writer = DatasetWriter(root, partition_by, mode)
+    groups = df.partition_by(writer.partition_by, as_dict=True, maintain_order=True) if partition_by else {(): df}
+    for values, part in groups.items():
+        writer.write(part, values)
+    return writer.commit(df.head(0).to_arrow().schema)
+
+
+def scan_dataset(root: str) -> pl.LazyFrame:
+    # Partition filters on the returned frame prune whole files; other predicates and
+    # projections prune row groups and columns inside them
+    manifest = load_manifest(root)
+    if manifest is None:
+        raise FileNotFoundError(f"No dataset manifest under {root}")
+    fs, base = resolve(root)
+    schema = pa.schema([pa.field(k, _parse_type(t)) for k, t in manifest["schema"].items()])
+    # Hive partition values are plain strings in the path; dictionary columns are read
+    # back as their value type
+    partition_schema = pa.schema([
+        pa.field(k, t.value_type if pa.types.is_dictionary(t) else t)
+        for k, t in ((k, schema.field(k).type) for k in manifest["partition_by"])
+    ])
+    schema = pa.schema([partition_schema.field(f.name) if f.name in partition_schema.names else f for f in schema])
+    ds = pads.dataset(
+        [f"{base}/{f['path']}" for f in manifest["files"]],
+        schema=schema,
+        filesystem=fs,
+        format="parquet",
+        partitioning=pads.partitioning(partition_schema, flavor="hive") if manifest["partition_by"] else None,
+        partition_base_dir=base,
+    )
+    return pl.scan_pyarrow_dataset(ds)
+
+
+def read_dataset(root: str) -> pl.DataFrame:
+    return scan_dataset(root).collect()
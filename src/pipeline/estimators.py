@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import sys
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import numpy as np
+from threadpoolctl import threadpool_limits
+
+from .config import modeling
+from .logging_utils import get_logger
+
+if TYPE_CHECKING:
+    from sklearn.linear_model import LinearRegression
+
+
+logger = get_logger(__name__)
+
+# Every backend returns a fitted object with a sklearn-style predict(X); the rest of
+# the pipeline (forecast, partitioned training, the stage cache) only relies on that.
+FitFn = Callable[..., Any]
+
+
+def _threads() -> Optional[int]:
+    return modeling.model_threads or None
+
+
+def fit_linear(
+    X: np.ndarray,
+    y: np.ndarray,
+    X_val: Optional[np.ndarray] = None,
+    y_val: Optional[np.ndarray] = None,
+    **params: Any,
+):
+    # sklearn is imported by the backends that use it, not at module import (cold starts)
+    from sklearn.linear_model import LinearRegression
+
+    model = LinearRegression(**params).fit(X, y)
+    # Normal-equation statistics (with an intercept column) let a later refit add new
+    # rows exactly without the old ones; they are tiny (features + 1 squared)
+    Xa = np.column_stack([X, np.ones(len(X))])
+    model.gram_, model.xty_, model.n_rows_ = Xa.T @ Xa, Xa.T @ y, len(X)
+    return model
+
+
+def linear_from_arrays(
+    coef: np.ndarray,
+    intercept: float,
+    gram: Optional[np.ndarray] = None,
+    xty: Optional[np.ndarray] = None,
+    n_rows: int = 0,
+) -> LinearRegression:
+    # Rebuild a fitted LinearRegression from stored arrays (artifact loads and refits)
+    from sklearn.linear_model import LinearRegression
+
+    model = LinearRegression()
+    model.coef_ = np.asarray(coef, dtype=np.float64)
+    model.intercept_ = float(intercept)
+    model.n_features_in_ = len(model.coef_)
+    if gram is not None and not np.isnan(gram).any():
+        model.gram_, model.xty_, model.n_rows_ = gram, xty, int(n_rows)
+    return model
+
+
+def refit_linear(model: LinearRegression, X: np.ndarray, y: np.ndarray, decay: float = 1.0) -> LinearRegression:
+    # Exact warm start: add the new rows to the stored normal equations (older rows
+    # optionally down-weighted by decay) and re-solve
+    Xa = np.column_stack([X, np.ones(len(X))])
+    gram = decay * model.gram_ + Xa.T @ Xa
+    xty = decay * model.xty_ + Xa.T @ y
+    beta = np.linalg.lstsq(gram, xty, rcond=None)[0]
+    return linear_from_arrays(beta[:-1], beta[-1], gram, xty, model.n_rows_ + len(X))
+
+
+@dataclass
+class ResidualStack:
+    # Warm start for tree ensembles: a prior model plus a correction fitted on the new
+    # rows' residuals (sklearn cannot continue boosting on new data, its bins are refit)
+    base: Any
+    delta: Any
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.base.predict(X) + self.delta.predict(X)
+
+
+def fit_hist_gb(
+    X: np.ndarray,
+    y: np.ndarray,
+    X_val: Optional[np.ndarray] = None,
+    y_val: Optional[np.ndarray] = None,
+    **params: Any,
+):
+    # Histogram gradient boosting (OpenMP multi-threaded). Early stopping uses the
+    # caller's time-ordered holdout rather than sklearn's random validation_fraction:
+    # trees are added in warm-start rounds until holdout MAE stops improving, then the
+    # model is cut back to the best iteration's tree prefix. params override the
+    # configured hyperparameters.
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    from sklearn.utils._openmp_helpers import _openmp_effective_n_threads
+
+    max_iter = params.pop("max_iter", modeling.gb_max_iter)
+    patience = params.pop("early_stopping_rounds", modeling.early_stopping_rounds)
+    params = dict(
+        learning_rate=modeling.gb_learning_rate,
+        max_leaf_nodes=31,
+        early_stopping=False,
+        random_state=0,
+    ) | params
+    with threadpool_limits(limits=_threads(), user_api="openmp"):
+        if X_val is None or len(X_val) == 0:
+            return HistGradientBoostingRegressor(max_iter=max_iter, **params).fit(X, y)
+
+        step = 10
+        model = HistGradientBoostingRegressor(max_iter=step, warm_start=True, **params)
+        best_iter, best_mae, n_iter = 0, np.inf, 0
+        n_threads = _openmp_effective_n_threads(_threads())
+        Xv, raw = None, None
+        while n_iter < max_iter:
+            done = n_iter
+            n_iter = min(n_iter + step, max_iter)
+            model.set_params(max_iter=n_iter)
+            model.fit(X, y)
+            if raw is None:
+                Xv = model._preprocess_X(X_val, reset=False)
+                raw = np.zeros((len(Xv), 1), order="F") + model._baseline_prediction
+            # Running holdout prediction: only this round's trees are added to it, where
+            # staged_predict would walk the whole ensemble again every round
+            for i in range(done, len(model._predictors)):
+                model._predict_iterations(Xv, model._predictors[i:i + 1], raw, is_binned=False, n_threads=n_threads)
+                mae = float(np.mean(np.abs(model._loss.link.inverse(raw.ravel()) - y_val)))
+                if mae < best_mae:
+                    best_iter, best_mae = i + 1, mae
+            if n_iter - best_iter >= patience:
+                break
+        # Keep the best prefix of the fitted ensemble (n_iter_ follows) instead of
+        # training it again
+        del model._predictors[max(best_iter, 1):]
+        model.set_params(max_iter=model.n_iter_, warm_start=False)
+    logger.debug("hist_gb early stopping: best iteration %s, holdout MAE %.4f", best_iter, best_mae)
+    return model
+
+
+def fit_xgboost(
+    X: np.ndarray,
+    y: np.ndarray,
+    X_val: Optional[np.ndarray] = None,
+    y_val: Optional[np.ndarray] = None,
+    **params: Any,
+):
+    try:
+        from xgboost import XGBRegressor  # type: ignore
+    except ImportError as exc:
+        raise ImportError("MODEL_TYPE=xgboost requires the xgboost package (or use MODEL_TYPE=hist_gb)") from exc
+    has_val = X_val is not None and len(X_val) > 0
+    patience = params.pop("early_stopping_rounds", modeling.early_stopping_rounds)
+    model = XGBRegressor(**(dict(
+        tree_method="hist",
+        n_estimators=params.pop("max_iter", modeling.gb_max_iter),
+        learning_rate=modeling.gb_learning_rate,
+        n_jobs=modeling.model_threads or -1,
+        early_stopping_rounds=patience if has_val else None,
+        eval_metric="mae",
+    ) | params))
+    model.fit(X, y, eval_set=[(X_val, y_val)] if has_val else None, verbose=False)
+    return model
+
+
+BACKENDS: dict[str, FitFn] = {
+    "linear": fit_linear,
+    "hist_gb": fit_hist_gb,
+    "xgboost": fit_xgboost,
+}
+
+
+def fit_estimator(
+    model_type: str,
+    X: np.ndarray,
+    y: np.ndarray,
+    X_val: Optional[np.ndarray] = None,
+    y_val: Optional[np.ndarray] = None,
+    **params: Any,
+):
+    # params are backend hyperparameters overriding the configured defaults
+    # (max_iter and early_stopping_rounds are understood by both boosted backends)
+    try:
+        fit = BACKENDS[model_type]
+    except KeyError:
+        raise ValueError(f"Unsupported model type: {model_type} (expected one of {sorted(BACKENDS)})") from None
+    return fit(X, y, X_val, y_val, **params)
+
+
+def linear_coefficients(model: Any) -> Optional[tuple[np.ndarray, float]]:
+    # A LinearRegression can only exist once sklearn.linear_model has been imported
+    linear_model = sys.modules.get("sklearn.linear_model")
+    if linear_model is not None and isinstance(model, linear_model.LinearRegression):
+        return np.asarray(model.coef_, dtype=np.float64).ravel(), float(model.intercept_)
+    return None
+
+
+def batched_predictor(models: list[Any]) -> Callable[[np.ndarray], np.ndarray]:
+    # Predict one row per store, where row i uses models[i]. All-linear registries become a
+    # single einsum over a (stores x features) coefficient matrix; otherwise each distinct
+    # model predicts all of its stores in one call.
+    coefs = [linear_coefficients(m) for m in models]
+    if all(c is not None for c in coefs):
+        coef = np.vstack([c[0] for c in coefs])
+        intercept = np.array([c[1] for c in coefs])
+        return lambda X: np.einsum("sf,sf->s", X, coef) + intercept
+
+    groups: dict[int, tuple[Any, list[int]]] = {}
+    for i, m in enumerate(models):
+        groups.setdefault(id(m), (m, []))[1].append(i)
+    index = [(m, np.asarray(rows)) for m, rows in groups.values()]
+
+    def predict(X: np.ndarray) -> np.ndarray:
+        out = np.empty(X.shape[0])
+        for m, rows in index:
+            out[rows] = m.predict(X[rows])
+        return out
+
+    return predict
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional, Union
+
+import numpy as np
+import polars as pl
+
+from .logging_utils import get_logger
+
+
+logger = get_logger(__name__)
+
+GROUP_KEY = "store_id"
+DATE_COL = "date"
+# Same features the baseline has always used: rev_lag1, rev_lag7, qty_lag1, num_txn
+DEFAULT_SPEC_TEXT = "lag:rev_sum:1,7;lag:qty_sum:1;col:num_txn"
+
+ROLLING_STATS = ("mean", "std", "min", "max")
+CALENDAR_PARTS = ("dow", "dom", "month", "weekofyear", "is_weekend")
+
+
+def _short(col: str) -> str:
+    # rev_sum -> rev, so lags keep their historical names (rev_lag1, qty_lag1)
+    return col.removesuffix("_sum")
+
+
+# Every feature for a row's date only looks at strictly earlier days of the same store
+# (lags, and rolling/EWM windows over the shifted series), so the forecaster can
+# produce the identical feature from its rolling state.
+@dataclass(frozen=True)
+class Lag:
+    col: str
+    k: int
+
+    @property
+    def name(self) -> str:
+        return f"{_short(self.col)}_lag{self.k}"
+
+    def expr(self) -> pl.Expr:
+        return pl.col(self.col).shift(self.k).over(GROUP_KEY).alias(self.name)
+
+
+@dataclass(frozen=True)
+class Rolling:
+    col: str
+    window: int
+    stat: str
+
+    @property
+    def name(self) -> str:
+        return f"{_short(self.col)}_roll{self.window}_{self.stat}"
+
+    def expr(self) -> pl.Expr:
+        past = pl.col(self.col).shift(1)
+        if self.stat == "std":
+            out = past.rolling_std(self.window, min_periods=2)
+        else:
+            out = getattr(past, f"rolling_{self.stat}")(self.window, min_periods=1)
+        return out.over(GROUP_KEY).alias(self.name)
+
+
+@dataclass(frozen=True)
+class Ewm:
+    col: str
+    span: int
+
+    @property
+    def name(self) -> str:
+        return f"{_short(self.col)}_ewm{self.span}"
+
+    @property
+    def alpha(self) -> float:
+        return 2.0 / (self.span + 1)
+
+    def expr(self) -> pl.Expr:
+        return pl.col(self.col).shift(1).ewm_mean(alpha=self.alpha, adjust=False).over(GROUP_KEY).alias(self.name)
+
+
+@dataclass(frozen=True)
+class Calendar:
+    part: str
+
+    @property
+    def name(self) -> str:
+        return self.part
+
+    def expr(self, date: pl.Expr = pl.col(DATE_COL)) -> pl.Expr:
+        out = {
+            "dow": date.dt.weekday(),
+            "dom": date.dt.day(),
+            "month": date.dt.month(),
+            "weekofyear": date.dt.week(),
+            "is_weekend": date.dt.weekday() >= 6,
+        }[self.part]
+        return out.cast(pl.Float64).alias(self.name)
+
+
+@dataclass(frozen=True)
+class Column:
+    # Same-day value of a daily_store_sales column (num_txn); held at its last
+    # observed value while forecasting
+    col: str
+
+    @property
+    def name(self) -> str:
+        return self.col
+
+    def expr(self) -> pl.Expr:
+        return pl.col(self.col)
+
+
+@dataclass(frozen=True)
+class Mix:
+    # Static per-store column of features.store_customer_mix
+    col: str
+
+    @property
+    def name(self) -> str:
+        return self.col
+
+    def expr(self) -> pl.Expr:
+        return pl.col(self.col)
+
+
+Feature = Union[Lag, Rolling, Ewm, Calendar, Column, Mix]
+
+
+@dataclass(frozen=True)
+class FeatureSpec:
+    features: tuple[Feature, ...]
+    text: str = ""
+
+    @property
+    def names(self) -> list[str]:
+        return [f.name for f in self.features]
+
+    @property
+    def needs_mix(self) -> bool:
+        return any(isinstance(f, Mix) for f in self.features)
+
+    def without_mix(self) -> "FeatureSpec":
+        return FeatureSpec(tuple(f for f in self.features if not isinstance(f, Mix)), self.text)
+
+    def expressions(self) -> list[pl.Expr]:
+        # One with_columns over GROUP_KEY windows: Polars computes the store grouping
+        # once and evaluates every feature in the same pass
+        return [f.expr() for f in self.features if not isinstance(f, (Column, Mix))]
+
+    def build(self, daily: pl.DataFrame, store_mix: Optional[pl.DataFrame] = None) -> pl.DataFrame:
+        df = daily.sort([GROUP_KEY, DATE_COL])
+        if self.needs_mix:
+            mix_cols = [f.col for f in self.features if isinstance(f, Mix)]
+            # The mix key follows daily's id dtype (Categorical in the pipeline)
+            mix = store_mix.select([pl.col(GROUP_KEY).cast(df.schema[GROUP_KEY]), *mix_cols])
+            df = df.join(mix, on=GROUP_KEY, how="left").with_columns(
+                pl.col(mix_cols).fill_null(0.0)
+            )
+        return df.with_columns(self.expressions())
+
+    def fallback(self) -> list[pl.Expr]:
+        # Short histories: a missing lag takes the latest value (lag 1), a single-value
+        # std is 0. The forecaster applies the same rule to its state.
+        out = []
+        for f in self.features:
+            if isinstance(f, Lag) and f.k > 1:
+                out.append(pl.col(f.name).fill_null(pl.col(f.col).shift(1).over(GROUP_KEY)))
+            elif isinstance(f, Rolling) and f.stat == "std":
+                out.append(pl.col(f.name).fill_null(0.0))
+        return out
+
+
+def parse_spec(text: str) -> FeatureSpec:
+    # ';'-separated terms:
+    #   lag:<col>:1,7  roll:<col>:7,28:mean,std,min,max  ewm:<col>:7,28
+    #   cal:dow,dom,month,weekofyear,is_weekend  col:<col>  mix:<col>,<col>
+    text = (text or DEFAULT_SPEC_TEXT).strip()
+    features: list[Feature] = []
+    for term in filter(None, (t.strip() for t in text.split(";"))):
+        kind, *args = term.split(":")
+        ints = lambda s: [int(v) for v in s.split(",")]  # noqa: E731
+        names = lambda s: [v.strip() for v in s.split(",") if v.strip()]  # noqa: E731
+        if kind == "lag":
+            features += [Lag(args[0], k) for k in ints(args[1])]
+        elif kind == "roll":
+            stats = names(args[2]) if len(args) > 2 else ["mean"]
+            bad = set(stats) - set(ROLLING_STATS)
+            if bad:
+                raise ValueError(f"Unsupported rolling stats {sorted(bad)} in {term!r}")
+            features += [Rolling(args[0], w, s) for w in ints(args[1]) for s in stats]
+        elif kind == "ewm":
+            features += [Ewm(args[0], s) for s in ints(args[1])]
+        elif kind == "cal":
+            bad = set(names(args[0])) - set(CALENDAR_PARTS)
+            if bad:
+                raise ValueError(f"Unsupported calendar features {sorted(bad)} in {term!r}")
+            features += [Calendar(p) for p in names(args[0])]
+        elif kind == "col":
+            features += [Column(c) for c in names(args[0])]
+        elif kind == "mix":
+            features += [Mix(c) for c in names(args[0])]
+        else:
+            raise ValueError(f"Unknown feature term {term!r}")
+    if len(set(f.name for f in features)) != len(features):
+        raise ValueError(f"Duplicate features in spec {text!r}")
+    return FeatureSpec(tuple(features), text)
+
+
+DEFAULT_SPEC = parse_spec(DEFAULT_SPEC_TEXT)
+
+
+@dataclass
+class FeatureState:
+    # Rolling per-store state for the forecaster. history[col] is a (stores x lookback +
+    # horizon) buffer, oldest -> newest, NaN before a store's first day; forecasts of the
+    # target are appended, other columns are held at their last value. Rolling sums and
+    # EWMs are updated in O(stores) per step instead of being recomputed.
+    spec: FeatureSpec
+    target: str
+    store_ids: np.ndarray
+    last_date: pl.Series
+    lookback: int
+    history: dict[str, np.ndarray]
+    static: dict[str, np.ndarray]
+    sums: dict[tuple[str, int], list[np.ndarray]] = field(default_factory=dict)
+    ewm: dict[Ewm, np.ndarray] = field(default_factory=dict)
+    step: int = 0
+
+    @classmethod
+    def from_history(
+        cls,
+        spec: FeatureSpec,
+        daily: pl.DataFrame,
+        target: str,
+        horizon: int,
+        store_mix: Optional[pl.DataFrame] = None,
+    ) -> "FeatureState":
+        lookback = max(
+            [1]
+            + [f.k for f in spec.features if isinstance(f, Lag)]
+            + [f.window for f in spec.features if isinstance(f, Rolling)]
+        )
+        cols = sorted(
+            {target}
+            | {f.col for f in spec.features if isinstance(f, (Lag, Rolling, Ewm, Column))}
+        )
+        daily = daily.sort([GROUP_KEY, DATE_COL])
+        stores = daily.group_by(GROUP_KEY, maintain_order=True).agg(pl.col(DATE_COL).last())
+        n = stores.height
+
+        # Only each store's last `lookback` rows, scattered into the buffers in one pass
+        tail = daily.with_columns(
+            (pl.len() - pl.int_range(pl.len()) - 1).over(GROUP_KEY).alias("_back"),
+            pl.col(GROUP_KEY).rle_id().alias("_store"),
+        ).filter(pl.col("_back") < lookback)
+        rows = tail.get_column("_store").to_numpy()
+        pos = lookback - 1 - tail.get_column("_back").to_numpy()
+        history = {}
+        for c in cols:
+            buf = np.full((n, lookback + horizon), np.nan)
+            buf[rows, pos] = tail.get_column(c).cast(pl.Float64).fill_null(np.nan).to_numpy()
+            history[c] = buf
+
+        static = {}
+        mix_cols = [f.col for f in spec.features if isinstance(f, Mix)]
+        if mix_cols:
+            mix = stores.select(GROUP_KEY).join(
+                store_mix.with_columns(pl.col(GROUP_KEY).cast(stores.schema[GROUP_KEY])), on=GROUP_KEY, how="left"
+            )
+            static = {c: mix.get_column(c).cast(pl.Float64).fill_null(0.0).to_numpy() for c in mix_cols}
+
+        state = cls(
+            spec=spec,
+            target=target,
+            store_ids=stores.get_column(GROUP_KEY).to_numpy(),
+            last_date=stores.get_column(DATE_COL),
+            lookback=lookback,
+            history=history,
+            static=static,
+        )
+        for f in spec.features:
+            if isinstance(f, Rolling) and f.stat in ("mean", "std") and (f.col, f.window) not in state.sums:
+                window = history[f.col][:, lookback - f.window : lookback]
+                state.sums[(f.col, f.window)] = [
+                    np.nansum(window, axis=1), np.nansum(window**2, axis=1), np.sum(~np.isnan(window), axis=1)
+                ]
+        ewms = [f for f in spec.features if isinstance(f, Ewm)]
+        if ewms:
+            # EWMs carry all of history, so they are seeded from the full series
+            last = daily.group_by(GROUP_KEY, maintain_order=True).agg([
+                pl.col(f.col).ewm_mean(alpha=f.alpha, adjust=False).last().alias(f.name) for f in ewms
+            ])
+            state.ewm = {f: last.get_column(f.name).cast(pl.Float64).to_numpy() for f in ewms}
+        return state
+
+    @property
+    def n_stores(self) -> int:
+        return len(self.store_ids)
+
+    def target_dates(self) -> pl.Series:
+        return self.last_date.dt.offset_by(f"{self.step + 1}d")
+
+    def _value(self, f: Feature) -> np.ndarray:
+        now = self.lookback + self.step  # buffer index of the day being predicted
+        if isinstance(f, Lag):
+            buf = self.history[f.col]
+            lag = buf[:, now - f.k]
+            return np.where(np.isnan(lag), buf[:, now - 1], lag)
+        if isinstance(f, Rolling):
+            if f.stat in ("mean", "std"):
+                total, sq, count = self.sums[(f.col, f.window)]
+                mean = total / np.maximum(count, 1)
+                if f.stat == "mean":
+                    return mean
+                var = (sq - count * mean**2) / np.maximum(count - 1, 1)
+                return np.where(count >= 2, np.sqrt(np.maximum(var, 0.0)), 0.0)
+            window = self.history[f.col][:, now - f.window : now]
+            return np.nanmin(window, axis=1) if f.stat == "min" else np.nanmax(window, axis=1)
+        if isinstance(f, Ewm):
+            return self.ewm[f]
+        if isinstance(f, Calendar):
+            return pl.select(f.expr(pl.lit(self.target_dates()))).to_series().to_numpy()
+        if isinstance(f, Column):
+            return self.history[f.col][:, now - 1]
+        return self.static[f.col]
+
+    def features(self, feature_cols: list[str]) -> np.ndarray:
+        by_name = {f.name: f for f in self.spec.features}
+        return np.column_stack([self._value(by_name[c]) for c in feature_cols])
+
+    def advance(self, prediction: np.ndarray) -> None:
+        now = self.lookback + self.step
+        for col, buf in self.history.items():
+            buf[:, now] = prediction if col == self.target else buf[:, now - 1]
+        for (col, window), acc in self.sums.items():
+            new, old = self.history[col][:, now], self.history[col][:, now - window]
+            keep = ~np.isnan(old)
+            acc[0] += new - np.where(keep, old, 0.0)
+            acc[1] += new**2 - np.where(keep, old**2, 0.0)
+            acc[2] += 1 - keep
+        for f, value in self.ewm.items():
+            self.ewm[f] = f.alpha * self.history[f.col][:, now] + (1 - f.alpha) * value
+        self.step += 1
+
+    def forecasts(self) -> np.ndarray:
+        return self.history[self.target][:, self.lookback : self.lookback + self.step]
@@ -3,79 +3,158 @@ from __future__ import annotations
 import polars as pl
 
 from .logging_utils import get_logger
+from .schemas import CUSTOMER_FEATURES, DAILY, ID
+from .transform import Frame, column_names
 
 
 logger = get_logger(__name__)
 
 
-def daily_store_sales(df: pl.DataFrame) -> pl.DataFrame:
+def daily_store_sales(df: Frame) -> Frame:
     # Aggregate daily totals per store
     out = (
         df.group_by(["date", "store_id"]).agg([
-            pl.sum("quantity").alias("qty_sum"),
-            pl.sum("revenue").alias("rev_sum"),
-            pl.count().alias("num_txn"),
+            # Line-level Float32 values are summed in Float64
+            pl.col("quantity").cast(pl.Float64).sum().alias("qty_sum"),
+            pl.col("revenue").cast(pl.Float64).sum().alias("rev_sum"),
+            pl.len().cast(DAILY["num_txn"]).alias("num_txn"),
         ])
         .sort(["store_id", "date"])
     )
     return out
 
 
-def customer_features(sales_df: pl.DataFrame, customers_df: pl.DataFrame) -> pl.DataFrame:
-    # Optional join on customer_id if present in sales
-    if "customer_id" in sales_df.columns:
-        s = sales_df.select([
-            pl.col("customer_id").cast(pl.Utf8),
-            pl.col("revenue"),
+def customer_partials(sales_df: Frame) -> Frame:
+    # Per-customer counts, sums and last purchase; partials of any split of the sales
+    # (batches, partitions) merge with CUSTOMER_PARTIAL_AGGS
+    return (
+        sales_df.select([
+            pl.col("customer_id").cast(ID),
+            pl.col("revenue").cast(pl.Float64),
             pl.col("date"),
-        ]).drop_nulls(["customer_id"]) 
-        feats = (
-            s.group_by("customer_id").agg([
-                pl.count().alias("customer_num_txn"),
-                pl.sum("revenue").alias("customer_ltv"),
-                pl.mean("revenue").alias("customer_avg_basket"),
-                pl.max("date").alias("customer_last_purchase_date"),
-            ])
-        )
-        out = customers_df.join(feats, on="customer_id", how="left")
-        # Fill missing engineered fields for customers without transactions
-        out = out.with_columns([
-            pl.col("customer_num_txn").fill_null(0),
-            pl.col("customer_ltv").fill_null(0.0),
-            pl.col("customer_avg_basket").fill_null(0.0),
         ])
-        return out
-    else:
-        return customers_df.with_columns([
-            pl.lit(0).alias("customer_num_txn"),
-            pl.lit(0.0).alias("customer_ltv"),
-            pl.lit(0.0).alias("customer_avg_basket"),
+        .drop_nulls(["customer_id"])
+        .group_by("customer_id").agg([
+            pl.len().cast(CUSTOMER_FEATURES["customer_num_txn"]).alias("customer_num_txn"),
+            pl.sum("revenue").alias("customer_ltv"),
+            pl.max("date").alias("customer_last_purchase_date"),
         ])
+    )
 
 
-def fill_missing_time_series(df: pl.DataFrame, group_key: str, date_col: str, value_cols: list[str]) -> pl.DataFrame:
-    # Create a complete date range per group and forward-fill
-    date_min = df.select(pl.min(date_col)).item()
-    date_max = df.select(pl.max(date_col)).item()
-    all_dates = pl.date_range(low=date_min, high=date_max, eager=True)
+CUSTOMER_PARTIAL_AGGS = [
+    pl.sum("customer_num_txn").cast(CUSTOMER_FEATURES["customer_num_txn"]),
+    pl.sum("customer_ltv"),
+    pl.max("customer_last_purchase_date"),
+]
 
-    completed = (
-        df.join(
-            pl.DataFrame({date_col: all_dates}),
-            on=date_col,
-            how="outer",
+
+def finalize_customer_features(partials: Frame, customers_df: Frame) -> Frame:
+    feats = partials.select([
+        "customer_id", "customer_num_txn", "customer_ltv",
+        (pl.col("customer_ltv") / pl.col("customer_num_txn")).alias("customer_avg_basket"),
+        "customer_last_purchase_date",
+    ])
+    out = customers_df.with_columns(pl.col("customer_id").cast(ID)).join(feats, on="customer_id", how="left")
+    # Fill missing engineered fields for customers without transactions
+    return out.with_columns([
+        pl.col("customer_num_txn").fill_null(0),
+        pl.col("customer_ltv").fill_null(0.0),
+        pl.col("customer_avg_basket").fill_null(0.0),
+    ])
+
+
+def customer_features(sales_df: Frame, customers_df: Frame) -> Frame:
+    # Optional join on customer_id if present in sales
+    if "customer_id" in column_names(sales_df):
+        return finalize_customer_features(customer_partials(sales_df), customers_df)
+    return customers_df.with_columns([
+        pl.lit(0, dtype=CUSTOMER_FEATURES["customer_num_txn"]).alias("customer_num_txn"),
+        pl.lit(0.0).alias("customer_ltv"),
+        pl.lit(0.0).alias("customer_avg_basket"),
+    ])
+
+
+STORE_MIX_COLS = ["store_customers", "store_repeat_share", "store_avg_ltv", "store_avg_basket"]
+
+
+def store_mix_partials(sales_df: Frame, cust_feats: Frame) -> Frame:
+    # Per-store sums/counts over the (store, customer) pairs in sales_df; partials of
+    # disjoint customer sets (e.g. customer_id hash buckets) add up
+    pairs = (
+        sales_df.select([pl.col("store_id"), pl.col("customer_id").cast(ID)])
+        .drop_nulls(["customer_id"])
+        .unique()
+    )
+    repeat = (pl.col("customer_num_txn") > 1).cast(pl.Float64)
+    return (
+        pairs.join(
+            cust_feats.select([
+                pl.col("customer_id").cast(ID), "customer_num_txn", "customer_ltv", "customer_avg_basket",
+            ]),
+            on="customer_id",
+            how="left",
         )
-        .sort([group_key, date_col])
-        .group_by(group_key)
+        .group_by("store_id")
         .agg([
-            pl.all().forward_fill(),
+            pl.len().cast(pl.Float64).alias("store_customers"),
+            repeat.sum().alias("repeat_sum"),
+            repeat.count().alias("repeat_n"),
+            pl.col("customer_ltv").sum().alias("ltv_sum"),
+            pl.col("customer_ltv").count().alias("ltv_n"),
+            pl.col("customer_avg_basket").sum().alias("basket_sum"),
+            pl.col("customer_avg_basket").count().alias("basket_n"),
         ])
-        .explode(pl.exclude(group_key))
+    )
+
+
+def finalize_store_mix(partials: Frame) -> Frame:
+    # Customers missing from customer_features count towards store_customers only
+    return (
+        partials.group_by("store_id")
+        .agg(pl.all().sum())
+        .select([
+            pl.col("store_id"),
+            pl.col("store_customers"),
+            (pl.col("repeat_sum") / pl.col("repeat_n")).alias("store_repeat_share"),
+            (pl.col("ltv_sum") / pl.col("ltv_n")).alias("store_avg_ltv"),
+            (pl.col("basket_sum") / pl.col("basket_n")).alias("store_avg_basket"),
+        ])
+        .with_columns([pl.col(c).cast(pl.Float64).fill_nan(None).fill_null(0.0) for c in STORE_MIX_COLS])
+        .sort("store_id")
+    )
+
+
+def store_customer_mix(sales_df: Frame, cust_feats: Frame) -> Frame:
+    # Static per-store profile of the customers who shop there (from customer_features),
+    # used as customer-mix model features
+    if "customer_id" not in column_names(sales_df):
+        return sales_df.select("store_id").unique().with_columns([pl.lit(0.0).alias(c) for c in STORE_MIX_COLS])
+    return finalize_store_mix(store_mix_partials(sales_df, cust_feats))
+
+
+def fill_missing_time_series(df: Frame, group_key: str, date_col: str, value_cols: list[str]) -> Frame:
+    # Complete daily calendar per group over that group's own first..last date, then
+    # forward-fill within the group. The calendar is one date_ranges list per group
+    # (only the date column is exploded), and the fill is a window expression, so
+    # memory stays linear in the number of group-days.
+    fill_cols = [c for c in column_names(df) if c not in (group_key, date_col)]
+    calendar = (
+        df.group_by(group_key)
+        .agg([pl.min(date_col).alias("_start"), pl.max(date_col).alias("_end")])
+        .select([
+            pl.col(group_key),
+            pl.date_ranges("_start", "_end", interval="1d").alias(date_col),
+        ])
+        .explode(date_col)
+    )
+    completed = (
+        calendar.join(df, on=[group_key, date_col], how="left")
         .sort([group_key, date_col])
+        .with_columns([pl.col(c).forward_fill().over(group_key) for c in fill_cols])
+        .select(column_names(df))
     )
 
     # Fill remaining nulls with zeros for numeric value columns
     completed = completed.with_columns([pl.col(c).fill_null(0) for c in value_cols])
     return completed
-
-
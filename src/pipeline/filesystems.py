@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Callable, Optional
+
+import pyarrow.fs as pafs
+
+from .config import gcp
+from .logging_utils import get_logger
+
+
+logger = get_logger(__name__)
+
+# scheme -> filesystem factory; lets tests map gs:// onto a local directory
+_factories: dict[str, Callable[[], pafs.FileSystem]] = {}
+_instances: dict[str, pafs.FileSystem] = {}
+_lock = threading.Lock()
+
+
+def register_filesystem(scheme: str, factory: Optional[Callable[[], pafs.FileSystem]]) -> None:
+    with _lock:
+        _instances.pop(scheme, None)
+        if factory is None:
+            _factories.pop(scheme, None)
+        else:
+            _factories[scheme] = factory
+
+
+def _default_factory(scheme: str) -> Callable[[], pafs.FileSystem]:
+    if scheme == "gs":
+        return lambda: pafs.GcsFileSystem(project_id=gcp.project_id)
+    raise ValueError(f"Unsupported URI scheme: {scheme}://")
+
+
+def split_uri(uri: str) -> tuple[Optional[str], str]:
+    scheme, sep, rest = uri.partition("://")
+    return (scheme, rest) if sep else (None, uri)
+
+
+def is_remote(uri: str) -> bool:
+    return split_uri(uri)[0] is not None
+
+
+def resolve(uri: str) -> tuple[pafs.FileSystem, str]:
+    # Object-store URIs resolve to one cached pyarrow filesystem per scheme, so reads are
+    # ranged requests against the bucket rather than copies into a temp dir
+    scheme, path = split_uri(uri)
+    if scheme is None:
+        return pafs.LocalFileSystem(), os.path.abspath(path)
+    with _lock:
+        fs = _instances.get(scheme)
+        if fs is None:
+            factory = _factories.get(scheme) or _default_factory(scheme)
+            fs = _instances[scheme] = factory()
+    return fs, path
+
+
+def open_input_stream(uri: str):
+    fs, path = resolve(uri)
+    return fs.open_input_stream(path)
+
+
+def open_input_file(uri: str):
+    # Random-access handle (seek + ranged reads), used for Parquet footers and row groups
+    fs, path = resolve(uri)
+    return fs.open_input_file(path)
+
+
+def ensure_parent(fs: pafs.FileSystem, path: str) -> None:
+    if fs.type_name not in ("gcs", "s3"):
+        # Directory-backed stand-ins need parents; object stores must not get marker objects
+        fs.create_dir(path.rsplit("/", 1)[0], recursive=True)
+
+
+def open_output_stream(uri: str):
+    fs, path = resolve(uri)
+    ensure_parent(fs, path)
+    return fs.open_output_stream(path)
+
+
+def makedirs(uri: str) -> None:
+    if is_remote(uri):
+        # Object stores have no real directories
+        return
+    os.makedirs(uri, exist_ok=True)
+
+
+def exists(uri: str) -> bool:
+    fs, path = resolve(uri)
+    return fs.get_file_info(path).type != pafs.FileType.NotFound
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import numpy as np
+import polars as pl
+
+from .cache import fingerprint
+from .config import paths
+from .config import service as service_config
+from .datasets import MANIFEST, is_dataset
+from .ingest import published, read_forecast
+from .logging_utils import configure_logging, get_logger
+
+
+logger = get_logger(__name__)
+
+_EPOCH = date(1970, 1, 1)
+
+
+def _day(value: Optional[str | date], default: int) -> int:
+    if value is None or value == "":
+        return default
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value - _EPOCH).days
+
+
+class ForecastIndex:
+    # Columnar, immutable view of one published forecast. Rows are sorted by
+    # (store, date) so a store is a contiguous slice and a date range within it is two
+    # binary searches; prefix sums make any store/range total O(1) once located.
+    def __init__(self, fcst: pl.DataFrame):
+        fcst = fcst.select([
+            pl.col("store_id").cast(pl.Utf8),
+            pl.col("date").cast(pl.Date),
+            pl.col("rev_fcst").cast(pl.Float64),
+        ]).sort(["store_id", "date"])
+        self.store_ids: list[str] = fcst.get_column("store_id").unique(maintain_order=True).to_list()
+        self._store_pos = {s: i for i, s in enumerate(self.store_ids)}
+        store_idx = fcst.get_column("store_id").rle_id().to_numpy().astype(np.int64)
+        self.days = fcst.get_column("date").cast(pl.Int32).to_numpy().astype(np.int64)
+        self.rev = fcst.get_column("rev_fcst").fill_null(0.0).to_numpy()
+        # Composite (store, day) keys are globally sorted, so searchsorted locates every
+        # store's date range at once
+        self._span = int(self.days.max() - self.days.min() + 2) if len(self.days) else 1
+        self._base = int(self.days.min()) if len(self.days) else 0
+        self._keys = store_idx * self._span + (self.days - self._base)
+        self._cumsum = np.concatenate([[0.0], np.cumsum(self.rev)])
+        self.n_rows = len(self.rev)
+
+    @property
+    def first_day(self) -> Optional[date]:
+        return date.fromordinal(_EPOCH.toordinal() + int(self.days.min())) if self.n_rows else None
+
+    @property
+    def last_day(self) -> Optional[date]:
+        return date.fromordinal(_EPOCH.toordinal() + int(self.days.max())) if self.n_rows else None
+
+    def _bounds(self, stores: np.ndarray, start: int, end: int) -> tuple[np.ndarray, np.ndarray]:
+        lo_day = np.clip(start - self._base, 0, self._span - 1)
+        hi_day = np.clip(end - self._base + 1, 0, self._span - 1)
+        lo = np.searchsorted(self._keys, stores * self._span + lo_day, side="left")
+        hi = np.searchsorted(self._keys, stores * self._span + hi_day, side="left")
+        return lo, np.maximum(hi, lo)
+
+    def store(self, store_id: str, start: Optional[str | date] = None, end: Optional[str | date] = None) -> list[dict]:
+        pos = self._store_pos.get(store_id)
+        if pos is None:
+            raise KeyError(store_id)
+        lo, hi = self._bounds(np.array([pos]), _day(start, -(2**40)), _day(end, 2**40))
+        rows = slice(int(lo[0]), int(hi[0]))
+        return [
+            {"date": date.fromordinal(_EPOCH.toordinal() + int(d)).isoformat(), "rev_fcst": float(v)}
+            for d, v in zip(self.days[rows], self.rev[rows])
+        ]
+
+    def totals(self, start: Optional[str | date] = None, end: Optional[str | date] = None) -> np.ndarray:
+        # Forecast revenue per store (in store_ids order) over [start, end]
+        lo, hi = self._bounds(np.arange(len(self.store_ids)), _day(start, -(2**40)), _day(end, 2**40))
+        return self._cumsum[hi] - self._cumsum[lo]
+
+    def range_totals(self, start: Optional[str | date] = None, end: Optional[str | date] = None) -> dict[str, float]:
+        return dict(zip(self.store_ids, self.totals(start, end).tolist()))
+
+    def top(self, n: int, start: Optional[str | date] = None, end: Optional[str | date] = None) -> list[dict]:
+        totals = self.totals(start, end)
+        n = max(0, min(n, len(totals)))
+        if n == 0:
+            return []
+        best = np.argpartition(-totals, n - 1)[:n]
+        best = best[np.lexsort((best, -totals[best]))]
+        return [{"store_id": self.store_ids[i], "total": float(totals[i])} for i in best]
+
+
+@dataclass
+class ForecastService:
+    # Serves queries from an in-memory ForecastIndex and swaps in a new one when the
+    # published forecast changes (file size/mtime, or a dataset's commit manifest).
+    # Summaries are memoized per index and dropped on reload.
+    source: str
+    reload_seconds: float = 5.0
+    loader: Callable[[str], pl.DataFrame] = field(default_factory=lambda: read_forecast)
+    index: Optional[ForecastIndex] = None
+    version: str = ""
+    loaded_at: float = 0.0
+    _checked_at: float = 0.0
+    _summaries: dict[tuple, Any] = field(default_factory=dict)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def _fingerprint(self) -> str:
+        if is_dataset(self.source):
+            return fingerprint(f"{self.source.rstrip('/')}/{MANIFEST}", hash_contents=False)
+        return fingerprint(self.source, hash_contents=False)
+
+    def reload(self, force: bool = False) -> bool:
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = self._fingerprint()
+            if not force and version == self.version and self.index is not None:
+                return False
+            t0 = time.perf_counter()
+            index = ForecastIndex(self.loader(self.source))
+            self.index, self.version, self.loaded_at = index, version, time.time()
+            self._summaries = {}
+        logger.info(
+            "Loaded forecast index from %s: %s rows, %s stores in %.1f ms",
+            self.source, index.n_rows, len(index.store_ids), (time.perf_counter() - t0) * 1000,
+        )
+        return True
+
+    def current(self) -> ForecastIndex:
+        # Cheap staleness check at most every reload_seconds; queries keep using the
+        # index they grabbed even if a reload swaps it underneath them
+        if self.index is None or time.monotonic() - self._checked_at >= self.reload_seconds:
+            try:
+                self.reload()
+            except FileNotFoundError:
+                if self.index is None:
+                    raise
+                logger.warning("Forecast source %s disappeared; serving the last loaded index", self.source)
+        return self.index
+
+    def _memo(self, key: tuple, compute: Callable[[ForecastIndex], Any]) -> Any:
+        index = self.current()
+        with self._lock:
+            if key in self._summaries and self.index is index:
+                return self._summaries[key]
+        value = compute(index)
+        with self._lock:
+            if self.index is index:
+                self._summaries[key] = value
+        return value
+
+    def summary(self) -> dict:
+        # Same shape as the Ruby /report summary
+        def compute(index: ForecastIndex) -> dict:
+            totals = index.range_totals()
+            return {
+                "grand_total_forecast": round(float(sum(totals.values())), 2),
+                "stores": {s: round(v, 2) for s, v in totals.items()},
+                "first_date": index.first_day.isoformat() if index.first_day else None,
+                "last_date": index.last_day.isoformat() if index.last_day else None,
+            }
+
+        return self._memo(("summary",), compute)
+
+    def store(self, store_id: str, start: Optional[str] = None, end: Optional[str] = None) -> list[dict]:
+        return self.current().store(store_id, start, end)
+
+    def range_totals(self, start: Optional[str] = None, end: Optional[str] = None) -> dict[str, float]:
+        return self._memo(("range", start, end), lambda index: index.range_totals(start, end))
+
+    def top(self, n: int = 10, start: Optional[str] = None, end: Optional[str] = None) -> list[dict]:
+        return self._memo(("top", n, start, end), lambda index: index.top(n, start, end))
+
+
+def make_handler(service: ForecastService) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, body: Any) -> None:
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self) -> None:  # noqa: N802
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            start, end = query.get("start"), query.get("end")
+            try:
+                if parts == ["health"]:
+                    self._send(200, {"status": "ok", "version": service.version, "loaded_at": service.loaded_at})
+                elif parts == ["summary"]:
+                    self._send(200, service.summary())
+                elif len(parts) == 2 and parts[0] == "stores":
+                    self._send(200, {"store_id": parts[1], "forecast": service.store(parts[1], start, end)})
+                elif parts == ["range"]:
+                    self._send(200, {"start": start, "end": end, "stores": service.range_totals(start, end)})
+                elif parts == ["top"]:
+                    self._send(200, {"top": service.top(int(query.get("n", "10")), start, end)})
+                else:
+                    self._send(404, {"error": f"unknown path {url.path}"})
+            except KeyError as exc:
+                self._send(404, {"error": f"unknown store {exc.args[0]}"})
+            except ValueError as exc:
+                self._send(400, {"error": str(exc)})
+
+        def log_message(self, format: str, *args: Any) -> None:
+            logger.debug("%s " + format, self.address_string(), *args)
+
+    return Handler
+
+
+def make_server(service: ForecastService, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    return ThreadingHTTPServer((host, port), make_handler(service))
+
+
+def main() -> None:
+    configure_logging()
+    source = service_config.source or published(paths.data_processed_dir, "forecast")
+    service = ForecastService(source, service_config.reload_seconds)
+    service.reload(force=True)
+    server = make_server(service, service_config.host, service_config.port)
+    logger.info("Forecast service listening on %s:%s", *server.server_address[:2])
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
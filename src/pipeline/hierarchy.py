@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Optional
+
+import numpy as np
+import polars as pl
+
+from .config import hierarchy as hierarchy_config
+from .config import modeling
+from .logging_utils import get_logger
+from .schemas import FORECAST_HIERARCHY, FORECAST_STORE_PRODUCT, STORE_PRODUCT_DAILY, conform
+from .transform import Frame
+
+
+logger = get_logger(__name__)
+
+RECONCILERS = ("wls", "ols", "bottom_up")
+
+
+def store_product_sales(df: Frame) -> Frame:
+    # Bottom level of the hierarchy as sparse daily series: one row per store, product
+    # and day with sales. Days without sales are zeros and never materialized, so memory
+    # scales with sales rows, not stores x products x days. Lines without a product_id
+    # form their store's own series, keeping store totals equal to daily_store_sales.
+    return df.group_by(["date", "store_id", "product_id"]).agg([
+        pl.col("quantity").cast(STORE_PRODUCT_DAILY["qty_sum"]).sum().alias("qty_sum"),
+        pl.col("revenue").cast(STORE_PRODUCT_DAILY["rev_sum"]).sum().alias("rev_sum"),
+    ])
+
+
+@dataclass
+class BottomForecast:
+    keys: pl.DataFrame  # store_id, product_id of each active series (row i = series i)
+    stores: pl.DataFrame  # store_id of each store with active series (row s = store s)
+    store_index: np.ndarray  # series -> store row
+    dates: list[date]  # the horizon
+    values: np.ndarray  # series x horizon base forecasts
+
+    @property
+    def n_series(self) -> int:
+        return len(self.store_index)
+
+
+def forecast_bottom(
+    series: pl.DataFrame,
+    horizon: int,
+    alpha: Optional[float] = None,
+    active_days: Optional[int] = None,
+) -> BottomForecast:
+    # Every active series at once, from group-bys over its sparse rows: the level is an
+    # EWMA over the trailing window in which missing days count as zero (so it is a
+    # weighted sum of the rows present), renormalized for the truncated window; the
+    # weekly shape is the store's weekday profile over the same window.
+    alpha = alpha or hierarchy_config.alpha
+    active_days = active_days or hierarchy_config.active_days
+    end = series.get_column("date").max()
+    start = end - timedelta(days=active_days - 1)
+    recent = series.filter(pl.col("date") >= start)
+
+    age = (pl.lit(end) - pl.col("date")).dt.total_days()
+    levels = (
+        recent.group_by(["store_id", "product_id"])
+        .agg((pl.col("rev_sum") * alpha * pl.lit(1 - alpha).pow(age)).sum().alias("level"))
+        .with_columns(pl.col("level") / (1 - (1 - alpha) ** active_days))
+        .sort(["store_id", "product_id"])
+    )
+    stores = levels.select("store_id").unique(maintain_order=True).with_row_index("_s")
+    levels = levels.join(stores, on="store_id", how="left")
+
+    # Mean revenue per weekday (over the weekdays the window holds) relative to the
+    # store's mean over the week; stores without revenue get a flat profile
+    window = [start + timedelta(days=i) for i in range(active_days)]
+    weekday_days = np.bincount([d.weekday() for d in window], minlength=7)
+    totals = (
+        recent.group_by(["store_id", (pl.col("date").dt.weekday() - 1).alias("_dow")])
+        .agg(pl.col("rev_sum").sum())
+        .join(stores, on="store_id", how="inner")
+    )
+    per_day = np.zeros((stores.height, 7))
+    per_day[totals.get_column("_s").to_numpy(), totals.get_column("_dow").to_numpy()] = totals.get_column(
+        "rev_sum"
+    ).to_numpy()
+    per_day /= np.maximum(weekday_days, 1)
+    week_mean = per_day.mean(axis=1, keepdims=True)
+    profile = np.divide(per_day, week_mean, out=np.ones_like(per_day), where=week_mean > 0)
+
+    dates = [end + timedelta(days=h) for h in range(1, horizon + 1)]
+    store_index = levels.get_column("_s").to_numpy().astype(np.int64)
+    weekdays = np.array([d.weekday() for d in dates])
+    values = levels.get_column("level").to_numpy()[:, None] * profile[store_index[:, None], weekdays[None, :]]
+    return BottomForecast(levels.select(["store_id", "product_id"]), stores.select("store_id"), store_index, dates, values)
+
+
+def aggregation_matrix(store_index: np.ndarray, n_stores: int):
+    # Sparse (1 + stores) x series matrix summing series into the chain (row 0) and
+    # their store (row 1 + s); two non-zeros per series
+    from scipy import sparse
+
+    n = len(store_index)
+    rows = np.concatenate([np.zeros(n, dtype=np.int64), 1 + store_index])
+    cols = np.tile(np.arange(n), 2)
+    return sparse.csr_matrix((np.ones(2 * n), (rows, cols)), shape=(1 + n_stores, n))
+
+
+def reconcile(bottom: np.ndarray, upper: np.ndarray, C, method: Optional[str] = None) -> np.ndarray:
+    # Coherent bottom forecasts from base forecasts of every level: bottom (series x
+    # horizon), upper ((1 + stores) x horizon, chain first), C from aggregation_matrix.
+    # WLS/OLS projection S (S' W^-1 S)^-1 S' W^-1 y in its aggregation form
+    #   y_b - W_b C' (C W_b C' + W_u)^-1 (C y_b - y_u)
+    # so the only system solved is (1 + stores) square and sparse (a store row touches
+    # itself and the chain), whatever the number of series; every horizon step is a
+    # column of the same sparse LU solve.
+    method = method or hierarchy_config.reconcile
+    if method == "bottom_up":
+        return bottom
+    from scipy import sparse
+    from scipy.sparse.linalg import splu
+
+    w_bottom = np.ones(C.shape[1])
+    if method == "wls":
+        # Structural scaling: a node's variance grows with the number of series under it
+        w_upper = np.asarray(C.sum(axis=1)).ravel()
+    elif method == "ols":
+        w_upper = np.ones(C.shape[0])
+    else:
+        raise ValueError(f"Unsupported reconciliation: {method} (expected one of {list(RECONCILERS)})")
+    CW = C @ sparse.diags(w_bottom)
+    system = (CW @ C.T + sparse.diags(w_upper)).tocsc()
+    correction = splu(system).solve(np.asarray(C @ bottom - upper))
+    return bottom - CW.T @ correction
+
+
+def hierarchical_forecast(
+    series: pl.DataFrame,
+    store_forecast: Optional[pl.DataFrame] = None,
+    horizon: Optional[int] = None,
+    method: Optional[str] = None,
+) -> tuple[pl.DataFrame, pl.DataFrame]:
+    # Store x product forecasts reconciled with the store level (the model's forecast,
+    # where it covers a store and date) and the chain total. Returns the coherent
+    # store x product forecast and the chain/store rows with base and reconciled values.
+    horizon = modeling.forecast_horizon_days if horizon is None else horizon
+    empty = pl.DataFrame(schema=FORECAST_STORE_PRODUCT), pl.DataFrame(schema=FORECAST_HIERARCHY)
+    if series.height == 0 or horizon <= 0:
+        return empty
+    bottom = forecast_bottom(series, horizon)
+    n_stores = bottom.stores.height
+    C = aggregation_matrix(bottom.store_index, n_stores)
+    sums = np.asarray(C @ bottom.values)
+
+    # Store base forecasts, defaulting to the sum of their series where the model has none
+    store_base = sums[1:].copy()
+    if store_forecast is not None and store_forecast.height:
+        rows = (
+            store_forecast.filter(pl.col("date").is_between(bottom.dates[0], bottom.dates[-1]))
+            .join(bottom.stores.with_row_index("_s"), on="store_id", how="inner")
+            .with_columns((pl.col("date") - pl.lit(bottom.dates[0])).dt.total_days().alias("_step"))
+        )
+        store_base[rows.get_column("_s").to_numpy(), rows.get_column("_step").to_numpy()] = rows.get_column(
+            "rev_fcst"
+        ).to_numpy()
+    upper = np.vstack([store_base.sum(axis=0, keepdims=True), store_base])
+
+    reconciled = reconcile(bottom.values, upper, C, method)
+    # Negative revenue is clipped, and the upper levels re-summed so they stay coherent
+    reconciled = np.maximum(reconciled, 0.0)
+    totals = np.asarray(C @ reconciled)
+    n, dates = bottom.n_series, pl.Series("date", bottom.dates, dtype=pl.Date)
+    density = n / max(1, n_stores * series.get_column("product_id").n_unique())
+    logger.info(
+        "Hierarchical forecast: %s active store x product series (%.1f%% of store x product pairs) in %s stores, "
+        "%s reconciliation moved the chain total by %.2f%%",
+        n, 100 * density, n_stores, method or hierarchy_config.reconcile,
+        100 * (totals[0].sum() - upper[0].sum()) / max(abs(upper[0].sum()), 1e-12),
+    )
+
+    bottom_out = bottom.keys.select(pl.all().gather(np.repeat(np.arange(n), horizon))).with_columns(
+        dates.gather(np.tile(np.arange(horizon), n)).alias("date"),
+        pl.Series("rev_fcst", reconciled.ravel()),
+    )
+    chain = pl.DataFrame({
+        "level": "chain", "store_id": pl.Series([None] * horizon, dtype=pl.String), "date": dates,
+        "rev_base": upper[0], "rev_fcst": totals[0],
+    })
+    stores = bottom.stores.select(pl.col("store_id").gather(np.repeat(np.arange(n_stores), horizon))).with_columns(
+        pl.lit("store").alias("level"),
+        dates.gather(np.tile(np.arange(horizon), n_stores)).alias("date"),
+        pl.Series("rev_base", upper[1:].ravel()),
+        pl.Series("rev_fcst", totals[1:].ravel()),
+    )
+    levels = pl.concat([conform(chain, FORECAST_HIERARCHY), conform(stores, FORECAST_HIERARCHY)], how="diagonal")
+    return (
+        conform(bottom_out, FORECAST_STORE_PRODUCT).select(list(FORECAST_STORE_PRODUCT)),
+        levels.select(list(FORECAST_HIERARCHY)),
+    )
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass, field
+
+import polars as pl
+
+from .features import daily_store_sales
+from .ingest import read_sales, write_df
+from .logging_utils import get_logger
+from .schemas import CUSTOMER_FEATURES, DAILY, ID, conform
+from .transform import clean_sales
+
+
+logger = get_logger(__name__)
+
+DAILY_KEYS = ["date", "store_id"]
+DAILY_STATE_FILE = "daily_partials.parquet"
+CUSTOMER_STATE_FILE = "customer_partials.parquet"
+MANIFEST_FILE = "manifest.json"
+STATE_FILES = [DAILY_STATE_FILE, CUSTOMER_STATE_FILE, MANIFEST_FILE]
+
+DAILY_SCHEMA = DAILY
+CUSTOMER_SCHEMA = {
+    c: CUSTOMER_FEATURES[c] for c in ["customer_id", "customer_num_txn", "customer_ltv", "customer_last_purchase_date"]
+}
+DAILY_AGGS = [pl.sum("qty_sum"), pl.sum("rev_sum"), pl.sum("num_txn")]
+CUSTOMER_AGGS = [pl.sum("customer_num_txn"), pl.sum("customer_ltv"), pl.max("customer_last_purchase_date")]
+
+
+@dataclass
+class AggregateState:
+    # Mergeable partial aggregates: sums, counts and max dates only, so a delta can be
+    # folded in without revisiting history
+    daily: pl.DataFrame
+    customers: pl.DataFrame
+    # partition id (e.g. blob name) -> fingerprint (e.g. GCS generation) of merged inputs
+    partitions: dict[str, str] = field(default_factory=dict)
+
+    @classmethod
+    def empty(cls) -> "AggregateState":
+        return cls(daily=pl.DataFrame(schema=DAILY_SCHEMA), customers=pl.DataFrame(schema=CUSTOMER_SCHEMA))
+
+
+def load_state(state_dir: str) -> AggregateState:
+    manifest_path = os.path.join(state_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        logger.info("No aggregate state at %s; starting from empty state", state_dir)
+        return AggregateState.empty()
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    state = AggregateState(
+        daily=conform(pl.read_parquet(os.path.join(state_dir, DAILY_STATE_FILE)), DAILY_SCHEMA),
+        customers=conform(pl.read_parquet(os.path.join(state_dir, CUSTOMER_STATE_FILE)), CUSTOMER_SCHEMA),
+        partitions=dict(manifest.get("partitions", {})),
+    )
+    logger.info(
+        "Loaded aggregate state: %s partitions, %s store-days, %s customers",
+        len(state.partitions), state.daily.height, state.customers.height,
+    )
+    return state
+
+
+def save_state(state: AggregateState, state_dir: str) -> None:
+    write_df(state.daily, os.path.join(state_dir, DAILY_STATE_FILE))
+    write_df(state.customers, os.path.join(state_dir, CUSTOMER_STATE_FILE))
+    # Manifest last: a state dir is only valid once it names the partitions it contains
+    tmp = os.path.join(state_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump({"partitions": state.partitions}, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(state_dir, MANIFEST_FILE))
+    logger.info("Saved aggregate state to %s", state_dir)
+
+
+def new_partitions(state: AggregateState, available: dict[str, str]) -> dict[str, str]:
+    # Partitions not yet merged. A partition that changed after being merged cannot be
+    # subtracted back out of the sums, so that requires a full rebuild.
+    changed = [p for p, fp in available.items() if p in state.partitions and state.partitions[p] != fp]
+    if changed:
+        raise RuntimeError(f"Partitions changed since they were merged, run a full rebuild: {sorted(changed)}")
+    return {p: fp for p, fp in available.items() if p not in state.partitions}
+
+
+def sales_partials(sales: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
+    daily = daily_store_sales(sales).select([pl.col(c).cast(t) for c, t in DAILY_SCHEMA.items()])
+    if "customer_id" not in sales.columns:
+        return daily, pl.DataFrame(schema=CUSTOMER_SCHEMA)
+    customers = (
+        sales.select([pl.col("customer_id").cast(ID), pl.col("revenue").cast(pl.Float64), "date"])
+        .drop_nulls(["customer_id"])
+        .group_by("customer_id").agg([
+            pl.len().alias("customer_num_txn"),
+            pl.sum("revenue").alias("customer_ltv"),
+            pl.max("date").alias("customer_last_purchase_date"),
+        ])
+        .select([pl.col(c).cast(t) for c, t in CUSTOMER_SCHEMA.items()])
+    )
+    return daily, customers
+
+
+def merge_partials(state: AggregateState, daily: pl.DataFrame, customers: pl.DataFrame) -> AggregateState:
+    # Only keys touched by the delta are re-aggregated; untouched state rows pass through
+    merged_daily = _merge(state.daily, daily, DAILY_KEYS, DAILY_AGGS)
+    merged_customers = _merge(state.customers, customers, ["customer_id"], CUSTOMER_AGGS)
+    return AggregateState(
+        daily=merged_daily.sort(["store_id", "date"]),
+        customers=merged_customers,
+        partitions=dict(state.partitions),
+    )
+
+
+def _merge(state: pl.DataFrame, delta: pl.DataFrame, keys: list[str], aggs: list[pl.Expr]) -> pl.DataFrame:
+    if delta.height == 0:
+        return state
+    touched = delta.select(keys).unique()
+    untouched = state.join(touched, on=keys, how="anti")
+    combined = (
+        pl.concat([state.join(touched, on=keys, how="semi"), delta], how="vertical_relaxed")
+        .group_by(keys).agg(aggs)
+        .select(state.columns)
+        .cast(dict(state.schema))
+    )
+    return pl.concat([untouched, combined])
+
+
+def apply_partitions(state: AggregateState, partitions: dict[str, str], local_paths: dict[str, str]) -> AggregateState:
+    # Reduce each new raw partition to its partials, combine those, and fold the combined
+    # delta into the state in one merge; cost is proportional to the delta, and the state
+    # is re-aggregated once however many partitions arrived
+    if not partitions:
+        return state
+    dailies, customers = [], []
+    for partition in sorted(partitions):
+        sales = clean_sales(read_sales(local_paths[partition]))
+        daily, per_customer = sales_partials(sales)
+        dailies.append(daily)
+        customers.append(per_customer)
+        logger.info("Read partition %s: %s rows", partition, sales.height)
+    daily = pl.concat(dailies, how="vertical_relaxed").group_by(DAILY_KEYS).agg(DAILY_AGGS)
+    per_customer = pl.concat(customers, how="vertical_relaxed").group_by("customer_id").agg(CUSTOMER_AGGS)
+    state = merge_partials(state, daily, per_customer)
+    state.partitions.update(partitions)
+    logger.info("Merged %s partitions: %s store-days, %s customers", len(partitions), daily.height, per_customer.height)
+    return state
+
+
+def finalize_daily(state: AggregateState) -> pl.DataFrame:
+    return state.daily.sort(["store_id", "date"])
+
+
+def finalize_customer_features(state: AggregateState, customers_df: pl.DataFrame) -> pl.DataFrame:
+    # Same columns as features.customer_features, derived from the merged partials
+    feats = state.customers.with_columns(
+        (pl.col("customer_ltv") / pl.col("customer_num_txn")).alias("customer_avg_basket")
+    ).select([
+        "customer_id", "customer_num_txn", "customer_ltv", "customer_avg_basket", "customer_last_purchase_date",
+    ])
+    return customers_df.join(feats, on="customer_id", how="left").with_columns([
+        pl.col("customer_num_txn").fill_null(0),
+        pl.col("customer_ltv").fill_null(0.0),
+        pl.col("customer_avg_basket").fill_null(0.0),
+    ])
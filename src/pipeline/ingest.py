@@ -1,46 +1,351 @@
 from __future__ import annotations
 
+import atexit
+import fnmatch
+import hashlib
+import json
 import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 import polars as pl
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pads
+import pyarrow.fs as pafs
 
+from . import schemas
+from .cache import fingerprint
+from .config import ingestion
+from .datasets import is_dataset, parquet_options, scan_dataset
+from .filesystems import ensure_parent, exists, is_remote, open_input_stream, open_output_stream, resolve, split_uri
 from .logging_utils import get_logger
 
 
 logger = get_logger(__name__)
 
 
-def read_sales(path: str) -> pl.DataFrame:
-    if path.endswith(".csv"):
-        df = pl.read_csv(path, try_parse_dates=True, infer_schema_length=10000)
-    elif path.endswith(".parquet"):
-        df = pl.read_parquet(path)
-    else:
-        raise ValueError(f"Unsupported file type: {path}")
+CSV_SUFFIXES = (".csv", ".csv.gz")
+IPC_SUFFIXES = (".arrow", ".ipc", ".feather")
+INPUT_SUFFIXES = (*CSV_SUFFIXES, ".parquet", *IPC_SUFFIXES)
+_GLOB_CHARS = "*?["
+_STAGE_CHUNK = 8 << 20
+_stage_lock = threading.Lock()
+_stage_root: Optional[str] = None
+
+
+def _uri(scheme: Optional[str], path: str) -> str:
+    return f"{scheme}://{path}" if scheme else path
+
+
+def _list_files(uri: str, pattern: Optional[str] = None) -> list[str]:
+    # Input files under a directory / object prefix, skipping hidden and underscore
+    # entries (_SUCCESS markers, dataset staging dirs)
+    scheme, _ = split_uri(uri)
+    fs, base = resolve(uri)
+    selector = pafs.FileSelector(base.rstrip("/"), recursive=True, allow_not_found=True)
+    out = []
+    for info in fs.get_file_info(selector):
+        rel = info.path[len(base.rstrip("/")) + 1:]
+        if info.type != pafs.FileType.File or any(p.startswith(("_", ".")) for p in rel.split("/")):
+            continue
+        if (pattern is not None and fnmatch.fnmatchcase(info.path, pattern)) or (
+            pattern is None and info.path.endswith(INPUT_SUFFIXES)
+        ):
+            out.append(_uri(scheme, info.path))
+    return sorted(out)
+
+
+def expand_inputs(path: str) -> list[str]:
+    # One input spec -> the files it names: a single file or dataset, a directory /
+    # prefix of shards, a glob ("raw/sales/*.csv.gz"), or a JSON manifest listing files
+    # ({"files": [...]} or a bare list; relative entries resolve against the manifest)
+    if path.endswith(".json"):
+        with open_input_stream(path) as f:
+            listed = json.loads(f.read())
+        root = path.rsplit("/", 1)[0] if "/" in path else "."
+        entries = listed["files"] if isinstance(listed, dict) else listed
+        entries = [e["path"] if isinstance(e, dict) else e for e in entries]
+        return [e if is_remote(e) or os.path.isabs(e) else f"{root}/{e}" for e in entries]
+    scheme, rest = split_uri(path)
+    if any(c in rest for c in _GLOB_CHARS):
+        fs, base = resolve(path)
+        first = min(base.index(c) for c in _GLOB_CHARS if c in base)
+        prefix = base[:first].rsplit("/", 1)[0]
+        files = _list_files(_uri(scheme, prefix), pattern=base)
+        if not files:
+            raise FileNotFoundError(f"No input files match {path}")
+        return files
+    if not is_dataset(path):
+        fs, base = resolve(path)
+        if fs.get_file_info(base).type == pafs.FileType.Directory:
+            files = _list_files(path)
+            if not files:
+                raise FileNotFoundError(f"No input files under {path}")
+            return files
+    return [path]
+
+
+def input_fingerprint(path: str) -> str:
+    # Stage-cache fingerprint of everything an input spec expands to
+    files = expand_inputs(path)
+    if len(files) == 1:
+        return fingerprint(files[0])
+    return "files:" + hashlib.sha256("\n".join(fingerprint(f) for f in files).encode()).hexdigest()
+
+
+def _stage_dir() -> str:
+    # Per-process directory for local copies of remote IPC files (each removed once
+    # mapped); the directory itself is removed at exit
+    global _stage_root
+    with _stage_lock:
+        if _stage_root is None:
+            _stage_root = tempfile.mkdtemp(prefix="ingest-stage-", dir=ingestion.stage_dir or None)
+            atexit.register(shutil.rmtree, _stage_root, True)
+        return _stage_root
+
+
+def _stage(path: str) -> str:
+    # Local copy of a remote object, downloaded in fixed-size chunks so memory stays
+    # bounded whatever the object's size. The caller removes it.
+    fs, src = resolve(path)
+    fd, local = tempfile.mkstemp(suffix=f"-{os.path.basename(src)}", dir=_stage_dir())
+    try:
+        with fs.open_input_stream(src, compression=None) as f, os.fdopen(fd, "wb") as out:
+            while chunk := f.read(_STAGE_CHUNK):
+                out.write(chunk)
+    except BaseException:
+        os.remove(local)
+        raise
+    logger.info("Staged %s at %s (%s bytes)", path, local, os.path.getsize(local))
+    return local
+
+
+def _scan_remote_csv(path: str, schema: dict[str, pl.DataType]) -> pl.LazyFrame:
+    # Remote CSVs are parsed from the object stream by a pyarrow CSV dataset (gzip'd ones
+    # decompressed on the fly), with projections and predicates pushed into it: nothing
+    # is staged on local disk and the raw bytes are never held whole. As in the local
+    # reader every column is read as a string and only the registry columns are cast.
+    fs, key = resolve(path)
+    with fs.open_input_stream(key) as f:
+        names = pacsv.open_csv(f).schema.names
+    options = pacsv.ConvertOptions(
+        column_types={n: pa.string() for n in names}, strings_can_be_null=True, null_values=[""],
+    )
+    lf = pl.scan_pyarrow_dataset(pads.dataset(key, filesystem=fs, format=pads.CsvFileFormat(convert_options=options)))
+    return lf.with_columns([pl.col(c).cast(t) for c, t in schemas.csv_dtypes(schema, names).items()])
+
+
+def _csv_options(source, schema: dict[str, pl.DataType]) -> dict:
+    # Read with the registry's fixed dtypes instead of inferring them from a sample;
+    # only the header is parsed to find which registry columns are present
+    names = pl.scan_csv(source, infer_schema_length=0).collect_schema().names()
+    return {"schema_overrides": schemas.csv_dtypes(schema, names), "infer_schema_length": 0}
+
+
+def _parquet_cached(path: str, schema: dict[str, pl.DataType]) -> str:
+    # Parquet copy of a raw CSV, converted on first read. The key covers the file's
+    # fingerprint and the read dtypes, so a changed file or registry converts again.
+    dtypes = ",".join(f"{c}:{t}" for c, t in sorted(schema.items()))
+    key = hashlib.sha256(f"{fingerprint(path, hash_contents=False)}|{dtypes}".encode()).hexdigest()[:32]
+    cached = f"{ingestion.parquet_cache_dir.rstrip('/')}/{key}.parquet"
+    if not exists(cached):
+        if is_remote(path):
+            df = _scan_remote_csv(path, schema).collect()
+        else:
+            df = pl.read_csv(path, **_csv_options(path, schema))
+        fs, target = resolve(cached)
+        tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+        ensure_parent(fs, tmp)
+        with fs.open_output_stream(tmp) as f:
+            df.write_parquet(f, **parquet_options())
+        fs.move(tmp, target)
+        logger.info("Cached %s as Parquet (%s rows) at %s", path, df.height, cached)
+    return cached
+
+
+def _scan_file(path: str, schema: dict[str, pl.DataType]) -> pl.LazyFrame:
+    if path.endswith(CSV_SUFFIXES):
+        if ingestion.parquet_cache_dir:
+            path = _parquet_cached(path, schema)
+        elif is_remote(path):
+            return _scan_remote_csv(path, schema)
+        else:
+            # gzip'd CSVs are decompressed by the reader
+            return pl.scan_csv(path, **_csv_options(path, schema))
+    if path.endswith(".parquet"):
+        return _scan_remote_parquet(path) if is_remote(path) else pl.scan_parquet(path)
+    elif path.endswith(IPC_SUFFIXES):
+        return read_ipc(path).lazy()
+    elif is_dataset(path):
+        return scan_dataset(path)
+    raise ValueError(f"Unsupported file type: {path}")
+
+
+def _scan_shard(path: str, schema: dict[str, pl.DataType], columns: Optional[list[str]]) -> pl.LazyFrame:
+    # Shards may drift: header case/whitespace, missing or extra columns, widened types.
+    # Names are normalized and ids cast to the registry dtype per shard; the remaining
+    # differences are reconciled by a diagonal, type-relaxed concat.
+    lf = _scan_file(path, schema)
+    current = lf.collect_schema()
+    renames = {c: c.strip().lower() for c in current.names() if c != c.strip().lower()}
+    if renames:
+        lf = lf.rename(renames)
+        current = lf.collect_schema()
+    ids = [schemas.cast(c, t, current[c]) for c, t in schema.items() if c in current and t == pl.Categorical]
+    if ids:
+        lf = lf.with_columns(ids)
+    if columns is not None:
+        lf = lf.select([c for c in columns if c in current])
+    return lf
+
+
+def _scan(path: str, schema: dict[str, pl.DataType], columns: Optional[list[str]] = None) -> pl.LazyFrame:
+    files = expand_inputs(path)
+    shards = [_scan_shard(f, schema, columns) for f in files]
+    if len(shards) == 1:
+        return shards[0]
+    _log_drift(path, [lf.collect_schema() for lf in shards])
+    return pl.concat(shards, how="diagonal_relaxed")
+
+
+def _read(path: str, schema: dict[str, pl.DataType], columns: Optional[list[str]] = None) -> pl.DataFrame:
+    files = expand_inputs(path)
+    if len(files) == 1:
+        return _scan_shard(files[0], schema, columns).collect()
+    # Shards are parsed concurrently (polars releases the GIL) and concatenated without
+    # copying their chunks; the result is rechunked once
+    with ThreadPoolExecutor(max_workers=max(1, min(ingestion.read_workers, len(files)))) as pool:
+        frames = list(pool.map(lambda f: _scan_shard(f, schema, columns).collect(), files))
+    _log_drift(path, [df.schema for df in frames])
+    df = pl.concat(frames, how="diagonal_relaxed", rechunk=False)
+    logger.info("Read %s files from %s", len(files), path)
+    return (df.select(columns) if columns else df).rechunk()
+
+
+def read_ipc(path: str, columns: Optional[list[str]] = None) -> pl.DataFrame:
+    # Local Arrow IPC files are memory-mapped: uncompressed buffers are used in place, so
+    # there is no parse and no copy, and pages are loaded (and shared) on first touch.
+    # Only dictionary-encoded ids are remapped into the string cache. Remote files are
+    # staged to local disk in chunks and mapped from there; the mapping outlives the
+    # staged file's removal.
+    if is_remote(path):
+        local = _stage(path)
+        try:
+            return pl.read_ipc(local, columns=columns, memory_map=True)
+        finally:
+            os.remove(local)
+    return pl.read_ipc(path, columns=columns, memory_map=True)
+
+
+def published(output_dir: str, name: str) -> str:
+    # Where output <name> is best re-read from: the memory-mappable <name>.arrow when it
+    # exists, else the <name>/ dataset, else <name>.parquet
+    for path in (os.path.join(output_dir, f"{name}.arrow"), os.path.join(output_dir, name)):
+        if exists(path) and (path.endswith(".arrow") or is_dataset(path)):
+            return path
+    return os.path.join(output_dir, f"{name}.parquet")
+
+
+def _scan_remote_parquet(path: str) -> pl.LazyFrame:
+    # Polars pushes projections and predicates into the pyarrow dataset, which reads the
+    # footer, skips row groups by their statistics and fetches only the needed column
+    # chunks with ranged reads
+    fs, key = resolve(path)
+    return pl.scan_pyarrow_dataset(pads.dataset(key, filesystem=fs, format="parquet"))
+
+
+def _log_drift(path: str, shard_schemas: list) -> None:
+    names = [set(s.names()) for s in shard_schemas]
+    partial = set.union(*names) - set.intersection(*names)
+    dtypes = {}
+    for s in shard_schemas:
+        for c, t in s.items():
+            dtypes.setdefault(c, set()).add(str(t))
+    widened = sorted(c for c, ts in dtypes.items() if len(ts) > 1)
+    if partial or widened:
+        logger.warning(
+            "Schema drift across %s shards of %s: columns missing from some shards %s, mixed dtypes %s",
+            len(shard_schemas), path, sorted(partial), widened,
+        )
+
+
+def read_sales(path: str, columns: Optional[list[str]] = None) -> pl.DataFrame:
+    df = _read(path, schemas.SALES, columns=columns)
     logger.info("Read sales data: %s rows, %s cols", df.height, df.width)
     return df
 
 
-def read_customers(path: str) -> pl.DataFrame:
-    if path.endswith(".csv"):
-        df = pl.read_csv(path, try_parse_dates=True, infer_schema_length=5000)
-    elif path.endswith(".parquet"):
-        df = pl.read_parquet(path)
-    else:
-        raise ValueError(f"Unsupported file type: {path}")
+def read_customers(path: str, columns: Optional[list[str]] = None) -> pl.DataFrame:
+    df = _read(path, schemas.CUSTOMERS, columns=columns)
     logger.info("Read customers data: %s rows, %s cols", df.height, df.width)
     return df
 
 
-def write_df(df: pl.DataFrame, path: str) -> None:
-    os.makedirs(os.path.dirname(path), exist_ok=True)
+def read_table(path: str, columns: Optional[list[str]] = None) -> pl.DataFrame:
+    # Any published output (file, shards or dataset) as written, with no registry casts
+    return _read(path, {}, columns=columns)
+
+
+def read_daily(path: str) -> pl.DataFrame:
+    # Published daily_store_sales (file or dataset), e.g. for forecast-only runs
+    df = schemas.conform(_read(path, schemas.DAILY), schemas.DAILY)
+    logger.info("Read daily store sales: %s rows", df.height)
+    return df
+
+
+def read_forecast(path: str) -> pl.DataFrame:
+    df = schemas.conform(_read(path, schemas.FORECAST, columns=list(schemas.FORECAST)), schemas.FORECAST)
+    logger.info("Read forecast: %s rows", df.height)
+    return df
+
+
+def scan_sales(path: str) -> pl.LazyFrame:
+    # Lazy counterpart of read_sales: nothing is read until the plan is collected,
+    # so filters and column selections downstream are pushed into the scan
+    lf = _scan(path, schemas.SALES)
+    logger.info("Scanning sales data lazily from %s", path)
+    return lf
+
+
+def scan_customers(path: str) -> pl.LazyFrame:
+    lf = _scan(path, schemas.CUSTOMERS)
+    logger.info("Scanning customers data lazily from %s", path)
+    return lf
+
+
+OUTPUT_SUFFIXES = (".parquet", ".csv", ".arrow")
+
+
+def _write(df: pl.DataFrame, path: str, target) -> None:
     if path.endswith(".parquet"):
-        df.write_parquet(path)
+        df.write_parquet(target, **parquet_options())
     elif path.endswith(".csv"):
-        df.write_csv(path)
+        df.write_csv(target)
+    elif path.endswith(".arrow"):
+        # Uncompressed, so readers can memory-map the buffers instead of decoding them
+        df.write_ipc(target, compression="uncompressed")
     else:
         raise ValueError(f"Unsupported output file type: {path}")
-    logger.info("Wrote dataset to %s", path)
 
 
+def write_df(df: pl.DataFrame, path: str) -> None:
+    if is_remote(path):
+        # Stream the encoded bytes straight into the object (a resumable upload on GCS)
+        if not path.endswith(OUTPUT_SUFFIXES):
+            raise ValueError(f"Unsupported output file type: {path}")
+        with open_output_stream(path) as f:
+            _write(df, path, f)
+    elif path.endswith(".arrow"):
+        # Replaced, never rewritten in place: a reader may have the old file mapped
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        _write(df, path, tmp)
+        os.replace(tmp, path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write(df, path, path)
+    logger.info("Wrote dataset to %s", path)
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Tuple
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Optional, Tuple
 
 import numpy as np
 import polars as pl
-from sklearn.linear_model import LinearRegression
 
 from .config import modeling
+from .estimators import batched_predictor, fit_estimator
+from .feature_specs import DEFAULT_SPEC, FeatureSpec, FeatureState, parse_spec
 from .logging_utils import get_logger
+from .schemas import FORECAST
 
 
 logger = get_logger(__name__)
@@ -16,68 +19,122 @@ logger = get_logger(__name__)
 
 @dataclass
 class ModelArtifacts:
-    model: LinearRegression
+    # Any fitted regressor with a sklearn-style predict (see estimators.BACKENDS)
+    model: Any
     feature_cols: list[str]
     target_col: str
-
-
-def prepare_supervised(df: pl.DataFrame) -> Tuple[np.ndarray, np.ndarray, list[str]]:
-    # Simple baseline: forecast next-day revenue using lag features
-    df = df.sort(["store_id", "date"]).with_columns([
-        pl.col("rev_sum").shift(1).over("store_id").alias("rev_lag1"),
-        pl.col("rev_sum").shift(7).over("store_id").alias("rev_lag7"),
-        pl.col("qty_sum").shift(1).over("store_id").alias("qty_lag1"),
-    ])
-
-    df = df.drop_nulls(["rev_lag1", "rev_lag7", "qty_lag1"])  # drop cold starts
-    feature_cols = ["rev_lag1", "rev_lag7", "qty_lag1", "num_txn"]
-    target_col = "rev_sum"
-
+    # Per-store or per-cluster models keyed by registry key; stores without an entry
+    # (or without a group in store_groups) fall back to the global model
+    registry: dict[str, Any] = field(default_factory=dict)
+    store_groups: dict[str, str] = field(default_factory=dict)
+    validation_mae: dict[str, float] = field(default_factory=dict)
+    spec: FeatureSpec = DEFAULT_SPEC
+    # Per-store customer-mix columns, kept only when the spec uses them
+    store_mix: Optional[pl.DataFrame] = None
+    # Last date of the rows the models were fitted on (warm-start refits add later days)
+    trained_through: Optional[date] = None
+    version: str = ""  # set when saved to / loaded from the model store
+
+    def model_for(self, store_id: str) -> Any:
+        return self.registry.get(self.store_groups.get(store_id, store_id), self.model)
+
+
+FEATURE_COLS = DEFAULT_SPEC.names
+TARGET_COL = "rev_sum"
+
+
+def resolve_spec(store_mix: Optional[pl.DataFrame] = None) -> FeatureSpec:
+    spec = parse_spec(modeling.feature_spec)
+    if spec.needs_mix and store_mix is None:
+        logger.warning("Feature spec uses customer-mix features but no store mix is available; dropping them")
+        spec = spec.without_mix()
+    return spec
+
+
+def supervised_frame(
+    df: pl.DataFrame, spec: FeatureSpec = DEFAULT_SPEC, store_mix: Optional[pl.DataFrame] = None
+) -> pl.DataFrame:
+    # Forecast next-day revenue from the spec's features, all computed in one pass
+    df = spec.build(df, store_mix)
+    complete = df.drop_nulls(spec.names)  # drop cold starts
+    if complete.height == 0:
+        # Too little history for the longest lags anywhere: fall back to the same
+        # substitutions the forecaster uses for short series
+        complete = df.with_columns(spec.fallback()).drop_nulls(spec.names)
+    return complete
+
+
+def prepare_supervised(
+    df: pl.DataFrame, spec: FeatureSpec = DEFAULT_SPEC, store_mix: Optional[pl.DataFrame] = None
+) -> Tuple[np.ndarray, np.ndarray, list[str]]:
+    df = supervised_frame(df, spec, store_mix)
+    feature_cols = spec.names
     X = df.select(feature_cols).to_numpy()
-    y = df.select(target_col).to_numpy().ravel()
+    y = df.select(TARGET_COL).to_numpy().ravel()
     return X, y, feature_cols
 
 
-def train_baseline(df_daily: pl.DataFrame) -> ModelArtifacts:
-    X, y, feature_cols = prepare_supervised(df_daily)
-    n = len(y)
-    val_days = modeling.validation_days
-    split = max(1, n - val_days)
-    X_train, y_train = X[:split], y[:split]
-    X_val, y_val = X[split:], y[split:]
-
-    model = LinearRegression()
-    model.fit(X_train, y_train)
+def time_split(dates: pl.Series, validation_days: int, min_train: int = 1) -> np.ndarray:
+    # Train mask with a time-aligned holdout: the last validation_days calendar dates,
+    # the same dates for every store. Everything trains when that leaves too few rows.
+    train = np.ones(len(dates), dtype=bool)
+    if validation_days > 0 and len(dates):
+        cutoff = dates.max() - timedelta(days=validation_days)
+        train = (dates <= cutoff).to_numpy()
+        if train.sum() < min_train:
+            train = np.ones(len(dates), dtype=bool)
+    return train
+
+
+def train_baseline(
+    df_daily: pl.DataFrame, store_mix: Optional[pl.DataFrame] = None, spec: Optional[FeatureSpec] = None
+) -> ModelArtifacts:
+    spec = spec or resolve_spec(store_mix)
+    sup = supervised_frame(df_daily, spec, store_mix)
+    feature_cols = spec.names
+    X = sup.select(feature_cols).to_numpy()
+    y = sup.get_column(TARGET_COL).to_numpy()
+    train = time_split(sup.get_column("date"), modeling.validation_days)
+    X_train, y_train = X[train], y[train]
+    X_val, y_val = X[~train], y[~train]
+
+    # The holdout doubles as the early-stopping set for boosted backends
+    model = fit_estimator(modeling.model_type, X_train, y_train, X_val, y_val)
     if len(y_val) > 0:
         val_mae = float(np.mean(np.abs(model.predict(X_val) - y_val)))
-        logger.info("Validation MAE: %.4f", val_mae)
-    return ModelArtifacts(model=model, feature_cols=feature_cols, target_col="rev_sum")
+        logger.info("Validation MAE (%s): %.4f", modeling.model_type, val_mae)
+    return ModelArtifacts(
+        model=model,
+        feature_cols=feature_cols,
+        target_col=TARGET_COL,
+        spec=spec,
+        store_mix=store_mix if spec.needs_mix else None,
+        trained_through=sup.get_column("date").filter(pl.Series(train)).max(),
+    )
 
 
 def forecast(artifacts: ModelArtifacts, recent_daily: pl.DataFrame, horizon_days: int) -> pl.DataFrame:
-    # Roll forward using last available lags per store
-    forecasts = []
-    stores = recent_daily.select("store_id").unique().to_series().to_list()
-    for store in stores:
-        hist = recent_daily.filter(pl.col("store_id") == store).sort("date")
-        hist_pd = hist.select(["date", "rev_sum", "qty_sum", "num_txn"]).to_pandas()
-        rev = hist_pd["rev_sum"].values.tolist()
-        qty = hist_pd["qty_sum"].values.tolist()
-        num_txn = hist_pd["num_txn"].values.tolist()
-        dates = hist_pd["date"].values.tolist()
-
-        for i in range(horizon_days):
-            rev_lag1 = rev[-1] if len(rev) >= 1 else 0.0
-            rev_lag7 = rev[-7] if len(rev) >= 7 else rev_lag1
-            qty_lag1 = qty[-1] if len(qty) >= 1 else 0.0
-            x = np.array([[rev_lag1, rev_lag7, qty_lag1, num_txn[-1] if num_txn else 0.0]])
-            yhat = float(artifacts.model.predict(x)[0])
-            rev.append(yhat)
-            qty.append(qty_lag1)
-            num_txn.append(num_txn[-1] if num_txn else 0.0)
-            dates.append(dates[-1] + np.timedelta64(1, 'D'))
-            forecasts.append({"store_id": store, "date": dates[-1], "rev_fcst": yhat})
-
-    return pl.DataFrame(forecasts)
-
-
+    # Roll every store forward together: FeatureState keeps each store's recent history
+    # and running window/EWM state, updated in place after each step's batched prediction
+    empty = pl.DataFrame(schema=FORECAST)
+    if recent_daily.height == 0 or horizon_days <= 0:
+        return empty
+    state = FeatureState.from_history(
+        artifacts.spec, recent_daily, artifacts.target_col, horizon_days, artifacts.store_mix
+    )
+    predict = batched_predictor([artifacts.model_for(s) for s in state.store_ids.tolist()])
+    for _ in range(horizon_days):
+        state.advance(predict(state.features(artifacts.feature_cols)))
+
+    n_stores = state.n_stores
+    steps = np.tile(np.arange(1, horizon_days + 1), n_stores)
+    return pl.DataFrame({
+        "store_id": np.repeat(state.store_ids, horizon_days),
+        "date": np.repeat(state.last_date.to_numpy(), horizon_days),
+        "step": steps,
+        "rev_fcst": state.forecasts().ravel(),
+    }).select([
+        pl.col("store_id").cast(FORECAST["store_id"]),
+        (pl.col("date") + pl.duration(days=pl.col("step"))).cast(pl.Date).alias("date"),
+        pl.col("rev_fcst"),
+    ])
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import io
+import json
+import pickle
+from datetime import date, datetime, timezone
+from typing import Any, Optional
+
+import numpy as np
+import polars as pl
+
+from .cache import code_version
+from .config import modeling, paths
+from .estimators import ResidualStack, fit_estimator, linear_coefficients, linear_from_arrays, refit_linear
+from .feature_specs import parse_spec
+from .filesystems import exists, open_input_stream, open_output_stream
+from .ingest import write_df
+from .logging_utils import get_logger
+from .model import ModelArtifacts, supervised_frame
+
+
+logger = get_logger(__name__)
+
+# <models_dir>/<version>/ holds one artifact; <models_dir>/LATEST names the newest
+# complete version and is written last
+LATEST = "LATEST"
+MANIFEST_FILE = "manifest.json"
+LINEAR_FILE = "linear.npz"  # coefficients, intercepts and normal equations per model key
+ESTIMATORS_FILE = "estimators.pkl"  # non-linear models (tree ensembles), pickled
+STORE_MIX_FILE = "store_mix.parquet"
+GLOBAL_KEY = "__global__"
+FORMAT_VERSION = 1
+
+
+def _join(root: str, *parts: str) -> str:
+    return "/".join([root.rstrip("/"), *parts])
+
+
+def _write_bytes(uri: str, data: bytes) -> None:
+    with open_output_stream(uri) as f:
+        f.write(data)
+
+
+def _read_bytes(uri: str) -> bytes:
+    with open_input_stream(uri) as f:
+        return f.read()
+
+
+def _settings() -> dict[str, Any]:
+    # Training settings an artifact must match to be warm-started by this run
+    return {
+        "model_type": modeling.model_type,
+        "feature_spec": modeling.feature_spec,
+        "granularity": modeling.granularity,
+        "n_clusters": modeling.n_clusters,
+    }
+
+
+def new_version() -> str:
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def latest_version(models_dir: Optional[str] = None) -> Optional[str]:
+    uri = _join(models_dir or paths.models_dir, LATEST)
+    return _read_bytes(uri).decode().strip() if exists(uri) else None
+
+
+def save_artifacts(artifacts: ModelArtifacts, models_dir: Optional[str] = None, version: Optional[str] = None) -> str:
+    models_dir = models_dir or paths.models_dir
+    version = version or new_version()
+    root = _join(models_dir, version)
+    models = {GLOBAL_KEY: artifacts.model, **artifacts.registry}
+
+    linear = {k: m for k, m in models.items() if linear_coefficients(m) is not None}
+    others = {k: m for k, m in models.items() if k not in linear}
+    keys = sorted(linear)
+    n_features = len(artifacts.feature_cols)
+    blank = np.full((n_features + 1, n_features + 1), np.nan)
+    arrays = {
+        "keys": np.array(keys, dtype=str),
+        "coef": np.array([linear_coefficients(linear[k])[0] for k in keys]).reshape(len(keys), n_features),
+        "intercept": np.array([linear_coefficients(linear[k])[1] for k in keys]),
+        "gram": np.array([getattr(linear[k], "gram_", blank) for k in keys]).reshape(len(keys), *blank.shape),
+        "xty": np.array([getattr(linear[k], "xty_", blank[0]) for k in keys]).reshape(len(keys), n_features + 1),
+        "n_rows": np.array([getattr(linear[k], "n_rows_", 0) for k in keys], dtype=np.int64),
+    }
+    buf = io.BytesIO()
+    np.savez_compressed(buf, **arrays)
+    _write_bytes(_join(root, LINEAR_FILE), buf.getvalue())
+    if others:
+        _write_bytes(_join(root, ESTIMATORS_FILE), pickle.dumps(others, protocol=pickle.HIGHEST_PROTOCOL))
+    if artifacts.store_mix is not None:
+        write_df(artifacts.store_mix, _join(root, STORE_MIX_FILE))
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "code_version": code_version(),
+        "settings": _settings(),
+        # Feature schema: the spec that produces the features and their column order
+        "feature_spec": artifacts.spec.text,
+        "feature_cols": artifacts.feature_cols,
+        "target_col": artifacts.target_col,
+        "trained_through": artifacts.trained_through.isoformat() if artifacts.trained_through else None,
+        "store_groups": artifacts.store_groups,
+        "validation_mae": artifacts.validation_mae,
+        "linear_models": keys,
+        "other_models": sorted(others),
+    }
+    _write_bytes(_join(root, MANIFEST_FILE), json.dumps(manifest, indent=2).encode())
+    _write_bytes(_join(models_dir, LATEST), version.encode())
+    logger.info("Saved model artifacts %s (%s linear, %s other models) to %s", version, len(keys), len(others), root)
+    artifacts.version = version
+    return version
+
+
+def load_manifest(models_dir: Optional[str] = None, version: Optional[str] = None) -> Optional[dict]:
+    models_dir = models_dir or paths.models_dir
+    version = version or latest_version(models_dir)
+    if version is None:
+        return None
+    return json.loads(_read_bytes(_join(models_dir, version, MANIFEST_FILE)))
+
+
+def load_artifacts(models_dir: Optional[str] = None, version: Optional[str] = None) -> Optional[ModelArtifacts]:
+    models_dir = models_dir or paths.models_dir
+    manifest = load_manifest(models_dir, version)
+    if manifest is None:
+        logger.info("No model artifacts under %s", models_dir)
+        return None
+    root = _join(models_dir, manifest["version"])
+    spec = parse_spec(manifest["feature_spec"])
+    if spec.names != manifest["feature_cols"]:
+        # Feature naming changed since the artifact was written; its coefficients would
+        # be applied to the wrong columns
+        raise ValueError(
+            f"Artifact {manifest['version']} feature schema {manifest['feature_cols']} "
+            f"does not match its spec {spec.names}"
+        )
+
+    models: dict[str, Any] = {}
+    with np.load(io.BytesIO(_read_bytes(_join(root, LINEAR_FILE)))) as arrays:
+        for i, key in enumerate(arrays["keys"].tolist()):
+            models[key] = linear_from_arrays(
+                arrays["coef"][i], arrays["intercept"][i], arrays["gram"][i], arrays["xty"][i], arrays["n_rows"][i]
+            )
+    if manifest["other_models"]:
+        models.update(pickle.loads(_read_bytes(_join(root, ESTIMATORS_FILE))))
+    mix_uri = _join(root, STORE_MIX_FILE)
+    store_mix = pl.read_parquet(io.BytesIO(_read_bytes(mix_uri))) if exists(mix_uri) else None
+
+    trained_through = manifest.get("trained_through")
+    artifacts = ModelArtifacts(
+        model=models.pop(GLOBAL_KEY),
+        feature_cols=manifest["feature_cols"],
+        target_col=manifest["target_col"],
+        registry=models,
+        store_groups=manifest["store_groups"],
+        validation_mae=manifest["validation_mae"],
+        spec=spec,
+        store_mix=store_mix,
+        trained_through=date.fromisoformat(trained_through) if trained_through else None,
+        version=manifest["version"],
+    )
+    logger.info("Loaded model artifacts %s (trained through %s)", artifacts.version, trained_through)
+    return artifacts
+
+
+def load_for_warm_start(models_dir: Optional[str] = None) -> Optional[ModelArtifacts]:
+    manifest = load_manifest(models_dir)
+    if manifest is None:
+        return None
+    if manifest.get("settings") != _settings():
+        logger.info("Latest artifact %s was trained with other settings; training from scratch", manifest["version"])
+        return None
+    return load_artifacts(models_dir, manifest["version"])
+
+
+def _refit(model: Any, X: np.ndarray, y: np.ndarray) -> Any:
+    if hasattr(model, "gram_"):
+        return refit_linear(model, X, y, modeling.refit_decay)
+    if type(model).__name__ == "XGBRegressor":
+        # xgboost continues boosting from the prior booster natively
+        return type(model)(**model.get_params()).fit(X, y, xgb_model=model.get_booster(), verbose=False)
+    delta_type = "linear" if linear_coefficients(model) is not None else "hist_gb"
+    residual = y - model.predict(X)
+    return ResidualStack(model, fit_estimator(delta_type, X, residual, max_iter=modeling.refit_iter))
+
+
+def warm_refit(
+    prior: ModelArtifacts, daily: pl.DataFrame, store_mix: Optional[pl.DataFrame] = None
+) -> ModelArtifacts:
+    # Update the prior artifact with days after prior.trained_through. Features are
+    # computed over the full history (so lags of the new days are right), but only the
+    # new rows are fitted.
+    store_mix = store_mix if store_mix is not None else prior.store_mix
+    sup = supervised_frame(daily, prior.spec, store_mix)
+    if prior.trained_through is not None:
+        sup = sup.filter(pl.col("date") > prior.trained_through)
+    if sup.height == 0:
+        logger.info("No days after %s; reusing model artifacts %s", prior.trained_through, prior.version)
+        return prior
+
+    def xy(frame: pl.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        return frame.select(prior.feature_cols).to_numpy(), frame.get_column(prior.target_col).to_numpy()
+
+    registry = dict(prior.registry)
+    if registry:
+        keyed = sup.with_columns(pl.col("store_id").cast(pl.Utf8).replace(prior.store_groups).alias("_key"))
+        for (key,), rows in keyed.partition_by("_key", as_dict=True).items():
+            if key in registry:
+                registry[key] = _refit(registry[key], *xy(rows))
+    artifacts = ModelArtifacts(
+        model=_refit(prior.model, *xy(sup)),
+        feature_cols=prior.feature_cols,
+        target_col=prior.target_col,
+        registry=registry,
+        store_groups=prior.store_groups,
+        validation_mae=prior.validation_mae,
+        spec=prior.spec,
+        store_mix=store_mix if prior.spec.needs_mix else None,
+        trained_through=sup.get_column("date").max(),
+    )
+    logger.info(
+        "Warm-started artifacts %s with %s rows through %s", prior.version, sup.height, artifacts.trained_through
+    )
+    return artifacts
@@ -1,62 +1,536 @@
 from __future__ import annotations
 
+import argparse
 import os
+import shutil
+import tempfile
 from datetime import date
 
 import polars as pl
 
-from .config import paths, modeling
-from .features import customer_features, daily_store_sales
-from .ingest import read_customers, read_sales, write_df
+from .backtest import run_backtest
+from .cache import StageCache
+from .config import backtest as backtest_config
+from .config import cache as cache_config
+from .config import metrics as metrics_config
+from .config import execution, output, outofcore, paths, modeling
+from .config import hierarchy as hierarchy_config
+from .config import validation as validation_config
+from .dag import DAG
+from .datasets import write_dataset
+from .feature_specs import parse_spec
+from .features import customer_features, daily_store_sales, fill_missing_time_series, store_customer_mix
+from .filesystems import is_remote, makedirs
+from .hierarchy import hierarchical_forecast, store_product_sales
+from .incremental import (
+    apply_partitions,
+    finalize_customer_features,
+    finalize_daily,
+    load_state,
+    new_partitions,
+    save_state,
+)
+from .ingest import (
+    input_fingerprint,
+    published,
+    read_customers,
+    read_daily,
+    read_sales,
+    read_table,
+    write_df,
+)
 from .logging_utils import configure_logging, get_logger
-from .model import forecast, train_baseline
+from .model import forecast
+from .model_store import load_artifacts, load_for_warm_start, save_artifacts, warm_refit
+from .outofcore import customer_features_out_of_core
+from .partitioned import train_models
+from .profiling import RunReport
+from .schemas import SALES, conform
+from .single_pass import fold_sales, spill_sales
 from .transform import clean_customers, clean_sales
+from .validation import quarantine_dir, sales_validator, validate_customers, validate_sales
 
 
 logger = get_logger(__name__)
 
 
+def _record_validation(report: RunReport, summary) -> None:
+    report.attributes.setdefault("validation", {})[summary.table] = summary.to_dict()
+
+
+def _clean(raw: pl.DataFrame, table: str, output_dir: str, report: RunReport) -> pl.DataFrame:
+    # clean_sales / clean_customers, plus rule counts, quarantine and sketches when
+    # DATA_VALIDATION is on (a cache hit skips both)
+    if not validation_config.enabled:
+        return clean_sales(raw) if table == "sales" else clean_customers(raw)
+    validate = validate_sales if table == "sales" else validate_customers
+    clean, summary = validate(raw, quarantine_dir(output_dir))
+    _record_validation(report, summary)
+    return clean
+
+
+def _add_feature_stages(
+    dag: DAG,
+    sales_path: str,
+    customers_path: str,
+    output_dir: str,
+    lazy: bool,
+    explain: bool,
+    cache: StageCache,
+    keys: dict[str, str],
+    needs_mix: bool,
+) -> None:
+    # Stages producing daily_store_sales, customer_features and store_customer_mix (and
+    # store_product_sales in hierarchical mode)
+    report = dag.report
+    validate = validation_config.enabled
+    mix_out = ("store_customer_mix",) if needs_mix else ()
+    hierarchical = hierarchy_config.enabled
+    product_out = ("store_product_sales",) if hierarchical else ()
+
+    def cached(stage: str, key: str, value):
+        cache.put(stage, key, value)
+        return value
+
+    if outofcore.enabled:
+        # Sales and customers are only ever streamed. Sales are scanned once, to a spill
+        # that daily_store_sales (and store_product_sales) are folded from while customer
+        # features are built from disk-spilled customer_id buckets of it, written straight
+        # into the customer_features/ dataset. The two consumers run concurrently; the
+        # spill is removed after both (and kept for a resumed run when one fails).
+        def spill() -> str:
+            spill_dir = tempfile.mkdtemp(prefix="sales-spill-", dir=outofcore.spill_dir or None)
+            path = os.path.join(spill_dir, "sales.parquet")
+            spill_sales(sales_path, path, explain=explain)
+            return path
+
+        def fold(path: str):
+            daily = cache.get("daily_store_sales", keys["daily"])
+            products = cache.get("store_product_sales", keys["products"]) if hierarchical else None
+            if daily is None or (hierarchical and products is None):
+                aggs = fold_sales(path, store_product=hierarchical)
+                daily = cached("daily_store_sales", keys["daily"], aggs.daily_store_sales)
+                if hierarchical:
+                    products = cached("store_product_sales", keys["products"], aggs.store_product_sales)
+            return (daily, products) if hierarchical else daily
+
+        def features_out_of_core(path: str):
+            bucketed = customer_features_out_of_core(
+                sales_path, customers_path, os.path.join(output_dir, "customer_features"), store_mix=needs_mix,
+                sales=conform(pl.scan_parquet(path), SALES),
+            )
+            report.attributes["customer_buckets"] = bucketed.n_buckets
+            logger.info("Wrote %s customer feature rows in %s buckets", bucketed.rows, bucketed.n_buckets)
+            return bucketed.store_mix if needs_mix else ()
+
+        dag.add("spill_sales", spill, outputs=("sales_spill",))
+        dag.add("fold_sales", fold, inputs=("sales_spill",), outputs=("daily_store_sales", *product_out))
+        dag.add("customer_features_out_of_core", features_out_of_core, inputs=("sales_spill",), outputs=mix_out)
+        dag.add(
+            "remove_sales_spill", lambda path: shutil.rmtree(os.path.dirname(path), ignore_errors=True),
+            inputs=("sales_spill",), after=("fold_sales", "customer_features_out_of_core"),
+        )
+        return
+
+    if lazy:
+        # One streaming scan of sales to a spill, folded batch by batch into every sales
+        # output and the sales validator; customers (a dimension table) are read once
+        def features_lazy():
+            customers = _clean(read_customers(customers_path), "customers", output_dir, report)
+            validator = sales_validator(quarantine_dir(output_dir)) if validate else None
+            with tempfile.TemporaryDirectory(prefix="sales-spill-", dir=outofcore.spill_dir or None) as spill_dir:
+                path = os.path.join(spill_dir, "sales.parquet")
+                spill_sales(sales_path, path, validate=validate, explain=explain)
+                aggs = fold_sales(path, customers, store_mix=needs_mix, store_product=hierarchical, validator=validator)
+            if validator is not None:
+                _record_validation(report, validator.finish())
+            out = (
+                cached("daily_store_sales", keys["daily"], aggs.daily_store_sales),
+                cached("customer_features", keys["feats"], aggs.customer_features),
+            )
+            if needs_mix:
+                out += (cached("store_customer_mix", keys["mix"], aggs.store_customer_mix),)
+            if hierarchical:
+                out += (cached("store_product_sales", keys["products"], aggs.store_product_sales),)
+            return out
+
+        dag.add(
+            "features_lazy", features_lazy,
+            outputs=("daily_store_sales", "customer_features", *mix_out, *product_out),
+        )
+        return
+
+    # Ingest + transform
+    dag.add(
+        "clean_sales",
+        lambda: cache.get_or_compute(
+            "clean_sales", keys["sales"], lambda: _clean(read_sales(sales_path), "sales", output_dir, report)
+        ),
+        outputs=("sales",),
+    )
+    dag.add(
+        "clean_customers",
+        lambda: cache.get_or_compute(
+            "clean_customers", keys["customers"],
+            lambda: _clean(read_customers(customers_path), "customers", output_dir, report),
+        ),
+        outputs=("customers",),
+    )
+    # Feature engineering; customer_features does not wait for daily_store_sales
+    dag.add(
+        "daily_store_sales",
+        lambda sales: cached("daily_store_sales", keys["daily"], daily_store_sales(sales)),
+        inputs=("sales",), outputs=("daily_store_sales",),
+    )
+    dag.add(
+        "customer_features",
+        lambda sales, customers: cached("customer_features", keys["feats"], customer_features(sales, customers)),
+        inputs=("sales", "customers"), outputs=("customer_features",),
+    )
+    if needs_mix:
+        dag.add(
+            "store_customer_mix",
+            lambda sales, feats: cached("store_customer_mix", keys["mix"], store_customer_mix(sales, feats)),
+            inputs=("sales", "customer_features"), outputs=("store_customer_mix",),
+        )
+    if hierarchical:
+        dag.add(
+            "store_product_sales",
+            lambda sales: cached("store_product_sales", keys["products"], store_product_sales(sales)),
+            inputs=("sales",), outputs=("store_product_sales",),
+        )
+
+
+def pipeline_dag(
+    sales_path: str,
+    customers_path: str,
+    output_dir: str,
+    lazy: bool | None = None,
+    explain: bool | None = None,
+    cache: StageCache | None = None,
+    report: RunReport | None = None,
+) -> DAG:
+    # The whole local pipeline as a stage DAG, with the stage cache's hits seeded as
+    # values; run_local_pipeline runs it, dataproc_job adds its upload stages first
+    lazy = execution.lazy if lazy is None else lazy
+    explain = execution.explain_plan if explain is None else explain
+    cache = cache or StageCache.disabled()
+    dag = DAG(report)
+
+    # Stage keys chain from the input fingerprints, so a hit on a downstream stage
+    # never needs its upstream stages to run
+    validate = validation_config.enabled
+    k_sales = cache.key("clean_sales", input_fingerprint(sales_path), validate) if cache.enabled else ""
+    k_customers = cache.key("clean_customers", input_fingerprint(customers_path), validate) if cache.enabled else ""
+    keys = {
+        "sales": k_sales,
+        "customers": k_customers,
+        "daily": cache.key("daily_store_sales", k_sales),
+        "feats": cache.key("customer_features", k_sales, k_customers),
+        "mix": cache.key("store_customer_mix", k_sales, k_customers),
+        "products": cache.key("store_product_sales", k_sales),
+    }
+    # Customer-mix model features need sales, so they are derived alongside the features
+    needs_mix = parse_spec(modeling.feature_spec).needs_mix
+
+    if outofcore.enabled:
+        seeded = {}
+    else:
+        daily = cache.get("daily_store_sales", keys["daily"])
+        cust_feats = cache.get("customer_features", keys["feats"])
+        store_mix = cache.get("store_customer_mix", keys["mix"]) if needs_mix else None
+        products = cache.get("store_product_sales", keys["products"]) if hierarchy_config.enabled else None
+        # The lazy plan produces all of them at once, so a partial hit still runs it
+        hit = (
+            daily is not None and cust_feats is not None
+            and (store_mix is not None or not needs_mix)
+            and (products is not None or not hierarchy_config.enabled)
+        )
+        seeded = {} if lazy and not hit else {
+            name: value for name, value in [
+                ("daily_store_sales", daily), ("customer_features", cust_feats), ("store_customer_mix", store_mix),
+                ("store_product_sales", products),
+            ] if value is not None
+        }
+    if not needs_mix:
+        seeded["store_customer_mix"] = None
+    dag.values.update(seeded)
+
+    _add_feature_stages(dag, sales_path, customers_path, output_dir, lazy, explain, cache, keys, needs_mix)
+    add_publish_stages(
+        dag, output_dir, cache=cache, daily_key=keys["daily"], mix_key=keys["mix"] if needs_mix else "",
+        customers=not outofcore.enabled, hierarchical=hierarchy_config.enabled,
+    )
+    return dag
+
+
 def run_local_pipeline(
     sales_path: str,
     customers_path: str,
     output_dir: str | None = None,
+    lazy: bool | None = None,
+    explain: bool | None = None,
+    cache: StageCache | None = None,
+    report: RunReport | None = None,
 ):
     configure_logging()
     output_dir = output_dir or paths.data_processed_dir
-    os.makedirs(output_dir, exist_ok=True)
+    makedirs(output_dir)
+    if cache is None:
+        cache = StageCache() if cache_config.enabled else StageCache.disabled()
+    # A caller-supplied report is emitted by the caller (e.g. after uploads in dataproc_job)
+    owns_report = report is None
+    report = report or RunReport()
+
+    pipeline_dag(sales_path, customers_path, output_dir, lazy, explain, cache, report).run()
+    logger.info("Pipeline completed. Outputs saved to %s", output_dir)
+    if cache.enabled:
+        report.attributes["stage_cache"] = cache.report()
+        logger.info("Stage cache report: %s", cache.report())
+    if owns_report and metrics_config.run_report:
+        report.write(output_dir)
+    return report
+
+
+def _write_table(df: pl.DataFrame, output_dir: str, name: str, partition_by: tuple[str, ...] = ()) -> None:
+    if output.partitioned:
+        # <name>/ as a hive-partitioned dataset committed through its manifest
+        write_dataset(df, os.path.join(output_dir, name), partition_by)
+    else:
+        write_df(df, os.path.join(output_dir, f"{name}.parquet"))
+
+
+def _write_csv(df: pl.DataFrame, output_dir: str, name: str) -> None:
+    # CSVs for interoperability (e.g., Ruby report service)
+    write_df(df, os.path.join(output_dir, f"{name}.csv"))
 
-    # Ingest
-    raw_sales = read_sales(sales_path)
-    raw_customers = read_customers(customers_path)
 
-    # Transform
-    sales = clean_sales(raw_sales)
-    customers = clean_customers(raw_customers)
+def _write_ipc(df: pl.DataFrame, output_dir: str, name: str) -> None:
+    # Zero-copy hand-off to later readers (forecast service, forecast-only runs, export_csv)
+    write_df(df, os.path.join(output_dir, f"{name}.arrow"))
 
-    # Feature engineering
-    daily = daily_store_sales(sales)
-    cust_feats = customer_features(sales, customers)
 
-    # Persist processed datasets
-    write_df(daily, os.path.join(output_dir, "daily_store_sales.parquet"))
-    write_df(cust_feats, os.path.join(output_dir, "customer_features.parquet"))
-    # Also write CSVs for interoperability (e.g., Ruby report service)
-    write_df(daily, os.path.join(output_dir, "daily_store_sales.csv"))
-    write_df(cust_feats, os.path.join(output_dir, "customer_features.csv"))
+def _writes_ipc(output_dir: str) -> bool:
+    # Memory mapping needs a local file; gs:// outputs get Parquet (and CSV) only
+    return output.ipc and not is_remote(output_dir)
+
+
+def write_output(df: pl.DataFrame, output_dir: str, name: str, partition_by: tuple[str, ...] = ()) -> None:
+    _write_table(df, output_dir, name, partition_by)
+    if _writes_ipc(output_dir):
+        _write_ipc(df, output_dir, name)
+    if name in output.csv:
+        _write_csv(df, output_dir, name)
+
+
+def add_write_stages(dag: DAG, value: str, output_dir: str, name: str | None = None, partition_by=()) -> None:
+    # write_<name> (Parquet file or dataset), write_<name>_ipc and write_<name>_csv when
+    # configured, each run as soon as the value exists
+    name = name or value
+    dag.add(f"write_{name}", lambda df: _write_table(df, output_dir, name, partition_by), inputs=(value,))
+    if _writes_ipc(output_dir):
+        dag.add(f"write_{name}_ipc", lambda df: _write_ipc(df, output_dir, name), inputs=(value,))
+    if name in output.csv:
+        dag.add(f"write_{name}_csv", lambda df: _write_csv(df, output_dir, name), inputs=(value,))
+
+
+def export_csv(output_dir: str, name: str, force: bool = False) -> str:
+    # <name>.csv on demand, converted from the published output (memory-mapped .arrow
+    # when present). A local CSV newer than its source is reused as is.
+    source, target = published(output_dir, name), os.path.join(output_dir, f"{name}.csv")
+    if not force and not is_remote(target) and os.path.exists(target):
+        if os.path.getmtime(target) >= os.path.getmtime(source):
+            return target
+    _write_csv(read_table(source), output_dir, name)
+    return target
+
+
+def add_publish_stages(
+    dag: DAG,
+    output_dir: str,
+    cache: StageCache | None = None,
+    daily_key: str = "",
+    mix_key: str = "",
+    customers: bool = True,
+    hierarchical: bool = False,
+) -> None:
+    # Writes of the processed datasets, modeling and forecasting, on top of the values
+    # daily_store_sales, customer_features (when customers), store_customer_mix and
+    # store_product_sales (when hierarchical)
+    cache = cache or StageCache.disabled()
+    report = dag.report
+    add_write_stages(dag, "daily_store_sales", output_dir, partition_by=output.partition_daily)
+    if customers:
+        add_write_stages(dag, "customer_features", output_dir, partition_by=output.partition_customers)
 
     # Modeling and forecasting
-    artifacts = train_baseline(daily)
-    horizon = modeling.forecast_horizon_days
-    fcst = forecast(artifacts, daily, horizon)
-    write_df(fcst, os.path.join(output_dir, "forecast.parquet"))
-    write_df(fcst, os.path.join(output_dir, "forecast.csv"))
+    model_input = "daily_store_sales"
+    if modeling.fill_gaps:
+        # Gap-filled series only feed the model; the published daily dataset keeps observed days
+        model_input = "model_input"
+        dag.add(
+            "fill_missing_time_series",
+            lambda daily: fill_missing_time_series(daily, "store_id", "date", ["qty_sum", "rev_sum", "num_txn"]),
+            inputs=("daily_store_sales",), outputs=(model_input,),
+        )
+    if backtest_config.enabled:
+        # Rolling-origin evaluation of the candidate grid, published next to the forecast
+        def backtest(model_input: pl.DataFrame, store_mix: pl.DataFrame | None):
+            k_bt = cache.key(
+                "backtest", daily_key, mix_key, modeling.fill_gaps, modeling.validation_days,
+                modeling.feature_spec, modeling.forecast_horizon_days, backtest_config,
+            )
+            result = cache.get_or_compute("backtest", k_bt, lambda: run_backtest(model_input, store_mix=store_mix))
+            report.attributes["backtest"] = {"best": result.best, "summary": result.summary.to_dicts()}
+            return result.folds, result.stores
+
+        dag.add(
+            "backtest", backtest, inputs=(model_input, "store_customer_mix"),
+            outputs=("backtest_folds", "backtest_stores"), exclusive=True,
+        )
+        add_write_stages(dag, "backtest_folds", output_dir)
+        add_write_stages(dag, "backtest_stores", output_dir)
+
+    def train(model_input: pl.DataFrame, store_mix: pl.DataFrame | None):
+        prior = load_for_warm_start() if modeling.warm_start else None
+        if prior is not None:
+            # Refit the saved models on the days they have not seen instead of retraining
+            k_train = cache.key("warm_refit", prior.version, daily_key, mix_key, modeling.refit_decay)
+            artifacts = warm_refit(prior, model_input, store_mix)
+        else:
+            k_train = cache.key(
+                "train_baseline", daily_key, modeling.validation_days, modeling.model_type, modeling.fill_gaps,
+                modeling.granularity, modeling.n_clusters, modeling.min_store_rows,
+                modeling.gb_max_iter, modeling.gb_learning_rate, modeling.early_stopping_rounds,
+                modeling.feature_spec, mix_key,
+            )
+            artifacts = cache.get_or_compute("train_baseline", k_train, lambda: train_models(model_input, store_mix))
+        if modeling.persist and artifacts is not prior:
+            save_artifacts(artifacts)
+        if artifacts.version:
+            report.attributes["model_version"] = artifacts.version
+        return artifacts, k_train
+
+    def forecast_stage(artifacts, k_train: str, model_input: pl.DataFrame) -> pl.DataFrame:
+        horizon = modeling.forecast_horizon_days
+        k_fcst = cache.key("forecast", k_train, daily_key, horizon)
+        return cache.get_or_compute("forecast", k_fcst, lambda: forecast(artifacts, model_input, horizon))
+
+    dag.add(
+        "train_baseline", train, inputs=(model_input, "store_customer_mix"),
+        outputs=("model_artifacts", "train_key"), exclusive=True,
+    )
+    dag.add("forecast", forecast_stage, inputs=("model_artifacts", "train_key", model_input), outputs=("forecast",))
+    add_write_stages(dag, "forecast", output_dir, partition_by=output.partition_forecast)
+    if hierarchical:
+        # Store x product forecasts reconciled with the model's store forecast and the chain
+        dag.add(
+            "hierarchical_forecast", hierarchical_forecast, inputs=("store_product_sales", "forecast"),
+            outputs=("forecast_store_product", "forecast_hierarchy"),
+        )
+        add_write_stages(dag, "forecast_store_product", output_dir, partition_by=output.partition_forecast)
+        add_write_stages(dag, "forecast_hierarchy", output_dir)
+
+
+def publish_and_forecast(
+    daily: pl.DataFrame,
+    cust_feats: pl.DataFrame | None,
+    output_dir: str,
+    cache: StageCache | None = None,
+    daily_key: str = "",
+    report: RunReport | None = None,
+    store_mix: pl.DataFrame | None = None,
+    mix_key: str = "",
+) -> None:
+    dag = DAG(report)
+    add_publish_stages(dag, output_dir, cache, daily_key, mix_key, customers=cust_feats is not None)
+    dag.run({"daily_store_sales": daily, "customer_features": cust_feats, "store_customer_mix": store_mix})
     logger.info("Pipeline completed. Outputs saved to %s", output_dir)
 
 
+def run_forecast_only(
+    daily_path: str,
+    output_dir: str | None = None,
+    models_dir: str | None = None,
+    version: str | None = None,
+    report: RunReport | None = None,
+) -> RunReport:
+    # Serving path: forecast published daily_store_sales with a saved model (the latest
+    # by default) and no training pass
+    configure_logging()
+    output_dir = output_dir or paths.data_processed_dir
+    makedirs(output_dir)
+    owns_report = report is None
+    report = report or RunReport()
+
+    with report.stage("load_artifacts"):
+        artifacts = load_artifacts(models_dir, version)
+        if artifacts is None:
+            raise FileNotFoundError(f"No model artifacts under {models_dir or paths.models_dir}")
+        report.attributes["model_version"] = artifacts.version
+    with report.stage("read_daily") as st:
+        daily = read_daily(daily_path)
+        if modeling.fill_gaps:
+            daily = fill_missing_time_series(daily, "store_id", "date", ["qty_sum", "rev_sum", "num_txn"])
+        st.rows_out = daily.height
+    with report.stage("forecast", rows_in=daily.height) as st:
+        fcst = forecast(artifacts, daily, modeling.forecast_horizon_days)
+        st.rows_out = fcst.height
+    with report.stage("write_forecast", rows_in=fcst.height):
+        write_output(fcst, output_dir, "forecast", output.partition_forecast)
+    if owns_report and metrics_config.run_report:
+        report.write(output_dir)
+    return report
+
+
+def run_incremental_pipeline(
+    sales_partitions: dict[str, str],
+    customers_path: str,
+    output_dir: str | None = None,
+    state_dir: str | None = None,
+    fingerprints: dict[str, str] | None = None,
+    report: RunReport | None = None,
+) -> list[str]:
+    # sales_partitions maps partition id -> local file; ids already recorded in the
+    # state manifest are skipped. Returns the partition ids merged by this run.
+    configure_logging()
+    output_dir = output_dir or paths.data_processed_dir
+    state_dir = state_dir or os.path.join(output_dir, "state")
+    fingerprints = fingerprints or {p: "" for p in sales_partitions}
+    owns_report = report is None
+    report = report or RunReport()
+
+    with report.stage("merge_partitions") as st:
+        state = load_state(state_dir)
+        todo = new_partitions(state, {p: fingerprints.get(p, "") for p in sales_partitions})
+        logger.info("Incremental run: %s new of %s partitions", len(todo), len(sales_partitions))
+        state = apply_partitions(state, todo, sales_partitions)
+        save_state(state, state_dir)
+        st.rows_out = state.daily.height + state.customers.height
+
+    with report.stage("clean_customers") as st:
+        customers = clean_customers(read_customers(customers_path))
+        st.rows_out = customers.height
+    publish_and_forecast(
+        finalize_daily(state), finalize_customer_features(state, customers), output_dir, report=report
+    )
+    if owns_report and metrics_config.run_report:
+        report.write(output_dir)
+    return sorted(todo)
+
+
 if __name__ == "__main__":
-    # Defaults for local run
-    sales_file = os.path.join(paths.data_raw_dir, "sales.csv")
-    customers_file = os.path.join(paths.data_raw_dir, "customers.csv")
-    run_local_pipeline(sales_file, customers_file, paths.data_processed_dir)
+    parser = argparse.ArgumentParser(description="Run the pipeline locally on DATA_RAW_DIR")
+    parser.add_argument("--export-csv", help="comma-separated outputs to export as CSV from the published data, then exit")
+    args = parser.parse_args()
+    if args.export_csv:
+        configure_logging()
+        for name in args.export_csv.split(","):
+            export_csv(paths.data_processed_dir, name.strip(), force=True)
+    else:
+        # Defaults for local run
+        sales_file = os.path.join(paths.data_raw_dir, "sales.csv")
+        customers_file = os.path.join(paths.data_raw_dir, "customers.csv")
+        run_local_pipeline(sales_file, customers_file, paths.data_processed_dir)
 
 
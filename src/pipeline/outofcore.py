@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+import math
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Optional
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from .config import outofcore
+from .datasets import DatasetWriter
+from .features import customer_features, finalize_store_mix, store_customer_mix, store_mix_partials
+from .ingest import scan_customers, scan_sales
+from .logging_utils import get_logger
+from .schemas import CUSTOMERS, SALES, conform
+from .transform import clean_customers, clean_sales
+
+
+logger = get_logger(__name__)
+
+BUCKET_COL = "bucket"
+_HASH = "_hash"
+# In-memory size of a bucket's group_by + join relative to its uncompressed Parquet size
+OVERHEAD = 4.0
+
+
+@dataclass
+class BucketedFeatures:
+    root: str  # customer_features dataset, hive-partitioned by bucket
+    n_buckets: int
+    rows: int
+    store_mix: Optional[pl.DataFrame] = None
+
+
+def _spill(lf: pl.LazyFrame, path: str) -> tuple[int, int]:
+    # Stream a cleaned, projected input to one Parquet file with the engine's bounded
+    # memory; returns (rows, uncompressed bytes)
+    lf.sink_parquet(path, row_group_size=outofcore.spill_row_group_size)
+    meta = pq.ParquetFile(path).metadata
+    return meta.num_rows, sum(meta.row_group(i).total_byte_size for i in range(meta.num_row_groups))
+
+
+def _split(path: str, out_dir: str, n_buckets: int, batch_rows: int) -> None:
+    # Hash-partition a spill file into <out_dir>/<bucket>.parquet, one batch at a time
+    writers: dict[int, pq.ParquetWriter] = {}
+    try:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_rows):
+            df = pl.from_arrow(batch).with_columns((pl.col(_HASH) % n_buckets).alias(BUCKET_COL))
+            for (b,), part in df.partition_by(BUCKET_COL, as_dict=True, include_key=False).items():
+                table = part.drop(_HASH).to_arrow()
+                if b not in writers:
+                    writers[b] = pq.ParquetWriter(os.path.join(out_dir, f"{b}.parquet"), table.schema)
+                writers[b].write_table(table)
+    finally:
+        for w in writers.values():
+            w.close()
+    os.remove(path)
+
+
+def _read_bucket(out_dir: str, b: int, empty: pl.DataFrame, schema: dict[str, pl.DataType]) -> pl.DataFrame:
+    path = os.path.join(out_dir, f"{b}.parquet")
+    return conform(pl.read_parquet(path) if os.path.exists(path) else empty, schema)
+
+
+def plan_buckets(total_bytes: int, budget_bytes: int, workers: int, min_buckets: int = 1) -> tuple[int, int]:
+    # Enough buckets that `workers` of them in flight fit the budget; fewer workers when
+    # a single bucket is already as large as the budget allows
+    n = max(min_buckets, math.ceil(OVERHEAD * total_bytes * workers / max(budget_bytes, 1)), 1)
+    per_bucket = OVERHEAD * total_bytes / n
+    return n, max(1, min(workers, n, int(budget_bytes // per_bucket) if per_bucket else workers))
+
+
+def customer_features_out_of_core(
+    sales_path: str,
+    customers_path: str,
+    root: str,
+    store_mix: bool = False,
+    budget_bytes: Optional[int] = None,
+    n_buckets: Optional[int] = None,
+    workers: Optional[int] = None,
+    sales: Optional[pl.LazyFrame] = None,
+) -> BucketedFeatures:
+    # Same rows as features.customer_features, without holding sales or customers in
+    # memory: both are streamed to disk, split into hash buckets of customer_id sized to
+    # the memory budget, and each bucket's group_by + join runs on its own (a few at a
+    # time) and is written straight into the partitioned customer_features dataset.
+    # sales, when given, is the already cleaned sales (e.g. a spill) instead of a rescan.
+    budget_bytes = budget_bytes or outofcore.memory_budget_mb * 1024 * 1024
+    workers = workers or outofcore.workers or os.cpu_count() or 1
+    if sales is None:
+        sales = clean_sales(scan_sales(sales_path))
+    customers = clean_customers(scan_customers(customers_path))
+    has_customer = "customer_id" in sales.collect_schema().names()
+
+    spill_dir = tempfile.mkdtemp(prefix="customer-buckets-", dir=outofcore.spill_dir or None)
+    try:
+        key_hash = pl.col("customer_id").cast(pl.Utf8).hash(seed=0).alias(_HASH)
+        sales_cols = ["customer_id", "revenue", "date"] + (["store_id"] if store_mix else [])
+        sales_rows = sales_bytes = 0
+        if has_customer:
+            sales_rows, sales_bytes = _spill(
+                sales.select(sales_cols).drop_nulls(["customer_id"])
+                .with_columns([pl.col("customer_id").cast(pl.Utf8), key_hash]),
+                os.path.join(spill_dir, "sales.parquet"),
+            )
+        cust_rows, cust_bytes = _spill(
+            customers.with_columns([pl.col("customer_id").cast(pl.Utf8), key_hash]),
+            os.path.join(spill_dir, "customers.parquet"),
+        )
+        total = sales_bytes + cust_bytes
+        n, parallel = plan_buckets(total, budget_bytes, workers, n_buckets or outofcore.n_buckets)
+        logger.info(
+            "Customer features out of core: %s sales / %s customer rows (%.1f MiB) in %s buckets, %s at a time",
+            sales_rows, cust_rows, total / 2**20, n, parallel,
+        )
+
+        # Split batches hold a fraction of the budget; the n bucket writers stream out
+        row_bytes = max(total / max(sales_rows + cust_rows, 1), 1.0)
+        batch_rows = max(1024, int(budget_bytes / OVERHEAD / row_bytes))
+        dirs = {}
+        for name in (["sales"] if has_customer else []) + ["customers"]:
+            dirs[name] = os.path.join(spill_dir, name)
+            os.makedirs(dirs[name])
+            _split(os.path.join(spill_dir, f"{name}.parquet"), dirs[name], n, batch_rows)
+
+        sales_schema = sales.collect_schema()
+        empty_sales = (
+            pl.DataFrame(schema={c: sales_schema[c] for c in sales_cols}).with_columns(pl.col("customer_id").cast(pl.Utf8))
+            if has_customer else pl.DataFrame(schema={"date": pl.Date})
+        )
+        empty_customers = pl.DataFrame(schema=customers.collect_schema()).with_columns(
+            pl.col("customer_id").cast(pl.Utf8)
+        )
+        schema = customer_features(empty_sales, empty_customers)
+        writer = DatasetWriter(root, [BUCKET_COL])
+
+        def run(b: int) -> tuple[int, Optional[pl.DataFrame]]:
+            cust_b = _read_bucket(dirs["customers"], b, empty_customers, CUSTOMERS)
+            sales_b = _read_bucket(dirs["sales"], b, empty_sales, SALES) if has_customer else empty_sales
+            feats = customer_features(sales_b, cust_b).select(schema.columns)
+            if feats.height:
+                writer.write(feats, (b,))
+            partials = store_mix_partials(sales_b, feats) if store_mix and has_customer else None
+            return feats.height, partials
+
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            results = list(pool.map(run, range(n)))
+        writer.commit(schema.with_columns(pl.lit(0, dtype=pl.Int32).alias(BUCKET_COL)).to_arrow().schema)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    mix = None
+    if store_mix:
+        # Buckets hold disjoint customers, so their per-store partials add up exactly
+        mix = (
+            finalize_store_mix(pl.concat([p for _, p in results])) if has_customer
+            else store_customer_mix(sales, customers).collect()
+        )
+    return BucketedFeatures(root=root, n_buckets=n, rows=sum(r for r, _ in results), store_mix=mix)
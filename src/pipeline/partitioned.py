@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Optional
+
+import numpy as np
+import polars as pl
+import pyarrow as pa
+from threadpoolctl import threadpool_limits
+
+from .config import modeling
+from .estimators import fit_estimator
+from .feature_specs import DEFAULT_SPEC, FeatureSpec
+from .logging_utils import get_logger
+from .model import TARGET_COL, ModelArtifacts, supervised_frame, time_split, train_baseline
+
+
+logger = get_logger(__name__)
+
+
+def cluster_stores(daily: pl.DataFrame, n_clusters: int, seed: int = 0) -> dict[str, str]:
+    # Group stores that behave alike (level, volatility, basket size) so small stores
+    # can share a model; returns store_id -> cluster key
+    profile = (
+        daily.group_by("store_id")
+        .agg([
+            pl.col("rev_sum").mean().alias("rev_mean"),
+            (pl.col("rev_sum").std() / pl.col("rev_sum").mean()).fill_nan(0.0).fill_null(0.0).alias("rev_cv"),
+            (pl.col("rev_sum").sum() / pl.col("num_txn").sum()).alias("basket"),
+        ])
+        .sort("store_id")
+    )
+    X = np.column_stack([
+        np.log1p(profile.get_column("rev_mean").to_numpy()),
+        profile.get_column("rev_cv").to_numpy(),
+        np.log1p(profile.get_column("basket").fill_null(0.0).to_numpy()),
+    ])
+    X = (X - X.mean(axis=0)) / np.where(X.std(axis=0) > 0, X.std(axis=0), 1.0)
+    k = max(1, min(n_clusters, profile.height))
+    from sklearn.cluster import KMeans
+
+    labels = KMeans(n_clusters=k, n_init=10, random_state=seed).fit_predict(X)
+    return {s: f"cluster-{int(c)}" for s, c in zip(profile.get_column("store_id").to_list(), labels)}
+
+
+def _fit_group(
+    df: pl.DataFrame,
+    validation_days: int,
+    min_rows: int,
+    model_type: str = "linear",
+    spec: FeatureSpec = DEFAULT_SPEC,
+    store_mix: Optional[pl.DataFrame] = None,
+) -> Optional[tuple[Any, float]]:
+    sup = supervised_frame(df, spec, store_mix)
+    if sup.height < min_rows:
+        return None
+    X = sup.select(spec.names).to_numpy()
+    y = sup.get_column(TARGET_COL).to_numpy()
+    train = time_split(sup.get_column("date"), validation_days, min_rows)
+    val = ~train
+    model = fit_estimator(model_type, X[train], y[train], X[val], y[val])
+    mae = float(np.mean(np.abs(model.predict(X[val]) - y[val]))) if val.any() else float("nan")
+    return model, mae
+
+
+def _fit_shard(
+    shm_name: str,
+    size: int,
+    tasks: list[tuple[str, list[tuple[int, int]]]],
+    validation_days: int,
+    min_rows: int,
+    model_type: str = "linear",
+    threads: Optional[int] = None,
+    spec: FeatureSpec = DEFAULT_SPEC,
+    store_mix: Optional[pl.DataFrame] = None,
+) -> list[tuple[str, Optional[Any], float, int]]:
+    # Worker: attach to the parent's shared-memory Arrow IPC buffer (no copy of the
+    # data is pickled to the worker) and fit one model per task. A task is a registry
+    # key plus the (offset, length) row ranges of the stores it covers.
+    # threads caps the native (OpenMP/BLAS) pools so workers do not oversubscribe the host.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        table = pa.ipc.open_file(pa.py_buffer(shm.buf)[:size]).read_all()
+        out = []
+        with threadpool_limits(limits=threads):
+            for key, ranges in tasks:
+                df = pl.from_arrow(pa.concat_tables([table.slice(o, n) for o, n in ranges]))
+                fitted = _fit_group(df, validation_days, min_rows, model_type, spec, store_mix)
+                model, mae = fitted if fitted is not None else (None, float("nan"))
+                out.append((key, model, mae, df.height))
+                del df
+        del table
+        return out
+    finally:
+        shm.close()
+
+
+def _to_shared_memory(table: pa.Table) -> tuple[shared_memory.SharedMemory, int]:
+    sink = pa.MockOutputStream()
+    with pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    size = sink.size()
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    with pa.ipc.new_file(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), table.schema) as writer:
+        writer.write_table(table)
+    return shm, size
+
+
+def train_partitioned(
+    daily: pl.DataFrame,
+    store_groups: Optional[dict[str, str]] = None,
+    n_workers: Optional[int] = None,
+    min_rows: Optional[int] = None,
+    store_mix: Optional[pl.DataFrame] = None,
+) -> ModelArtifacts:
+    # One model per store (or per group when store_groups maps stores to clusters),
+    # fitted in a process pool over a shared-memory Arrow copy of daily_store_sales.
+    # A global model is always trained as the fallback for stores with too little history.
+    n_workers = n_workers or modeling.train_workers or os.cpu_count() or 1
+    min_rows = modeling.min_store_rows if min_rows is None else min_rows
+    validation_days = modeling.validation_days
+    model_type = modeling.model_type
+    artifacts = train_baseline(daily, store_mix)
+    # Group models share the global model's resolved feature spec
+    spec, store_mix = artifacts.spec, artifacts.store_mix
+
+    daily = daily.sort(["store_id", "date"])
+    spans = (
+        daily.with_row_index("_row")
+        .group_by("store_id", maintain_order=True)
+        .agg([pl.col("_row").first().alias("offset"), pl.len().alias("length")])
+    )
+    groups: dict[str, list[tuple[int, int]]] = {}
+    for store, offset, length in spans.iter_rows():
+        key = store_groups.get(store, store) if store_groups else store
+        groups.setdefault(key, []).append((offset, length))
+
+    # Largest groups first so stragglers do not dominate the tail
+    keys = sorted(groups, key=lambda k: -sum(n for _, n in groups[k]))
+    n_tasks = max(1, min(len(keys), n_workers * 4))
+    batches = [[(k, groups[k]) for k in keys[i::n_tasks]] for i in range(n_tasks)]
+
+    shm, size = _to_shared_memory(daily.to_arrow())
+    results = []
+    try:
+        if n_workers <= 1 or len(keys) <= 1:
+            for batch in batches:
+                results.extend(
+                    _fit_shard(shm.name, size, batch, validation_days, min_rows, model_type, None, spec, store_mix)
+                )
+        else:
+            # spawn: forking a process that already runs Polars/BLAS thread pools can deadlock
+            ctx = mp.get_context("spawn")
+            n_procs = min(n_workers, n_tasks)
+            threads = max(1, (os.cpu_count() or 1) // n_procs)
+            with ProcessPoolExecutor(max_workers=n_procs, mp_context=ctx) as pool:
+                futures = [
+                    pool.submit(
+                        _fit_shard, shm.name, size, batch, validation_days, min_rows, model_type, threads, spec, store_mix
+                    )
+                    for batch in batches
+                ]
+                for fut in futures:
+                    results.extend(fut.result())
+    finally:
+        shm.close()
+        shm.unlink()
+
+    for key, model, mae, rows in results:
+        if model is None:
+            logger.debug("Group %s has %s rows; using the global model", key, rows)
+            continue
+        artifacts.registry[key] = model
+        artifacts.validation_mae[key] = mae
+    if store_groups:
+        artifacts.store_groups = dict(store_groups)
+    maes = [m for m in artifacts.validation_mae.values() if not np.isnan(m)]
+    logger.info(
+        "Trained %s of %s %s models with %s workers; median validation MAE %.4f",
+        len(artifacts.registry), len(keys), "cluster" if store_groups else "store", n_workers,
+        float(np.median(maes)) if maes else float("nan"),
+    )
+    return artifacts
+
+
+def train_models(daily: pl.DataFrame, store_mix: Optional[pl.DataFrame] = None) -> ModelArtifacts:
+    # Dispatch on MODEL_GRANULARITY: global | store | cluster
+    if modeling.granularity == "global":
+        return train_baseline(daily, store_mix)
+    if modeling.granularity == "store":
+        return train_partitioned(daily, store_mix=store_mix)
+    if modeling.granularity == "cluster":
+        return train_partitioned(
+            daily, store_groups=cluster_stores(daily, modeling.n_clusters), store_mix=store_mix
+        )
+    raise ValueError(f"Unsupported model granularity: {modeling.granularity}")
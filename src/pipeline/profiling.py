@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Iterator, Optional
+
+from .config import metrics as metrics_config
+from .filesystems import open_output_stream
+from .logging_utils import get_logger
+
+
+logger = get_logger(__name__)
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _current_rss() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return None
+
+
+def _process_peak_rss() -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _io_counters() -> tuple[int, int]:
+    # Bytes passed through read()/write() syscalls, sockets included, so GCS transfers count too
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+class _RssSampler(threading.Thread):
+    # Tracks the peak RSS inside one stage; ru_maxrss alone only gives the process lifetime peak
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = _current_rss() or 0
+        self._stop_event = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            rss = _current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        rss = _current_rss()
+        return max(self.peak, rss or 0)
+
+
+@dataclass
+class StageMetrics:
+    # cpu_seconds, peak_rss_bytes and bytes_read/written are process-wide over the stage's
+    # wall time (library thread pools and process pools do the work, so they cannot be
+    # split per stage): they include whatever concurrent_stages did meanwhile.
+    # thread_cpu_seconds is the stage's own thread only.
+    stage: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    thread_cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    rows_in: Optional[int] = None
+    rows_out: Optional[int] = None
+    bytes_read: int = 0
+    bytes_written: int = 0
+    status: str = "ok"
+    profile_path: Optional[str] = None
+    concurrent_stages: list[str] = field(default_factory=list)  # stages that overlapped this one
+
+
+@dataclass
+class RunReport:
+    run_id: str = field(default_factory=lambda: time.strftime("%Y%m%dT%H%M%S"))
+    stages: list[StageMetrics] = field(default_factory=list)
+    started_at: float = field(default_factory=time.time)
+    profile_stage: Optional[str] = metrics_config.profile_stage
+    profile_dir: str = metrics_config.profile_dir
+    # Free-form run-level facts (e.g. stage cache hits) included in the JSON report
+    attributes: dict = field(default_factory=dict)
+    # Called with (metrics, "running") when a stage starts and (metrics, status) when it ends
+    listener: Optional[Callable[[StageMetrics, str], None]] = field(default=None, repr=False)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+    _running: dict[int, StageMetrics] = field(default_factory=dict, repr=False)
+
+    @contextmanager
+    def stage(self, name: str, rows_in: Optional[int] = None) -> Iterator[StageMetrics]:
+        m = StageMetrics(stage=name, rows_in=rows_in)
+        sampler = _RssSampler(metrics_config.rss_sample_seconds)
+        sampler.start()
+        self._enter(m)
+        read0, written0 = _io_counters()
+        wall0, cpu0, thread0 = time.perf_counter(), time.process_time(), time.thread_time()
+        profiler = cProfile.Profile() if self.profile_stage == name else None
+        if profiler is not None:
+            profiler.enable()
+        self._notify(m, "running")
+        try:
+            yield m
+        except BaseException:
+            m.status = "failed"
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                m.profile_path = self._dump_profile(name, profiler)
+            m.wall_seconds = time.perf_counter() - wall0
+            m.cpu_seconds = time.process_time() - cpu0
+            m.thread_cpu_seconds = time.thread_time() - thread0
+            read1, written1 = _io_counters()
+            m.bytes_read, m.bytes_written = read1 - read0, written1 - written0
+            m.peak_rss_bytes = sampler.stop()
+            with self._lock:
+                del self._running[id(m)]
+                self.stages.append(m)
+            self._notify(m, m.status)
+            logger.info(
+                "Stage %s: %.3fs wall, %.3fs cpu (process-wide), peak RSS %.1f MiB, rows %s -> %s%s",
+                name, m.wall_seconds, m.cpu_seconds, m.peak_rss_bytes / 2**20, m.rows_in, m.rows_out,
+                f", concurrent with {', '.join(m.concurrent_stages)}" if m.concurrent_stages else "",
+            )
+
+    def _enter(self, m: StageMetrics) -> None:
+        # Records the overlap both ways: m with every running stage, and they with m
+        with self._lock:
+            for other in self._running.values():
+                other.concurrent_stages.append(m.stage)
+                m.concurrent_stages.append(other.stage)
+            self._running[id(m)] = m
+
+    def _notify(self, m: StageMetrics, status: str) -> None:
+        # Progress reporting must never fail the stage itself
+        if self.listener is not None:
+            try:
+                self.listener(m, status)
+            except Exception as exc:
+                logger.warning("Stage listener failed for %s: %s", m.stage, exc)
+
+    def _dump_profile(self, name: str, profiler: cProfile.Profile) -> str:
+        # .prof loads in snakeviz / flameprof / speedscope; a cumulative-time summary sits next to it
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, f"{self.run_id}-{name}.prof")
+        profiler.dump_stats(path)
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(30)
+        with open(path[: -len(".prof")] + ".txt", "w") as f:
+            f.write(buf.getvalue())
+        logger.info("Wrote cProfile capture for stage %s to %s", name, path)
+        return path
+
+    def to_dict(self) -> dict:
+        return {
+            "run_id": self.run_id,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started_at)),
+            "total_wall_seconds": time.time() - self.started_at,
+            "process_peak_rss_bytes": _process_peak_rss(),
+            "stages": [asdict(m) for m in self.stages],
+            **self.attributes,
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_openmetrics(self) -> str:
+        gauges = [
+            ("wall_seconds", "Stage wall-clock time in seconds"),
+            ("cpu_seconds", "Process-wide CPU time during the stage in seconds, concurrent stages included"),
+            ("thread_cpu_seconds", "CPU time of the stage's own thread in seconds"),
+            ("peak_rss_bytes", "Process-wide peak resident set size during the stage"),
+            ("rows_in", "Rows entering the stage"),
+            ("rows_out", "Rows produced by the stage"),
+            ("bytes_read", "Process-wide bytes read during the stage"),
+            ("bytes_written", "Process-wide bytes written during the stage"),
+        ]
+        lines = []
+        for attr, help_text in gauges:
+            metric = f"pipeline_stage_{attr}"
+            lines.append(f"# HELP {metric} {help_text}.")
+            lines.append(f"# TYPE {metric} gauge")
+            for m in self.stages:
+                value = getattr(m, attr)
+                if value is not None:
+                    lines.append(f'{metric}{{run_id="{self.run_id}",stage="{m.stage}"}} {value}')
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir: str) -> None:
+        # run_report.json always; run_report.prom (OpenMetrics text) when enabled
+        with open_output_stream(os.path.join(output_dir, "run_report.json")) as f:
+            f.write(self.to_json().encode())
+        if metrics_config.openmetrics:
+            with open_output_stream(os.path.join(output_dir, "run_report.prom")) as f:
+                f.write(self.to_openmetrics().encode())
+        logger.info("Wrote run report to %s", output_dir)
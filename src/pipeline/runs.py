@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Optional
+
+from .config import runs as runs_config
+from .logging_utils import get_logger
+
+
+# Run tracking for the HTTP trigger. A submission is recorded as a queued run and
+# returns at once; a bounded local worker pool executes it, recording status and
+# per-stage progress in a RunStore. Submissions identical to a run still queued or
+# running get that run back instead of starting another. Standard library only: this
+# is imported by the Cloud Function at cold start.
+
+logger = get_logger(__name__)
+
+ACTIVE = ("queued", "running")
+FINISHED = ("succeeded", "failed", "abandoned")
+
+# progress(stage, status, **metrics) records one stage event of a run
+Progress = Callable[..., None]
+# runner(run_id, params, progress) executes the run; it may return an external job id
+Runner = Callable[[str, dict, Progress], Optional[str]]
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+@dataclass
+class Run:
+    run_id: str
+    key: str
+    status: str
+    params: dict = field(default_factory=dict)
+    job_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    updated_at: float = 0.0
+    stages: dict[str, dict] = field(default_factory=dict)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class RunStore(ABC):
+    # Backend holding run state; claim() must be atomic across every process sharing it
+
+    @abstractmethod
+    def claim(self, key: str, params: dict, max_active: Optional[int] = None) -> tuple[Run, bool]:
+        # The fresh active run with this key, or a new queued one: (run, created).
+        # Raises QueueFull when max_active fresh runs are already active.
+        ...
+
+    @abstractmethod
+    def get(self, run_id: str) -> Optional[Run]:
+        ...
+
+    @abstractmethod
+    def update(self, run_id: str, **fields: Any) -> None:
+        ...
+
+    @abstractmethod
+    def record_stage(self, run_id: str, stage: str, status: str, **metrics: Any) -> None:
+        ...
+
+    @abstractmethod
+    def recent(self, limit: int = 20) -> list[Run]:
+        ...
+
+
+_RUN_COLUMNS = ("run_id", "key", "status", "params", "job_id", "error", "created_at", "started_at", "finished_at", "updated_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL,
+    job_id TEXT, error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL, updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_key_status ON runs (key, status);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id TEXT NOT NULL, stage TEXT NOT NULL, status TEXT NOT NULL, attempts INTEGER NOT NULL,
+    metrics TEXT NOT NULL, updated_at REAL NOT NULL, PRIMARY KEY (run_id, stage)
+);
+"""
+
+
+class SQLiteRunStore(RunStore):
+    # Local stand-in (tests, a single instance or a shared volume): one SQLite file,
+    # WAL mode; claims take the write lock first so concurrent claimers serialize
+    def __init__(self, path: str):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _run(self, row: tuple, stages: bool = True) -> Run:
+        run = Run(**dict(zip(_RUN_COLUMNS, row)))
+        run.params = json.loads(run.params)
+        if stages:
+            cur = self._conn.execute(
+                "SELECT stage, status, attempts, metrics, updated_at FROM stages WHERE run_id = ? ORDER BY rowid",
+                (run.run_id,),
+            )
+            run.stages = {
+                stage: {"status": status, "attempts": attempts, "updated_at": updated, **json.loads(metrics)}
+                for stage, status, attempts, metrics, updated in cur
+            }
+        return run
+
+    def claim(self, key: str, params: dict, max_active: Optional[int] = None) -> tuple[Run, bool]:
+        now = time.time()
+        fresh = now - runs_config.stale_seconds
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ",".join("?" * len(ACTIVE))
+                self._conn.execute(
+                    f"UPDATE runs SET status = 'abandoned', error = 'no progress for {runs_config.stale_seconds:g}s',"
+                    f" finished_at = ?, updated_at = ? WHERE status IN ({placeholders}) AND updated_at < ?",
+                    (now, now, *ACTIVE, fresh),
+                )
+                row = self._conn.execute(
+                    f"SELECT {','.join(_RUN_COLUMNS)} FROM runs WHERE key = ? AND status IN ({placeholders})"
+                    " ORDER BY created_at LIMIT 1",
+                    (key, *ACTIVE),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute("COMMIT")
+                    return self._run(row), False
+                if max_active is not None:
+                    (active,) = self._conn.execute(
+                        f"SELECT COUNT(*) FROM runs WHERE status IN ({placeholders})", ACTIVE
+                    ).fetchone()
+                    if active >= max_active:
+                        raise QueueFull(f"{active} runs already queued or running")
+                run = Run(new_run_id(), key, "queued", params, created_at=now, updated_at=now)
+                values = {**run.to_dict(), "params": json.dumps(params, sort_keys=True)}
+                self._conn.execute(
+                    f"INSERT INTO runs ({','.join(_RUN_COLUMNS)}) VALUES ({','.join('?' * len(_RUN_COLUMNS))})",
+                    [values[c] for c in _RUN_COLUMNS],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return run, True
+
+    def get(self, run_id: str) -> Optional[Run]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {','.join(_RUN_COLUMNS)} FROM runs WHERE run_id = ?", (run_id,)
+            ).fetchone()
+            return self._run(row) if row is not None else None
+
+    def update(self, run_id: str, **fields: Any) -> None:
+        unknown = set(fields) - set(_RUN_COLUMNS[2:])
+        if unknown:
+            raise ValueError(f"Unknown run fields: {sorted(unknown)}")
+        fields["updated_at"] = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE runs SET {', '.join(f'{k} = ?' for k in fields)} WHERE run_id = ?",
+                (*fields.values(), run_id),
+            )
+
+    def record_stage(self, run_id: str, stage: str, status: str, **metrics: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A stage that starts again (a retry) counts another attempt
+                self._conn.execute(
+                    "INSERT INTO stages (run_id, stage, status, attempts, metrics, updated_at) VALUES (?, ?, ?, 1, ?, ?)"
+                    " ON CONFLICT (run_id, stage) DO UPDATE SET status = excluded.status,"
+                    " attempts = attempts + (excluded.status = 'running'), metrics = excluded.metrics,"
+                    " updated_at = excluded.updated_at",
+                    (run_id, stage, status, json.dumps(metrics, default=str), now),
+                )
+                # Stage events double as the run's heartbeat
+                self._conn.execute("UPDATE runs SET updated_at = ? WHERE run_id = ?", (now, run_id))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def recent(self, limit: int = 20) -> list[Run]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {','.join(_RUN_COLUMNS)} FROM runs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+            return [self._run(row, stages=False) for row in rows]
+
+
+def open_run_store(url: str) -> RunStore:
+    # Further backends (e.g. Firestore) plug in here by URL scheme
+    if url.startswith("sqlite:///"):
+        return SQLiteRunStore(url[len("sqlite:///"):])
+    if "://" in url:
+        raise ValueError(f"Unsupported run store: {url} (expected a SQLite path or sqlite:/// URL)")
+    return SQLiteRunStore(url)
+
+
+def new_run_id() -> str:
+    # Also a valid Dataproc job id ([a-zA-Z0-9_-], at most 100 characters)
+    return f"run-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}"
+
+
+def run_key(params: dict, scope: str = "") -> str:
+    # Requests with the same parameters (and execution scope) are the same run
+    payload = json.dumps({"scope": scope, "params": params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+_store: Optional[RunStore] = None
+_pool: Optional[ThreadPoolExecutor] = None
+_state_lock = threading.Lock()
+
+
+def get_run_store() -> RunStore:
+    global _store
+    with _state_lock:
+        if _store is None:
+            _store = open_run_store(runs_config.store)
+        return _store
+
+
+def set_run_store(store: Optional[RunStore]) -> None:
+    # Swap the backend, e.g. for a temporary SQLite file in tests; None reopens RUN_STORE lazily
+    global _store
+    with _state_lock:
+        _store = store
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _state_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=runs_config.max_concurrent, thread_name_prefix="run")
+        return _pool
+
+
+def shutdown(wait: bool = True) -> None:
+    # Stop the worker pool (after its runs finish when wait); the next submit starts a new one
+    global _pool
+    with _state_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=wait)
+
+
+def _execute(store: RunStore, run: Run, runner: Runner) -> None:
+    store.update(run.run_id, status="running", started_at=time.time())
+
+    def progress(stage: str, status: str, **metrics: Any) -> None:
+        store.record_stage(run.run_id, stage, status, **metrics)
+
+    try:
+        job_id = runner(run.run_id, run.params, progress)
+    except Exception as exc:
+        logger.exception("Run %s failed", run.run_id)
+        store.update(run.run_id, status="failed", error=f"{type(exc).__name__}: {exc}", finished_at=time.time())
+    else:
+        fields = {"job_id": job_id} if job_id else {}
+        store.update(run.run_id, status="succeeded", finished_at=time.time(), **fields)
+        logger.info("Run %s succeeded", run.run_id)
+
+
+def submit(params: dict, runner: Runner, scope: str = "") -> tuple[Run, bool]:
+    # Returns (run, created); created is False when an identical run is already in flight
+    store = get_run_store()
+    run, created = store.claim(
+        run_key(params, scope), params, max_active=runs_config.max_concurrent + runs_config.max_queued
+    )
+    if created:
+        logger.info("Queued run %s with %s", run.run_id, params)
+        _executor().submit(_execute, store, run, runner)
+    else:
+        logger.info("Run %s already %s for %s", run.run_id, run.status, params)
+    return run, created
@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import polars as pl
+
+
+# Ids are dictionary-encoded Categoricals under the global string cache, so frames read
+# from different files (or rebuilt from Arrow in worker processes) share one id mapping
+# and join/concat on the physical codes without re-encoding. Lexical ordering keeps
+# sort(["store_id", ...]) in string order, independent of the order ids were first seen.
+pl.enable_string_cache()
+ID = pl.Categorical("lexical")
+
+# Registry of the pipeline's tables. Line-level numerics are Float32; aggregated money
+# stays Float64 (sums of many Float32 values lose cents), counts are Int32.
+SALES = {
+    "date": pl.Date,
+    "store_id": ID,
+    "product_id": ID,
+    "customer_id": ID,
+    "quantity": pl.Float32,
+    "price": pl.Float32,
+    "revenue": pl.Float32,
+}
+CUSTOMERS = {
+    "customer_id": ID,
+    "signup_date": pl.Date,
+}
+DAILY = {
+    "date": pl.Date,
+    "store_id": ID,
+    "qty_sum": pl.Float64,
+    "rev_sum": pl.Float64,
+    "num_txn": pl.Int32,
+}
+CUSTOMER_FEATURES = {
+    **CUSTOMERS,
+    "customer_num_txn": pl.Int32,
+    "customer_ltv": pl.Float64,
+    "customer_avg_basket": pl.Float64,
+    "customer_last_purchase_date": pl.Date,
+}
+FORECAST = {
+    "store_id": ID,
+    "date": pl.Date,
+    "rev_fcst": pl.Float64,
+}
+# Hierarchical mode: sparse store x product daily series (only days with sales) and
+# the reconciled forecasts of every level
+STORE_PRODUCT_DAILY = {
+    "date": pl.Date,
+    "store_id": ID,
+    "product_id": ID,
+    "qty_sum": pl.Float64,
+    "rev_sum": pl.Float64,
+}
+FORECAST_STORE_PRODUCT = {
+    "store_id": ID,
+    "product_id": ID,
+    "date": pl.Date,
+    "rev_fcst": pl.Float64,
+}
+FORECAST_HIERARCHY = {
+    "level": pl.String,  # chain | store
+    "store_id": ID,  # null on the chain level
+    "date": pl.Date,
+    "rev_base": pl.Float64,
+    "rev_fcst": pl.Float64,
+}
+
+
+def csv_dtypes(schema: dict[str, pl.DataType], names: list[str]) -> dict[str, pl.DataType]:
+    # Fixed read dtypes for the columns present in a CSV header (all others are read as
+    # String, nothing is inferred). Header names match after the same strip/lowercase
+    # transform applies. Dates stay String here and are parsed leniently by transform,
+    # so one malformed value drops its row instead of failing the read.
+    out = {}
+    for name in names:
+        dtype = schema.get(name.strip().lower())
+        if dtype is not None:
+            out[name] = pl.String if dtype == pl.Date else dtype
+    return out
+
+
+def cast(col: str, dtype: pl.DataType, current: pl.DataType) -> pl.Expr:
+    if dtype == pl.Categorical and current not in (pl.String, pl.Categorical, pl.Enum):
+        # Numeric ids must go through their string form to be dictionary-encoded
+        return pl.col(col).cast(pl.String).cast(dtype)
+    return pl.col(col).cast(dtype)
+
+
+def conform(df: pl.DataFrame | pl.LazyFrame, schema: dict[str, pl.DataType]) -> pl.DataFrame | pl.LazyFrame:
+    # Cast the registry columns present in df; Categoricals read back from Parquet/Arrow
+    # are re-cast too, to restore lexical ordering
+    current = df.collect_schema()
+    return df.with_columns([cast(c, t, current[c]) for c, t in schema.items() if c in current])
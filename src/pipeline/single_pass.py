@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterator, Optional
+
+import polars as pl
+import pyarrow.parquet as pq
+
+from .config import execution, outofcore
+from .features import (
+    CUSTOMER_PARTIAL_AGGS,
+    customer_features,
+    customer_partials,
+    daily_store_sales,
+    finalize_customer_features,
+    store_customer_mix,
+)
+from .hierarchy import store_product_sales
+from .ingest import scan_sales
+from .logging_utils import get_logger
+from .schemas import DAILY, SALES, STORE_PRODUCT_DAILY, conform
+from .transform import RAW_SUFFIX, SALES_RULES, accept_sales, flag_sales, rejected
+from .validation import Validator
+
+
+# Every sales-derived output from one scan of the sales input. The scan streams the
+# flagged (or cleaned) sales, projected and dictionary-encoded, to a Parquet spill
+# with bounded memory; the spill is then read back once, batch by batch, and each
+# batch is folded into mergeable partial aggregates and the validator. Polars'
+# streaming collect_all runs every plan as its own scan (no common subplan
+# elimination), which is what this replaces.
+
+logger = get_logger(__name__)
+
+_CLEAN_COLUMNS = ["date", "store_id", "product_id", "customer_id", "quantity", "price", "revenue"]
+
+
+class Partials:
+    # Partial aggregates of one output over a stream of batches. Pending partials are
+    # re-aggregated together once they outgrow the merged result, so memory stays a
+    # small multiple of the output and rows are re-aggregated about log(batches) times.
+    def __init__(self, keys: list[str], aggs: list[pl.Expr], min_rows: int = 1 << 16):
+        self.keys = keys
+        self.aggs = aggs
+        self.min_rows = min_rows
+        self._parts: list[pl.DataFrame] = []
+        self._merged_rows = 0
+        self._pending_rows = 0
+
+    def add(self, part: pl.DataFrame) -> None:
+        self._parts.append(part)
+        self._pending_rows += part.height
+        if self._pending_rows > max(self._merged_rows, self.min_rows):
+            self._merge()
+
+    def _merge(self) -> None:
+        merged = pl.concat(self._parts, how="vertical_relaxed").group_by(self.keys).agg(self.aggs)
+        self._parts, self._merged_rows, self._pending_rows = [merged], merged.height, 0
+
+    def result(self) -> pl.DataFrame:
+        if len(self._parts) > 1 or self._pending_rows:
+            self._merge()
+        return self._parts[0]
+
+
+def spill_sales(sales_path: str, path: str, validate: bool = False, explain: bool = False) -> int:
+    # The one scan of sales. With validation the flagged rows are kept (raw date strings
+    # only where the row is rejected, for the quarantine); otherwise only cleaned rows
+    # and the columns the features read. Returns the rows spilled.
+    flagged = flag_sales(scan_sales(sales_path))
+    if validate:
+        raw = "date" + RAW_SUFFIX
+        plan = flagged.with_columns(pl.when(rejected(SALES_RULES)).then(pl.col(raw)).alias(raw))
+    else:
+        clean = accept_sales(flagged)
+        names = clean.collect_schema().names()
+        plan = clean.select([c for c in _CLEAN_COLUMNS if c in names])
+    if explain:
+        logger.info("Query plan for the sales scan:\n%s", plan.explain(streaming=True))
+    plan.sink_parquet(path, row_group_size=outofcore.spill_row_group_size)
+    rows = pq.ParquetFile(path).metadata.num_rows
+    logger.info("Spilled %s sales rows to %s", rows, path)
+    return rows
+
+
+def iter_batches(path: str, batch_rows: Optional[int] = None) -> Iterator[pl.DataFrame]:
+    # A spill file as DataFrames of at most batch_rows rows (at least one, maybe empty)
+    source = pq.ParquetFile(path)
+    batches = source.iter_batches(batch_size=batch_rows or execution.batch_rows)
+    first = next(batches, None)
+    if first is None:
+        yield conform(pl.from_arrow(source.schema_arrow.empty_table()), SALES)
+        return
+    yield conform(pl.from_arrow(first), SALES)
+    for batch in batches:
+        yield conform(pl.from_arrow(batch), SALES)
+
+
+@dataclass
+class SalesAggregates:
+    daily_store_sales: pl.DataFrame
+    customer_features: Optional[pl.DataFrame] = None
+    store_customer_mix: Optional[pl.DataFrame] = None
+    store_product_sales: Optional[pl.DataFrame] = None
+
+
+def fold_sales(
+    spill: str,
+    customers: Optional[pl.DataFrame] = None,
+    store_mix: bool = False,
+    store_product: bool = False,
+    validator: Optional[Validator] = None,
+    batch_rows: Optional[int] = None,
+) -> SalesAggregates:
+    # Folds the spill into daily_store_sales, plus customer_features / store_customer_mix
+    # when the cleaned customers are given and store_product_sales when asked; the
+    # validator (for a flagged spill) absorbs each batch as well
+    daily = Partials(["date", "store_id"], [pl.sum("qty_sum"), pl.sum("rev_sum"), pl.sum("num_txn")])
+    per_customer = Partials(["customer_id"], CUSTOMER_PARTIAL_AGGS)
+    pairs = Partials(["store_id", "customer_id"], [])
+    products = Partials(["date", "store_id", "product_id"], [pl.sum("qty_sum"), pl.sum("rev_sum")])
+    has_customer = False
+    rows = 0
+    for batch in iter_batches(spill, batch_rows):
+        if validator is not None:
+            validator.absorb(validator.plans(batch))
+            batch = accept_sales(batch)
+        rows += batch.height
+        has_customer = "customer_id" in batch.columns
+        daily.add(daily_store_sales(batch))
+        if customers is not None and has_customer:
+            per_customer.add(customer_partials(batch))
+            if store_mix:
+                pairs.add(batch.select(["store_id", "customer_id"]).drop_nulls().unique())
+        if store_product:
+            products.add(store_product_sales(batch))
+
+    out = SalesAggregates(
+        daily.result().sort(["store_id", "date"]).select([pl.col(c).cast(t) for c, t in DAILY.items()])
+    )
+    if customers is not None:
+        if has_customer:
+            out.customer_features = finalize_customer_features(per_customer.result(), customers)
+        else:
+            out.customer_features = customer_features(out.daily_store_sales, customers)
+        if store_mix:
+            # Without customer ids every store gets the empty profile
+            stores = pairs.result() if has_customer else out.daily_store_sales.select("store_id")
+            out.store_customer_mix = store_customer_mix(stores, out.customer_features)
+    if store_product:
+        out.store_product_sales = conform(products.result(), STORE_PRODUCT_DAILY)
+    logger.info("Folded %s cleaned sales rows into %s store-days", rows, out.daily_store_sales.height)
+    return out
@@ -1,58 +1,134 @@
 from __future__ import annotations
 
+from dataclasses import dataclass
+from typing import TypeVar
+
 import polars as pl
 
 from .logging_utils import get_logger
+from .schemas import CUSTOMERS, SALES, cast
 
 
 logger = get_logger(__name__)
 
+# Cleaning steps are written once and work on both eager and lazy frames
+Frame = TypeVar("Frame", pl.DataFrame, pl.LazyFrame)
+
+
+def column_names(df: pl.DataFrame | pl.LazyFrame) -> list[str]:
+    # collect_schema() resolves a LazyFrame's schema without executing the plan
+    return df.collect_schema().names()
+
+
+# Bitmask of the rules a row breaks (bit i = rules[i]); raw date strings ride along as
+# <col>_raw so parse failures can be told apart from missing values
+REJECT_COL = "reject_mask"
+RAW_SUFFIX = "_raw"
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    violated: pl.Expr  # evaluated on the coerced frame; null counts as not violated
+    reject: bool = True  # False: counted, but the row is kept
+
+
+def _unparsed(col: str) -> pl.Expr:
+    return pl.col(col + RAW_SUFFIX).is_not_null() & pl.col(col).is_null()
+
+
+SALES_RULES = [
+    Rule("date_missing", pl.col("date" + RAW_SUFFIX).is_null()),
+    Rule("date_unparsed", _unparsed("date")),
+    Rule("quantity_missing", pl.col("quantity").is_null()),
+    Rule("quantity_negative", pl.col("quantity") < 0),
+    Rule("price_missing", pl.col("price").is_null()),
+    Rule("price_negative", pl.col("price") < 0),
+    Rule("store_id_missing", pl.col("store_id").is_null()),
+    Rule("product_id_missing", pl.col("product_id").is_null(), reject=False),
+]
+CUSTOMER_RULES = [
+    Rule("customer_id_missing", pl.col("customer_id").is_null()),
+    Rule("signup_date_unparsed", _unparsed("signup_date"), reject=False),
+]
+
 
-def clean_sales(df: pl.DataFrame) -> pl.DataFrame:
-    # Standardize column names
-    df = df.rename({c: c.strip().lower() for c in df.columns})
+def reject_mask(rules: list[Rule]) -> pl.Expr:
+    # All rules in one vectorized expression, one bit each
+    return pl.sum_horizontal([
+        pl.when(r.violated.fill_null(False)).then(pl.lit(1 << i, dtype=pl.UInt32)).otherwise(pl.lit(0, dtype=pl.UInt32))
+        for i, r in enumerate(rules)
+    ]).cast(pl.UInt32).alias(REJECT_COL)
+
+
+def rejected(rules: list[Rule]) -> pl.Expr:
+    bits = sum(1 << i for i, r in enumerate(rules) if r.reject)
+    return (pl.col(REJECT_COL) & bits) != 0
+
+
+def _as_date(col: str, dtype: pl.DataType) -> pl.Expr:
+    # CSV readers with try_parse_dates may already have produced a temporal column
+    if dtype == pl.String:
+        return pl.col(col).str.strptime(pl.Date, strict=False).alias(col)
+    return pl.col(col).cast(pl.Date).alias(col)
+
+
+def flag_sales(df: Frame) -> Frame:
+    # Coerced sales with REJECT_COL (and date_raw); clean_sales filters on it
+    df = df.rename({c: c.strip().lower() for c in column_names(df)})
     # Required fields
     required = ["date", "store_id", "product_id", "quantity", "price"]
-    missing = [c for c in required if c not in df.columns]
+    schema = df.collect_schema()
+    missing = [c for c in required if c not in schema]
     if missing:
         raise ValueError(f"Sales dataset missing required columns: {missing}")
 
-    # Coerce types and handle bad values
+    # Coerce types; bad values become nulls and are flagged below
     df = df.with_columns([
-        pl.col("date").str.strptime(pl.Date, strict=False).alias("date"),
-        pl.col("store_id").cast(pl.Utf8),
-        pl.col("product_id").cast(pl.Utf8),
-        pl.col("quantity").cast(pl.Float64),
-        pl.col("price").cast(pl.Float64),
+        pl.col("date").alias("date" + RAW_SUFFIX),
+        _as_date("date", schema["date"]),
+        *[cast(c, SALES[c], schema[c]) for c in ["store_id", "product_id", "quantity", "price"]],
+        *([cast("customer_id", SALES["customer_id"], schema["customer_id"])] if "customer_id" in schema else []),
     ])
+    return df.with_columns(reject_mask(SALES_RULES))
 
-    # Drop invalid rows
-    df = df.filter(
-        pl.col("date").is_not_null()
-        & pl.col("quantity").is_not_null()
-        & pl.col("price").is_not_null()
-        & (pl.col("quantity") >= 0)
-        & (pl.col("price") >= 0)
-    )
+
+def accept_sales(flagged: Frame) -> Frame:
+    # Drop invalid rows (see SALES_RULES; validation.Validator reports them)
+    df = flagged.filter(~rejected(SALES_RULES)).drop([REJECT_COL, "date" + RAW_SUFFIX])
 
     # Compute revenue
     df = df.with_columns((pl.col("quantity") * pl.col("price")).alias("revenue"))
-    logger.info("Cleaned sales data: %s rows", df.height)
+    if isinstance(df, pl.DataFrame):
+        logger.info("Cleaned sales data: %s rows", df.height)
     return df
 
 
-def clean_customers(df: pl.DataFrame) -> pl.DataFrame:
-    df = df.rename({c: c.strip().lower() for c in df.columns})
+def flag_customers(df: Frame) -> Frame:
+    df = df.rename({c: c.strip().lower() for c in column_names(df)})
     required = ["customer_id", "signup_date"]
-    missing = [c for c in required if c not in df.columns]
+    schema = df.collect_schema()
+    missing = [c for c in required if c not in schema]
     if missing:
         raise ValueError(f"Customers dataset missing required columns: {missing}")
     df = df.with_columns([
-        pl.col("customer_id").cast(pl.Utf8),
-        pl.col("signup_date").str.strptime(pl.Date, strict=False).alias("signup_date"),
+        cast("customer_id", CUSTOMERS["customer_id"], schema["customer_id"]),
+        pl.col("signup_date").alias("signup_date" + RAW_SUFFIX),
+        _as_date("signup_date", schema["signup_date"]),
     ])
-    df = df.filter(pl.col("customer_id").is_not_null())
-    logger.info("Cleaned customers data: %s rows", df.height)
+    return df.with_columns(reject_mask(CUSTOMER_RULES))
+
+
+def accept_customers(flagged: Frame) -> Frame:
+    df = flagged.filter(~rejected(CUSTOMER_RULES)).drop([REJECT_COL, "signup_date" + RAW_SUFFIX])
+    if isinstance(df, pl.DataFrame):
+        logger.info("Cleaned customers data: %s rows", df.height)
     return df
 
 
+def clean_sales(df: Frame) -> Frame:
+    return accept_sales(flag_sales(df))
+
+
+def clean_customers(df: Frame) -> Frame:
+    return accept_customers(flag_customers(df))
@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import calendar
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from typing import Any, Callable, Optional
+
+from .config import gcp
+from .config import runs as runs_config
+from .logging_utils import get_logger
+from .runs import FINISHED, Progress, QueueFull, Run, get_run_store, new_run_id, run_key, submit
+
+
+# Cloud Function entry point. Cold starts only pay for the standard library and config:
+# the job is submitted to Dataproc over REST with a token from the metadata server, so
+# neither the pipeline (polars, numpy, sklearn) nor the Google client libraries load.
+# With a cluster, the job is submitted before the response and Dataproc holds the run
+# state (GET /runs/<id> reads the job); without one, requests queue a local run
+# (runs.py) that executes the pipeline in this process.
+
+logger = get_logger(__name__)
+
+METADATA_TOKEN_URL = "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token"
+JOBS_URL = "https://dataproc.googleapis.com/v1/projects/{project}/regions/{region}/jobs"
+SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+# (method, url, headers, body) -> decoded JSON response
+Transport = Callable[[str, str, dict, Optional[bytes]], dict]
+# Per-request parameters (JSON body or query string), passed to dataproc_job.main
+RUN_PARAMS = ("sales_blob", "customers_blob")
+
+
+def _urllib_transport(method: str, url: str, headers: dict, body: Optional[bytes]) -> dict:
+    req = urllib.request.Request(url, data=body, headers=headers, method=method)
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        return json.loads(resp.read() or b"{}")
+
+
+_transport: Transport = _urllib_transport
+_token: Optional[tuple[str, float]] = None  # (access token, expiry); reused by warm invocations
+_token_lock = threading.Lock()
+
+
+def set_transport(transport: Optional[Transport]) -> None:
+    # Swap the HTTP transport, e.g. for a fake in tests; None restores urllib
+    global _transport, _token
+    with _token_lock:
+        _transport, _token = transport or _urllib_transport, None
+
+
+def _access_token() -> str:
+    global _token
+    with _token_lock:
+        if _token is not None and _token[1] > time.time() + 60:
+            return _token[0]
+        try:
+            resp = _transport("GET", METADATA_TOKEN_URL, {"Metadata-Flavor": "Google"}, None)
+            token, expiry = resp["access_token"], time.time() + float(resp.get("expires_in", 0))
+        except OSError:
+            # Off GCP (local runs): application default credentials through google-auth
+            import google.auth
+            import google.auth.transport.requests
+
+            creds, _ = google.auth.default(scopes=[SCOPE])
+            creds.refresh(google.auth.transport.requests.Request())
+            token, expiry = creds.token, creds.expiry.timestamp() if creds.expiry else time.time() + 300
+        _token = (token, expiry)
+        return token
+
+
+def job_request(job_id: str, params: Optional[dict] = None) -> dict[str, Any]:
+    # The main file is the scripts/run_dataproc_job.py launcher, importing the pipeline
+    # from the src/ zip in pythonFileUris. The job reads its settings (buckets, modes) from
+    # the cluster's environment; the per-request parameters travel as job arguments
+    pyspark: dict[str, Any] = {"mainPythonFileUri": gcp.dataproc_main_uri}
+    if gcp.dataproc_python_files:
+        pyspark["pythonFileUris"] = list(gcp.dataproc_python_files)
+    args = [f"--{k.replace('_', '-')}={v}" for k, v in sorted((params or {}).items())]
+    pyspark["args"] = [*args, f"--run-id={job_id}"]
+    return {
+        # Same id for a retried submit, so Dataproc does not start the job twice
+        "requestId": job_id,
+        "job": {
+            "reference": {"projectId": gcp.project_id, "jobId": job_id},
+            "placement": {"clusterName": gcp.dataproc_cluster},
+            "pysparkJob": pyspark,
+        },
+    }
+
+
+def _jobs_url() -> str:
+    return JOBS_URL.format(project=gcp.project_id, region=gcp.region)
+
+
+def _headers() -> dict:
+    return {"Authorization": f"Bearer {_access_token()}", "Content-Type": "application/json"}
+
+
+# Labels on submitted jobs: Dataproc itself is the run store shared by every instance
+RUN_LABEL = ("pipeline-run", "trigger")
+KEY_LABEL = "pipeline-run-key"
+# Random per submission: tells the submitter that created a job from the ones that got it back
+SUBMIT_LABEL = "pipeline-submit"
+# Job ids tried per key and time bucket before giving up (one more per finished run)
+_MAX_ATTEMPTS = 100
+# Dataproc job state -> run status
+_JOB_STATUS = {
+    "PENDING": "queued", "SETUP_DONE": "queued", "RUNNING": "running",
+    "CANCEL_PENDING": "running", "CANCEL_STARTED": "running",
+    "DONE": "succeeded", "ERROR": "failed", "CANCELLED": "failed",
+}
+
+
+def _submit(job_id: str, params: Optional[dict], key: str = "", nonce: str = "") -> dict:
+    request = job_request(job_id, params)
+    request["job"]["labels"] = {
+        RUN_LABEL[0]: RUN_LABEL[1], **({KEY_LABEL: key[:63]} if key else {}), **({SUBMIT_LABEL: nonce} if nonce else {}),
+    }
+    return _transport("POST", f"{_jobs_url()}:submit", _headers(), json.dumps(request).encode())
+
+
+def submit_job(job_id: Optional[str] = None, params: Optional[dict] = None, key: str = "") -> str:
+    job_id = job_id or new_run_id()
+    resp = _submit(job_id, params, key)
+    job_id = resp.get("reference", {}).get("jobId", job_id)
+    logger.info("Submitted Dataproc job %s to cluster %s", job_id, gcp.dataproc_cluster)
+    return job_id
+
+
+def cancel_job(job_id: str) -> dict:
+    return _transport("POST", f"{_jobs_url()}/{urllib.parse.quote(job_id)}:cancel", _headers(), b"{}")
+
+
+def dataproc_job_id(key: str, bucket: int, attempt: int = 0) -> str:
+    # Same key and bucket -> same job id (and requestId), so Dataproc itself rejects or
+    # returns the duplicate; attempt moves past runs of the key that already finished
+    return f"run-{key[:16]}-{bucket}-{attempt}"
+
+
+def get_job(job_id: str) -> dict:
+    return _transport("GET", f"{_jobs_url()}/{urllib.parse.quote(job_id)}", _headers(), None)
+
+
+def list_jobs(active: bool = False, key: str = "", limit: int = 20) -> list[dict]:
+    # Jobs the trigger submitted to the cluster, newest first; active = not yet finished
+    terms = [f"labels.{RUN_LABEL[0]} = {RUN_LABEL[1]}"]
+    if active:
+        terms.insert(0, "status.state = ACTIVE")
+    if key:
+        terms.append(f"labels.{KEY_LABEL} = {key[:63]}")
+    query = urllib.parse.urlencode({
+        "clusterName": gcp.dataproc_cluster, "filter": " AND ".join(terms), "pageSize": limit,
+    })
+    return _transport("GET", f"{_jobs_url()}?{query}", _headers(), None).get("jobs", [])
+
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    # RFC 3339 UTC timestamps of the Dataproc API, e.g. 2024-05-01T10:00:00.123456789Z
+    if not timestamp:
+        return None
+    head, _, frac = timestamp.rstrip("Z").partition(".")
+    return calendar.timegm(time.strptime(head, "%Y-%m-%dT%H:%M:%S")) + float(f"0.{frac or 0}")
+
+
+def job_run(job: dict) -> Run:
+    # A submitted job as a run: the run id is the job id, the parameters are its arguments
+    status = job.get("status", {})
+    state = status.get("state", "STATE_UNSPECIFIED")
+    history = [*job.get("statusHistory", []), status]
+    params = {}
+    for arg in job.get("pysparkJob", {}).get("args", []):
+        name, _, value = arg.lstrip("-").partition("=")
+        if name.replace("-", "_") in RUN_PARAMS:
+            params[name.replace("-", "_")] = value
+    run_status = _JOB_STATUS.get(state, "queued")
+    job_id = job.get("reference", {}).get("jobId", "")
+    return Run(
+        run_id=job_id,
+        key=job.get("labels", {}).get(KEY_LABEL, ""),
+        status=run_status,
+        params=params,
+        job_id=job_id,
+        error=status.get("details") if run_status == "failed" else None,
+        created_at=_epoch(history[0].get("stateStartTime")) or 0.0,
+        started_at=next((_epoch(h.get("stateStartTime")) for h in history if h.get("state") == "RUNNING"), None),
+        finished_at=_epoch(status.get("stateStartTime")) if run_status in FINISHED else None,
+        updated_at=_epoch(status.get("stateStartTime")) or 0.0,
+        stages={"dataproc_job": {
+            "status": {"succeeded": "ok"}.get(run_status, run_status), "state": state,
+            "state_history": [(h.get("state"), h.get("stateStartTime")) for h in history],
+        }},
+    )
+
+
+def _order(job: dict) -> tuple[float, str]:
+    run = job_run(job)
+    return run.created_at, run.job_id
+
+
+def submit_to_dataproc(params: dict) -> tuple[Run, bool]:
+    # Submitted before the response, so nothing is left running on the instance. The job
+    # id is derived from the run key, so identical concurrent requests (on any instance)
+    # land on one job; whoever did not create it gets it back as a duplicate.
+    key = run_key(params, scope=f"dataproc:{gcp.project_id}/{gcp.region}/{gcp.dataproc_cluster}")
+    for job in list_jobs(active=True, key=key, limit=1):
+        run = job_run(job)
+        logger.info("Run %s already %s for %s", run.run_id, run.status, params)
+        return run, False
+    limit = runs_config.max_concurrent + runs_config.max_queued
+    active = list_jobs(active=True, limit=limit)
+    if len(active) >= limit:
+        raise QueueFull(f"{len(active)} runs already queued or running")
+
+    nonce = uuid.uuid4().hex
+    bucket = int(time.time() // runs_config.dedup_window_seconds)
+    for attempt in range(_MAX_ATTEMPTS):
+        job_id = dataproc_job_id(key, bucket, attempt)
+        try:
+            job = _submit(job_id, params, key, nonce)
+        except urllib.error.HTTPError as exc:
+            if exc.code != 409:
+                raise
+            job = get_job(job_id)
+        run = job_run(job)
+        if run.status in FINISHED:
+            continue
+        if job.get("labels", {}).get(SUBMIT_LABEL) != nonce:
+            logger.info("Run %s already %s for %s", run.run_id, run.status, params)
+            return run, False
+        break
+    else:
+        raise QueueFull(f"{_MAX_ATTEMPTS} runs already submitted for {params} in this window")
+    logger.info("Submitted Dataproc job %s to cluster %s", job_id, gcp.dataproc_cluster)
+
+    # Distinct requests racing past the check above can overshoot the limit. A job lists
+    # after its creation, so it sees every job created before it: if the earlier active
+    # jobs already fill the limit, it withdraws (creation time is the same on every instance)
+    ahead = [j for j in list_jobs(active=True, limit=2 * limit + 1) if _order(j) < _order(job)]
+    if len(ahead) >= limit:
+        cancel_job(job_id)
+        raise QueueFull(f"{len(ahead)} runs already queued or running")
+    return run, True
+
+
+def run_in_process(run_id: str, params: dict, progress: Progress) -> None:
+    # No cluster configured: run the job in this process, as the function used to. The
+    # pipeline is only imported here, never at cold start.
+    from .dataproc_job import main as run_dataproc_job
+    from .profiling import RunReport
+
+    def listener(m, status: str) -> None:
+        progress(m.stage, status, wall_seconds=round(m.wall_seconds, 3), rows_out=m.rows_out)
+
+    run_dataproc_job(params.get("sales_blob"), params.get("customers_blob"), RunReport(run_id=run_id, listener=listener))
+
+
+def _on_dataproc() -> bool:
+    return bool(gcp.project_id and gcp.dataproc_cluster and gcp.dataproc_main_uri)
+
+
+def submit_run(params: Optional[dict] = None) -> tuple[Run, bool]:
+    # Start a run: (run, created); an identical run already queued or running is
+    # returned instead of starting another
+    params = {k: v for k, v in (params or {}).items() if v is not None}
+    unknown = set(params) - set(RUN_PARAMS)
+    if unknown:
+        raise ValueError(f"Unknown run parameters: {sorted(unknown)} (expected {list(RUN_PARAMS)})")
+    if _on_dataproc():
+        return submit_to_dataproc(params)
+    # Local runs (no cluster): a worker pool in this process, tracked in the RUN_STORE
+    return submit(params, run_in_process, scope="local")
+
+
+def _json(body: Any, code: int) -> tuple[str, int, dict]:
+    return json.dumps(body, default=str), code, {"Content-Type": "application/json"}
+
+
+def _request_params(request) -> dict:
+    body = request.get_json(silent=True) if request is not None and hasattr(request, "get_json") else None
+    args = dict(getattr(request, "args", None) or {})
+    return {**args, **(body if isinstance(body, dict) else {})}
+
+
+def status(request):  # GET /runs/<run_id> (one run, with per-stage progress) or /runs (recent runs)
+    path = (getattr(request, "path", "") or "").strip("/")
+    run_id = path.split("/", 1)[1] if path.startswith("runs/") else (getattr(request, "args", None) or {}).get("run_id")
+    if _on_dataproc():
+        # Straight from the Dataproc API, so every instance answers for every run
+        if not run_id:
+            return _json({"runs": [job_run(job).to_dict() for job in list_jobs()]}, 200)
+        try:
+            return _json(job_run(get_job(run_id)).to_dict(), 200)
+        except urllib.error.HTTPError as exc:
+            if exc.code != 404:
+                raise
+            return _json({"error": f"Unknown run {run_id}"}, 404)
+    store = get_run_store()
+    if not run_id:
+        return _json({"runs": [r.to_dict() for r in store.recent()]}, 200)
+    run = store.get(run_id)
+    if run is None:
+        return _json({"error": f"Unknown run {run_id}"}, 404)
+    return _json(run.to_dict(), 200)
+
+
+def trigger(request):  # Google Cloud Functions HTTP entrypoint
+    path = (getattr(request, "path", "") or "").strip("/")
+    if path == "runs" or path.startswith("runs/"):
+        return status(request)
+    try:
+        run, created = submit_run(_request_params(request))
+    except ValueError as exc:
+        return _json({"error": str(exc)}, 400)
+    except QueueFull as exc:
+        return _json({"error": str(exc)}, 429)
+    except OSError as exc:
+        logger.exception("Submitting the run failed")
+        return _json({"error": f"Submitting the run failed: {exc}"}, 502)
+    return _json({
+        "run_id": run.run_id,
+        "status": run.status,
+        "deduplicated": not created,
+        "status_url": f"/runs/{run.run_id}",
+    }, 202)
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Optional
+
+import numpy as np
+import polars as pl
+import pyarrow.parquet as pq
+
+from .config import output, validation
+from .filesystems import open_output_stream
+from .ingest import write_df
+from .logging_utils import get_logger
+from .transform import (
+    CUSTOMER_RULES,
+    REJECT_COL,
+    SALES_RULES,
+    Frame,
+    Rule,
+    accept_customers,
+    accept_sales,
+    flag_customers,
+    flag_sales,
+    rejected,
+)
+
+
+logger = get_logger(__name__)
+
+REASONS_COL = "reject_reasons"
+QUANTILES = (0.01, 0.5, 0.9, 0.99)
+_ZERO = -(2**31)  # QuantileSketch bucket for values <= 0
+
+
+class DistinctSketch:
+    # HyperLogLog over the string form of a column. Each batch is reduced in polars to the
+    # smallest hash value per register (a window min inside the validator's one select),
+    # so only the 2**p registers are ever held; sketches of batches/runs merge by register max.
+    def __init__(self, precision: Optional[int] = None):
+        self.p = precision or validation.hll_precision
+        self.registers = np.zeros(1 << self.p, dtype=np.uint8)
+
+    @property
+    def _low_bits(self) -> int:
+        return 64 - self.p
+
+    def agg(self, values: pl.Expr, keep: Optional[pl.Expr] = None) -> pl.Expr:
+        # One-row list of the smallest hash per register, over the non-null values kept
+        kept = values.is_not_null() if keep is None else keep & values.is_not_null()
+        h = pl.when(kept).then(values.cast(pl.Utf8).hash(seed=0))
+        return h.min().over(h // pl.lit(1 << self._low_bits, dtype=pl.UInt64)).unique().drop_nulls().implode()
+
+    def plan(self, df: Frame, col: str) -> Frame:
+        return df.select(self.agg(pl.col(col)).explode().alias("hash")).drop_nulls()
+
+    def update(self, hashes: pl.Series) -> None:
+        # Rank = leading zeros of the low bits + 1, from each register's smallest hash
+        h = hashes.to_numpy().astype(np.uint64)
+        idx = (h >> np.uint64(self._low_bits)).astype(np.int64)
+        mask = (1 << self._low_bits) - 1
+        ranks = np.array([self._low_bits - (int(v) & mask).bit_length() + 1 for v in h], dtype=np.uint8)
+        self.registers[idx] = np.maximum(self.registers[idx], ranks)
+
+    def merge(self, other: DistinctSketch) -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # Linear counting while many registers are still empty
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class QuantileSketch:
+    # Log-bucketed histogram of a non-negative column (DDSketch): bucket i holds values in
+    # (gamma**(i-1), gamma**i], so any quantile is returned within `accuracy` relative
+    # error. Batches reduce to (bucket, count) in polars; sketches merge by adding counts.
+    def __init__(self, accuracy: Optional[float] = None):
+        accuracy = accuracy or validation.quantile_accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.counts: dict[int, int] = {}
+
+    def agg(self, values: pl.Expr, keep: Optional[pl.Expr] = None) -> pl.Expr:
+        # One-row list of (bucket, count) over the non-null values kept
+        x = values.cast(pl.Float64)
+        kept = x.is_not_null() if keep is None else keep & x.is_not_null()
+        # Non-positive values go to the _ZERO bucket
+        bucket = (pl.when(x > 0).then(x).log() / math.log(self.gamma)).ceil().cast(pl.Int32).fill_null(_ZERO)
+        return bucket.filter(kept).alias("bucket").value_counts(name="count").implode()
+
+    def plan(self, df: Frame, col: str) -> Frame:
+        return df.select(self.agg(pl.col(col)).explode().alias("buckets")).drop_nulls()
+
+    def update(self, buckets: pl.Series) -> None:
+        for b, n in buckets.struct.unnest().select(["bucket", "count"]).iter_rows():
+            self.counts[b] = self.counts.get(b, 0) + n
+
+    def merge(self, other: QuantileSketch) -> None:
+        for b, n in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + n
+
+    def quantile(self, q: float) -> Optional[float]:
+        total = sum(self.counts.values())
+        if not total:
+            return None
+        rank, seen = q * (total - 1), 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen > rank:
+                return 0.0 if b == _ZERO else 2 * self.gamma**b / (self.gamma + 1)
+        return None
+
+
+@dataclass
+class ValidationReport:
+    table: str
+    rows: int = 0
+    rejected: int = 0
+    rule_counts: dict[str, int] = field(default_factory=dict)
+    distinct: dict[str, int] = field(default_factory=dict)  # approximate, over accepted rows
+    quantiles: dict[str, dict[str, Optional[float]]] = field(default_factory=dict)
+    quarantine: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Validator:
+    # Rule counts, rejected rows and sketches of one table. plans() is two queries over
+    # the flagged frame: one select computing every count and sketch in a single pass, and
+    # the filter of rejected rows for the quarantine. Lazy runs feed it the materialized
+    # batches of the sales spill (single_pass), so the input itself is scanned once.
+    # absorb() may be called once per batch; counts and sketches accumulate, and each
+    # batch's rejects are appended to <quarantine_dir>/<table>.parquet as they arrive, so
+    # memory does not grow with the number of rejects.
+    def __init__(
+        self,
+        table: str,
+        rules: list[Rule],
+        distinct: tuple[str, ...] = (),
+        quantiles: tuple[str, ...] = (),
+        quarantine_dir: Optional[str] = None,
+    ):
+        self.table = table
+        self.rules = rules
+        self.distinct = {c: DistinctSketch() for c in distinct}
+        self.quantiles = {c: QuantileSketch() for c in quantiles}
+        self.report = ValidationReport(table, rule_counts={r.name: 0 for r in rules})
+        if quarantine_dir:
+            self.report.quarantine = os.path.join(quarantine_dir, f"{table}.parquet")
+        self._empty: Optional[pl.DataFrame] = None  # zero-row frame of the rejects' schema
+        self._stream = None
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def _key(self, part: str) -> str:
+        return f"validation:{self.table}:{part}"
+
+    def plans(self, flagged: Frame) -> dict[str, Frame]:
+        names = flagged.collect_schema().names()
+        bit = lambda i: (pl.col(REJECT_COL) & (1 << i)) != 0  # noqa: E731
+        accepted = ~rejected(self.rules)
+        sketches = [
+            sketch.agg(pl.col(col), accepted).alias(f"{kind}:{col}")
+            for kind, group in (("distinct", self.distinct), ("quantiles", self.quantiles))
+            for col, sketch in group.items()
+            if col in names
+        ]
+        return {
+            self._key("summary"): flagged.select([
+                pl.len().alias("rows"),
+                rejected(self.rules).sum().alias("rejected"),
+                *[bit(i).sum().alias(r.name) for i, r in enumerate(self.rules)],
+                *sketches,
+            ]),
+            self._key("rejected"): flagged.filter(rejected(self.rules)).with_columns(
+                pl.concat_str(
+                    [pl.when(bit(i)).then(pl.lit(r.name)) for i, r in enumerate(self.rules)],
+                    separator=",", ignore_nulls=True,
+                ).alias(REASONS_COL)
+            ),
+        }
+
+    def absorb(self, frames: dict[str, pl.DataFrame]) -> None:
+        summary = frames[self._key("summary")]
+        self.report.rows += summary.item(0, "rows")
+        self.report.rejected += summary.item(0, "rejected")
+        for name in self.report.rule_counts:
+            self.report.rule_counts[name] += summary.item(0, name)
+        self._quarantine(frames[self._key("rejected")])
+        for kind, sketches in (("distinct", self.distinct), ("quantiles", self.quantiles)):
+            for col, sketch in sketches.items():
+                if f"{kind}:{col}" in summary.columns:
+                    sketch.update(summary.get_column(f"{kind}:{col}").explode().drop_nulls())
+
+    def _quarantine(self, rows: pl.DataFrame) -> None:
+        if self.report.quarantine is None:
+            return
+        if self._empty is None:
+            self._empty = rows.clear()
+        if not rows.height:
+            return
+        table = rows.to_arrow()
+        if self._writer is None:
+            self._stream = open_output_stream(self.report.quarantine)
+            self._writer = pq.ParquetWriter(self._stream, table.schema, compression=output.compression)
+        elif table.schema != self._writer.schema:
+            table = table.cast(self._writer.schema)
+        self._writer.write_table(table)
+
+    def finish(self) -> ValidationReport:
+        report = self.report
+        report.distinct = {c: s.estimate() for c, s in self.distinct.items() if s.registers.any()}
+        report.quantiles = {
+            c: {f"p{round(q * 100):02d}": s.quantile(q) for q in QUANTILES} for c, s in self.quantiles.items() if s.counts
+        }
+        if self._writer is not None:
+            self._writer.close()
+            self._stream.close()
+            self._writer = self._stream = None
+        elif report.quarantine is not None:
+            # Written even when empty, so a clean run replaces an earlier run's rejects
+            write_df(self._empty if self._empty is not None else pl.DataFrame(), report.quarantine)
+        violated = {k: v for k, v in report.rule_counts.items() if v}
+        if report.rejected:
+            logger.warning("Validated %s: %s rows, %s rejected; rule violations %s", self.table, report.rows, report.rejected, violated)
+        else:
+            logger.info("Validated %s: %s rows, none rejected; rule violations %s", self.table, report.rows, violated)
+        return report
+
+
+def sales_validator(quarantine: Optional[str] = None) -> Validator:
+    return Validator(
+        "sales", SALES_RULES, distinct=("store_id", "product_id", "customer_id"), quantiles=("quantity", "price"),
+        quarantine_dir=quarantine,
+    )
+
+
+def customers_validator(quarantine: Optional[str] = None) -> Validator:
+    return Validator("customers", CUSTOMER_RULES, distinct=("customer_id",), quarantine_dir=quarantine)
+
+
+def quarantine_dir(output_dir: str) -> str:
+    return validation.quarantine_dir or os.path.join(output_dir, "quarantine")
+
+
+def validate_sales(df: pl.DataFrame, quarantine: Optional[str] = None) -> tuple[pl.DataFrame, ValidationReport]:
+    # clean_sales plus the validation report; the rules are evaluated once
+    flagged = flag_sales(df)
+    validator = sales_validator(quarantine)
+    validator.absorb(validator.plans(flagged))
+    return accept_sales(flagged), validator.finish()
+
+
+def validate_customers(df: pl.DataFrame, quarantine: Optional[str] = None) -> tuple[pl.DataFrame, ValidationReport]:
+    flagged = flag_customers(df)
+    validator = customers_validator(quarantine)
+    validator.absorb(validator.plans(flagged))
+    return accept_customers(flagged), validator.finish()
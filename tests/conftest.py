@@ -0,0 +1,114 @@
+import os
+import threading
+
+import pyarrow.fs as pafs
+import pytest
+
+from src.pipeline import filesystems, gcp_utils
+
+
+class FakeBlob:
+    # Minimal stand-in for google.cloud.storage.Blob backed by a local directory
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = None
+
+    @property
+    def _path(self):
+        return os.path.join(self.bucket.root, self.name)
+
+    @property
+    def size(self):
+        return os.path.getsize(self._path) if self.exists() else None
+
+    @property
+    def generation(self):
+        return self.bucket.client.generations.get((self.bucket.name, self.name))
+
+    def exists(self, client=None):
+        return os.path.isfile(self._path)
+
+    def reload(self, client=None):
+        self.bucket.client.record("reload", self.name, None)
+        if not self.exists():
+            raise FileNotFoundError(self.name)
+
+    def download_to_filename(self, filename, client=None, **kwargs):
+        with open(self._path, "rb") as src, open(filename, "wb") as dst:
+            dst.write(src.read())
+
+    def download_as_bytes(self, client=None, start=None, end=None, if_generation_match=None, **kwargs):
+        if if_generation_match is not None and if_generation_match != self.generation:
+            raise RuntimeError("generation mismatch")
+        self.bucket.client.record("range", self.name, (start, end))
+        with open(self._path, "rb") as f:
+            data = f.read()
+        start = start or 0
+        return data[start:] if end is None else data[start:end + 1]
+
+    def upload_from_filename(self, filename, client=None, **kwargs):
+        self.bucket.client.record("upload", self.name, self.chunk_size)
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        with open(filename, "rb") as src, open(self._path, "wb") as dst:
+            dst.write(src.read())
+        self.bucket.client.bump(self.bucket.name, self.name)
+
+
+class FakeBucket:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.root = os.path.join(client.root, name)
+
+    def blob(self, name):
+        return FakeBlob(self, name)
+
+
+class FakeGCSClient:
+    def __init__(self, root):
+        self.root = str(root)
+        self.generations = {}
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, detail):
+        with self._lock:
+            self.calls.append((kind, name, detail))
+
+    def bump(self, bucket, name):
+        with self._lock:
+            self.generations[(bucket, name)] = self.generations.get((bucket, name), 0) + 1
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+    def list_blobs(self, bucket_or_name, prefix=None, **kwargs):
+        bucket = self.bucket(bucket_or_name)
+        out = []
+        for dirpath, _, files in os.walk(bucket.root):
+            for fname in files:
+                name = os.path.relpath(os.path.join(dirpath, fname), bucket.root).replace(os.sep, "/")
+                if prefix is None or name.startswith(prefix):
+                    out.append(bucket.blob(name))
+        return sorted(out, key=lambda b: b.name)
+
+    def put(self, bucket, name, data: bytes):
+        path = os.path.join(self.root, bucket, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.bump(bucket, name)
+
+
+@pytest.fixture
+def fake_gcs(tmp_path):
+    # Same directory serves the client API and gs://bucket/key URIs
+    root = tmp_path / "gcs"
+    root.mkdir()
+    client = FakeGCSClient(root)
+    gcp_utils.set_gcs_client(client)
+    filesystems.register_filesystem("gs", lambda: pafs.SubTreeFileSystem(str(root), pafs.LocalFileSystem()))
+    yield client
+    gcp_utils.set_gcs_client(None)
+    filesystems.register_filesystem("gs", None)
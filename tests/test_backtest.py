@@ -0,0 +1,61 @@
+import dataclasses
+from datetime import date
+
+import numpy as np
+import polars as pl
+
+from src.pipeline.backtest import Candidate, candidates_from_config, fold_cutoffs, run_backtest
+from src.pipeline.config import Backtest
+
+from test_partitioned import _daily
+
+
+def test_folds_are_date_aligned_and_candidates_expand_grid():
+    daily = _daily(n_stores=2, n_days=60)
+    assert fold_cutoffs(daily, 3, horizon=7, step=7) == [date(2024, 2, 8), date(2024, 2, 15), date(2024, 2, 22)]
+
+    config = Backtest(models=("linear", "hist_gb"), specs=("", "lag:rev_sum:1"), grid="learning_rate=0.05,0.1")
+    names = [c.name for c in candidates_from_config(config)]
+    assert names[:2] == ["linear/spec0", "linear/spec1"]
+    assert "hist_gb,learning_rate=0.1/spec1" in names and len(names) == 6
+
+
+def test_backtest_parallel_matches_serial_with_per_fold_and_store_metrics():
+    daily = _daily(n_stores=3, n_days=80)
+    candidates = [
+        Candidate("linear", "linear"),
+        Candidate("rolling", "linear", "lag:rev_sum:1,7;roll:rev_sum:7:mean;col:num_txn"),
+    ]
+    serial = run_backtest(daily, candidates, n_folds=3, horizon=5, step=7, n_workers=1)
+    parallel = run_backtest(daily, candidates, n_folds=3, horizon=5, step=7, n_workers=2)
+    assert serial.scored.equals(parallel.scored)
+
+    # Every store is scored on the same dates after each cutoff
+    assert serial.scored.height == 2 * 3 * 3 * 5
+    assert serial.folds.height == 6 and serial.stores.height == 6
+    fold0 = serial.scored.filter((pl.col("candidate") == "linear") & (pl.col("fold") == 0))
+    err = (fold0.get_column("rev_fcst") - fold0.get_column("rev_sum")).abs()
+    row = serial.folds.filter((pl.col("candidate") == "linear") & (pl.col("fold") == 0)).row(0, named=True)
+    assert np.isclose(row["mae"], err.mean())
+    assert np.isclose(row["wape"], err.sum() / fold0.get_column("rev_sum").abs().sum())
+    assert serial.best in {"linear", "rolling"}
+
+
+def test_pipeline_publishes_backtest(tmp_path, monkeypatch):
+    from src.pipeline import orchestrate
+
+    monkeypatch.setattr(orchestrate, "backtest_config", dataclasses.replace(orchestrate.backtest_config, enabled=True))
+    sales = tmp_path / "sales.csv"
+    customers = tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 31)],
+        "store_id": ["s1", "s2"] * 15,
+        "product_id": ["p1"] * 30,
+        "quantity": list(range(1, 31)),
+        "price": [2.0] * 30,
+    }).write_csv(str(sales))
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(customers))
+
+    report = orchestrate.run_local_pipeline(str(sales), str(customers), str(tmp_path / "out"))
+    assert pl.read_parquet(tmp_path / "out" / "backtest_folds.parquet").height > 0
+    assert report.attributes["backtest"]["best"] == "linear"
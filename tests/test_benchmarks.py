@@ -0,0 +1,72 @@
+import os
+
+from benchmarks import startup
+from benchmarks.run_benchmarks import compare, run
+from benchmarks.synthetic import RetailSpec, generate_sales
+
+
+def test_generator_is_deterministic_and_skewed():
+    spec = RetailSpec(n_rows=20_000, n_stores=20, n_customers=500, n_days=30, skew=1.5)
+    df = generate_sales(spec)
+    assert df.equals(generate_sales(spec))
+    counts = df.get_column("store_id").value_counts(sort=True).get_column("count")
+    assert counts[0] > 5 * counts[-1]
+
+
+def test_harness_reports_and_flags_regressions():
+    spec = RetailSpec(n_stores=5, n_products=20, n_customers=50, n_days=30)
+    current = run([2_000], spec, repeat=1, horizon=3)
+    timed = [r for r in current["results"] if "seconds" in r]
+    assert {"clean_sales", "daily_store_sales", "train_baseline", "forecast"} <= {r["stage"] for r in timed}
+
+    faster = {"results": [{**r, "seconds": r["seconds"] / 10} for r in timed]}
+    assert {r["stage"] for r in compare(current, faster, 0.10)} == {r["stage"] for r in timed}
+    assert compare(current, current, 0.10) == []
+
+    # A stage that failed, or that the baseline timed but this run lacks, is a regression too
+    failed = {**current, "results": [
+        {"size": r["size"], "stage": r["stage"], "error": "MemoryError: "} if r["stage"] == "forecast" else r
+        for r in timed if r["stage"] != "train_baseline"
+    ]}
+    assert {(r["stage"], r["reason"]) for r in compare(failed, current, 0.10)} == {
+        ("forecast", "error"), ("train_baseline", "missing"),
+    }
+
+
+def test_large_sizes_read_sales_from_parquet_written_once(tmp_path):
+    spec = RetailSpec(n_stores=5, n_products=20, n_customers=50, n_days=30)
+    data_dir = str(tmp_path / "data")
+    in_memory = {r["stage"]: r for r in run([2_000], spec, repeat=1, horizon=3)["results"]}
+    for _ in range(2):
+        current = run([2_000], spec, repeat=1, horizon=3, parquet_from=1_000, data_dir=data_dir)
+        stages = {r["stage"]: r for r in current["results"]}
+        assert stages["daily_store_sales"]["rows_out"] == in_memory["daily_store_sales"]["rows_out"]
+        assert "error" not in stages["forecast"]
+    assert len(os.listdir(data_dir)) == 1
+
+
+def test_startup_flags_targets_missing_from_the_run(tmp_path, monkeypatch, capsys):
+    import json
+
+    current = {"results": [{"size": None, "stage": "import:functions.main", "seconds": 0.1, "heavy_modules": []}]}
+    baseline = {"results": [
+        *current["results"], {"size": None, "stage": "import:src.pipeline.orchestrate", "seconds": 0.5},
+    ]}
+    monkeypatch.setattr(startup, "run", lambda targets, repeat: current)
+    (tmp_path / "base.json").write_text(json.dumps(baseline))
+    code = startup.main([
+        "--targets", "functions.main", "--out", str(tmp_path / "out.json"), "--baseline", str(tmp_path / "base.json"),
+    ])
+    assert code == 1
+    assert "REGRESSION import:src.pipeline.orchestrate: missing from this run" in capsys.readouterr().out
+
+    errored = {"results": [{"size": None, "stage": "import:functions.main", "error": "ImportError: x"}]}
+    monkeypatch.setattr(startup, "run", lambda targets, repeat: errored)
+    assert startup.main(["--out", str(tmp_path / "out.json"), "--baseline", str(tmp_path / "base.json")]) == 1
+    assert "import:functions.main: failed (ImportError: x)" in capsys.readouterr().out
+
+
+def test_startup_harness_times_trigger_in_a_fresh_interpreter():
+    results = {r["stage"]: r for r in startup.run(["src.pipeline.trigger"], repeat=1)["results"]}
+    assert results["import:src.pipeline.trigger"]["heavy_modules"] == []
+    assert results["first_response:src.pipeline.trigger"]["seconds"] >= results["import:src.pipeline.trigger"]["seconds"]
@@ -0,0 +1,62 @@
+import os
+import time
+
+import polars as pl
+
+from src.pipeline.cache import StageCache
+from src.pipeline.orchestrate import run_local_pipeline
+
+
+def _write_sales(path, n_days):
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, n_days + 1)],
+        "store_id": ["s1", "s2"] * (n_days // 2),
+        "product_id": ["p1"] * n_days,
+        "quantity": list(range(1, n_days + 1)),
+        "price": [2.0] * n_days,
+    }).write_csv(str(path))
+
+
+def _write_inputs(tmp_path, n_days=10):
+    sales = tmp_path / "sales.csv"
+    customers = tmp_path / "customers.csv"
+    _write_sales(sales, n_days)
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(customers))
+    return str(sales), str(customers)
+
+
+def test_second_run_hits_every_stage(tmp_path):
+    sales, customers = _write_inputs(tmp_path)
+    out = str(tmp_path / "out")
+
+    first = StageCache(str(tmp_path / "cache"))
+    run_local_pipeline(sales, customers, out, cache=first)
+    assert set(first.report().values()) == {"miss"}
+    fcst = pl.read_parquet(os.path.join(out, "forecast.parquet"))
+
+    second = StageCache(str(tmp_path / "cache"))
+    run_local_pipeline(sales, customers, out, cache=second)
+    assert second.report() == {
+        "daily_store_sales": "hit", "customer_features": "hit", "train_baseline": "hit", "forecast": "hit",
+    }
+    assert pl.read_parquet(os.path.join(out, "forecast.parquet")).equals(fcst)
+
+    # Changing the sales input invalidates everything downstream of it
+    time.sleep(0.01)
+    _write_sales(sales, n_days=12)
+    third = StageCache(str(tmp_path / "cache"))
+    run_local_pipeline(sales, customers, out, cache=third)
+    assert third.report()["daily_store_sales"] == "miss"
+    assert third.report()["clean_customers"] == "hit"
+
+
+def test_lru_eviction_bounds_cache_size(tmp_path):
+    cache = StageCache(str(tmp_path / "cache"), max_bytes=3000)
+    df = pl.DataFrame({"x": list(range(200))})
+    for i in range(5):
+        cache.put("stage", cache.key("stage", i), df)
+        time.sleep(0.01)
+    total = sum(os.path.getsize(os.path.join(d, f)) for d, _, fs in os.walk(tmp_path / "cache") for f in fs)
+    assert total <= 3000
+    assert cache.get("stage", cache.key("stage", 4)) is not None
+    assert cache.get("stage", cache.key("stage", 0)) is None
@@ -0,0 +1,108 @@
+import dataclasses
+import threading
+
+import polars as pl
+import pytest
+
+from src.pipeline.dag import DAG
+from src.pipeline.profiling import RunReport
+
+
+def test_independent_stages_overlap_and_seeded_values_prune_upstream():
+    calls = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    def independent(tag):
+        # Both must be running at once to get past the barrier
+        def fn(x):
+            barrier.wait()
+            calls.append(tag)
+            return x + 1
+        return fn
+
+    dag = DAG(RunReport(), workers=4)
+    dag.add("source", lambda: calls.append("source") or 1, outputs=("x",))
+    dag.add("left", independent("left"), inputs=("x",), outputs=("a",))
+    dag.add("right", independent("right"), inputs=("x",), outputs=("b",))
+    dag.add("join", lambda a, b: pl.DataFrame({"v": [a, b]}), inputs=("a", "b"), outputs=("out",))
+    values = dag.run()
+    assert values["out"].get_column("v").to_list() == [2, 2]
+    assert sorted(calls) == ["left", "right", "source"]
+    assert {s.stage for s in dag.report.stages} == {"source", "left", "right", "join"}
+    assert next(s for s in dag.report.stages if s.stage == "join").rows_out == 2
+
+    # With `a` and `b` given, the source and both branches are skipped
+    seeded = DAG(RunReport())
+    for stage in dag.stages.values():
+        seeded.add(stage.name, stage.fn, stage.inputs, stage.outputs)
+    calls.clear()
+    assert seeded.run({"a": 5, "b": 6})["out"].get_column("v").to_list() == [5, 6]
+    assert calls == [] and [s.stage for s in seeded.report.stages] == ["join"]
+
+
+def test_failed_stage_is_retried_alone_and_run_resumes(monkeypatch):
+    from src.pipeline import dag as dag_module
+
+    monkeypatch.setattr(dag_module, "scheduler", dataclasses.replace(dag_module.scheduler, retry_backoff_seconds=0))
+    runs = {"upstream": 0, "flaky": 0, "broken": 0}
+    fail_broken = [True]
+
+    def upstream():
+        runs["upstream"] += 1
+        return 10
+
+    def flaky(x):
+        runs["flaky"] += 1
+        if runs["flaky"] < 3:
+            raise OSError("transient")
+        return x * 2
+
+    def broken(x):
+        runs["broken"] += 1
+        if fail_broken[0]:
+            raise ValueError("bad input")
+        return x + 1
+
+    dag = DAG(RunReport(), retries=2)
+    dag.add("upstream", upstream, outputs=("x",))
+    dag.add("flaky", flaky, inputs=("x",), outputs=("y",))
+    dag.add("broken", broken, inputs=("y",), outputs=("z",), retries=0)
+    with pytest.raises(ValueError):
+        dag.run()
+    assert runs == {"upstream": 1, "flaky": 3, "broken": 1}
+    assert [s.status for s in dag.report.stages if s.stage == "flaky"] == ["failed", "failed", "ok"]
+
+    # Running again redoes only the failed stage
+    fail_broken[0] = False
+    assert dag.run()["z"] == 21
+    assert runs == {"upstream": 1, "flaky": 3, "broken": 2}
+
+
+def test_exclusive_stages_never_overlap_and_ordering_edges_hold():
+    active, peak, order = [0], [0], []
+    lock = threading.Lock()
+
+    def heavy(tag):
+        def fn():
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            threading.Event().wait(0.05)
+            with lock:
+                active[0] -= 1
+            order.append(tag)
+        return fn
+
+    dag = DAG(RunReport(), workers=4)
+    dag.add("train", heavy("train"), exclusive=True)
+    dag.add("backtest", heavy("backtest"), exclusive=True)
+    dag.add("upload", lambda: order.append("upload"), after=("train",))
+    dag.run()
+    assert peak[0] == 1
+    assert order.index("upload") > order.index("train")
+
+    with pytest.raises(ValueError):
+        bad = DAG(RunReport())
+        bad.add("a", lambda y: y, inputs=("y",), outputs=("x",))
+        bad.add("b", lambda x: x, inputs=("x",), outputs=("y",))
+        bad.run()
@@ -0,0 +1,63 @@
+import polars as pl
+
+from src.pipeline.datasets import load_manifest, read_dataset, scan_dataset, write_dataset
+
+
+def _daily(days, stores=("s1", "s2"), rev=1.0):
+    return pl.DataFrame({
+        "date": [d for d in days for _ in stores],
+        "store_id": [s for _ in days for s in stores],
+        "rev_sum": [rev] * (len(days) * len(stores)),
+    }).with_columns(pl.col("date").str.to_date())
+
+
+def test_partitioned_write_prunes_and_replaces_partitions(tmp_path):
+    root = str(tmp_path / "daily_store_sales")
+    df = _daily(["2024-01-01", "2024-01-02", "2024-01-03"])
+    manifest = write_dataset(df, root, ["date"])
+    assert len(manifest["files"]) == 3
+    assert (tmp_path / "daily_store_sales" / "date=2024-01-02").is_dir()
+    assert not (tmp_path / "daily_store_sales" / "_staging").exists() or not any(
+        (tmp_path / "daily_store_sales" / "_staging").iterdir()
+    )
+
+    out = scan_dataset(root).filter(pl.col("date") == pl.date(2024, 1, 2)).collect()
+    assert out.height == 2 and out.schema["date"] == pl.Date
+
+    # Rewrite one day only; other partitions keep their files
+    write_dataset(_daily(["2024-01-02"], rev=5.0), root, ["date"], mode="partitions")
+    full = read_dataset(root).sort(["date", "store_id"])
+    assert full.height == 6
+    assert full.filter(pl.col("date") == pl.date(2024, 1, 2)).get_column("rev_sum").to_list() == [5.0, 5.0]
+    assert len(load_manifest(root)["files"]) == 3
+    assert len(list((tmp_path / "daily_store_sales" / "date=2024-01-02").iterdir())) == 1
+
+
+def test_unpartitioned_dataset_via_gs_uri(fake_gcs):
+    df = _daily(["2024-01-01"])
+    write_dataset(df, "gs://processed/processed/customer_features")
+    assert read_dataset("gs://processed/processed/customer_features").equals(df)
+
+
+def test_pipeline_writes_partitioned_outputs(tmp_path, monkeypatch):
+    import dataclasses
+
+    from src.pipeline import orchestrate
+    from src.pipeline.ingest import read_sales
+
+    monkeypatch.setattr(orchestrate, "output", dataclasses.replace(orchestrate.output, partitioned=True))
+    sales = tmp_path / "sales.csv"
+    customers = tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 11)],
+        "store_id": ["s1", "s2"] * 5,
+        "product_id": ["p1"] * 10,
+        "quantity": list(range(1, 11)),
+        "price": [2.0] * 10,
+    }).write_csv(str(sales))
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(customers))
+
+    out = tmp_path / "processed"
+    orchestrate.run_local_pipeline(str(sales), str(customers), str(out))
+    assert load_manifest(str(out / "forecast"))["partition_by"] == ["date"]
+    assert read_sales(str(out / "daily_store_sales")).height == 10
@@ -0,0 +1,51 @@
+import dataclasses
+
+import numpy as np
+import pytest
+from sklearn.ensemble import HistGradientBoostingRegressor
+
+from src.pipeline import estimators, model
+from src.pipeline.estimators import batched_predictor, fit_estimator
+from src.pipeline.model import forecast, train_baseline
+from src.pipeline.partitioned import train_partitioned
+
+from test_partitioned import _daily
+
+
+def test_hist_gb_early_stops_on_holdout(monkeypatch):
+    monkeypatch.setattr(estimators, "modeling", dataclasses.replace(
+        estimators.modeling, gb_max_iter=300, early_stopping_rounds=10, gb_learning_rate=0.3
+    ))
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(400, 3))
+    y = 2 * X[:, 0] + rng.normal(0, 1.0, 400)
+    fits = []
+    fit = HistGradientBoostingRegressor.fit
+    monkeypatch.setattr(HistGradientBoostingRegressor, "fit", lambda self, *a: fits.append(self) or fit(self, *a))
+    monkeypatch.setattr(HistGradientBoostingRegressor, "staged_predict", None)
+    gb = fit_estimator("hist_gb", X[:300], y[:300], X[300:], y[300:])
+    assert isinstance(gb, HistGradientBoostingRegressor)
+    assert gb.n_iter_ < 300
+    # One warm-started model, cut back to its best prefix: the same as a fresh fit to it
+    assert all(m is gb for m in fits)
+    fresh = fit(HistGradientBoostingRegressor(**gb.get_params()), X[:300], y[:300])
+    np.testing.assert_array_equal(fresh.predict(X), gb.predict(X))
+
+    with pytest.raises(ValueError):
+        fit_estimator("prophet", X, y)
+
+
+def test_gradient_boosted_forecast_batches_per_model(monkeypatch):
+    monkeypatch.setattr(model, "modeling", dataclasses.replace(model.modeling, model_type="hist_gb"))
+    daily = _daily(n_stores=4, n_days=60)
+    global_art = train_baseline(daily)
+    assert isinstance(global_art.model, HistGradientBoostingRegressor)
+    fc = forecast(global_art, daily, 5)
+    assert fc.height == 20 and fc.get_column("rev_fcst").is_finite().all()
+
+    # Mixed registry: the batched predictor must match predicting store by store
+    art = train_partitioned(daily, n_workers=1, min_rows=20)
+    models = [art.model_for(f"s{i}") for i in range(4)]
+    X = np.random.default_rng(1).normal(100, 10, size=(4, 4))
+    expected = np.array([m.predict(X[i : i + 1])[0] for i, m in enumerate(models)])
+    np.testing.assert_allclose(batched_predictor(models)(X), expected)
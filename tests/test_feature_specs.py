@@ -0,0 +1,68 @@
+import dataclasses
+
+import numpy as np
+import polars as pl
+import pytest
+
+from src.pipeline import model
+from src.pipeline.feature_specs import DEFAULT_SPEC, FeatureState, parse_spec
+from src.pipeline.features import store_customer_mix
+from src.pipeline.model import FEATURE_COLS, forecast, train_baseline
+
+from test_partitioned import _daily
+
+RICH = "lag:rev_sum:1,7,14;lag:qty_sum:1;roll:rev_sum:7,28:mean,std,min,max;ewm:rev_sum:7;cal:dow,month,is_weekend;col:num_txn"
+
+
+def test_parse_spec_names_and_errors():
+    assert DEFAULT_SPEC.names == FEATURE_COLS == ["rev_lag1", "rev_lag7", "qty_lag1", "num_txn"]
+    spec = parse_spec(RICH)
+    assert "rev_roll28_std" in spec.names and "rev_ewm7" in spec.names and len(spec.names) == 17
+    with pytest.raises(ValueError):
+        parse_spec("roll:rev_sum:7:median")
+    with pytest.raises(ValueError):
+        parse_spec("lag:rev_sum:1;lag:rev_sum:1")
+
+
+def test_forecast_state_reproduces_training_features():
+    # Roll the state forward over known days (qty/num_txn constant per store so the
+    # forecaster's hold-last-value rule is exact); every step must equal the features
+    # the training pass computes for those days
+    spec = parse_spec(RICH)
+    daily = _daily(n_stores=3, n_days=60).with_columns([
+        pl.lit(12.0).alias("qty_sum"), pl.lit(7, dtype=pl.UInt32).alias("num_txn")
+    ])
+    cutoff = pl.date(2024, 1, 1) + pl.duration(days=49)
+    hist = daily.filter(pl.col("date") <= cutoff)
+    future = spec.build(daily).filter(pl.col("date") > cutoff).sort(["store_id", "date"])
+
+    state = FeatureState.from_history(spec, hist, "rev_sum", 10)
+    for step in range(10):
+        expected = future.group_by("store_id", maintain_order=True).agg(pl.all().get(step))
+        np.testing.assert_allclose(state.features(spec.names), expected.select(spec.names).to_numpy(), rtol=1e-9)
+        state.advance(expected.get_column("rev_sum").to_numpy())
+
+
+def test_rich_spec_with_customer_mix_trains_and_forecasts(monkeypatch):
+    sales = pl.DataFrame({
+        "store_id": ["s0", "s0", "s1", "s2"],
+        "customer_id": ["c1", "c2", "c1", None],
+    })
+    cust = pl.DataFrame({
+        "customer_id": ["c1", "c2"], "customer_num_txn": [3, 1],
+        "customer_ltv": [30.0, 10.0], "customer_avg_basket": [10.0, 10.0],
+    })
+    mix = store_customer_mix(sales, cust)
+    assert mix.get_column("store_repeat_share").to_list() == [0.5, 1.0]
+
+    monkeypatch.setattr(model, "modeling", dataclasses.replace(
+        model.modeling, feature_spec=RICH + ";mix:store_repeat_share,store_avg_ltv"
+    ))
+    daily = _daily(n_stores=3, n_days=60)
+    art = train_baseline(daily, store_mix=mix)
+    assert art.feature_cols[-2:] == ["store_repeat_share", "store_avg_ltv"]
+    fc = forecast(art, daily, 7)
+    assert fc.height == 21 and fc.get_column("rev_fcst").is_finite().all()
+
+    # Without a store mix the mix features are dropped rather than failing
+    assert "store_avg_ltv" not in train_baseline(daily).feature_cols
@@ -1,12 +1,14 @@
+import numpy as np
 import polars as pl
 
 from src.pipeline.features import daily_store_sales
 from src.pipeline.model import train_baseline, forecast
+from src.pipeline.transform import clean_sales
 
 
 def test_daily_and_model_forecast():
     # Build small synthetic dataset
-    dates = pl.date_range(low=pl.date(2024, 1, 1), high=pl.date(2024, 1, 20), eager=True)
+    dates = pl.date_range(start=pl.date(2024, 1, 1), end=pl.date(2024, 1, 20), eager=True)
     df = pl.DataFrame({
         "date": dates,
         "store_id": ["s1"] * len(dates),
@@ -14,10 +16,67 @@ def test_daily_and_model_forecast():
         "quantity": [1.0 + (i % 3) for i in range(len(dates))],
         "price": [10.0] * len(dates),
     })
-    daily = daily_store_sales(df)
+    daily = daily_store_sales(clean_sales(df))
     art = train_baseline(daily)
     fc = forecast(art, daily, 3)
     assert fc.height == 3  # for single store
     assert set(fc.columns) == {"store_id", "date", "rev_fcst"}
 
 
+def _loop_forecast(art, daily, horizon):
+    # Reference per-store, per-step rollout the batched forecaster must reproduce
+    rows = []
+    for store in sorted(daily.get_column("store_id").unique().to_list()):
+        hist = daily.filter(pl.col("store_id") == store).sort("date")
+        rev = hist.get_column("rev_sum").to_list()
+        qty = hist.get_column("qty_sum").to_list()
+        txn = hist.get_column("num_txn").to_list()
+        day = hist.get_column("date").to_list()[-1]
+        for _ in range(horizon):
+            x = np.array([[rev[-1], rev[-7] if len(rev) >= 7 else rev[-1], qty[-1], txn[-1]]])
+            yhat = float(art.model.predict(x)[0])
+            rev.append(yhat)
+            day = day + np.timedelta64(1, "D").astype(object)
+            rows.append({"store_id": store, "date": day, "rev_fcst": yhat})
+    return pl.DataFrame(rows)
+
+
+def test_batched_forecast_matches_per_store_loop():
+    rng = np.random.default_rng(0)
+    frames = []
+    for store, days in [("s1", 30), ("s2", 12), ("s3", 4)]:
+        dates = pl.date_range(start=pl.date(2024, 1, 1), end=pl.date(2024, 1, days), eager=True)
+        frames.append(pl.DataFrame({
+            "date": dates,
+            "store_id": [store] * days,
+            "product_id": ["p1"] * days,
+            "quantity": rng.integers(1, 10, days).astype(float),
+            "price": rng.uniform(5, 15, days),
+        }))
+    daily = daily_store_sales(clean_sales(pl.concat(frames)))
+    art = train_baseline(daily)
+
+    fc = forecast(art, daily, 9)
+    expected = _loop_forecast(art, daily, 9)
+    assert fc.select(["store_id", "date"]).equals(expected.select(["store_id", "date"]))
+    np.testing.assert_allclose(fc.get_column("rev_fcst").to_numpy(), expected.get_column("rev_fcst").to_numpy())
+
+
+def test_fill_missing_time_series_per_store_span():
+    from datetime import date
+
+    from src.pipeline.features import fill_missing_time_series
+
+    df = pl.DataFrame({
+        "date": [date(2024, 1, 1), date(2024, 1, 4), date(2024, 1, 10), date(2024, 1, 12)],
+        "store_id": ["s1", "s1", "s2", "s2"],
+        "rev_sum": [1.0, 4.0, 2.0, 5.0],
+        "num_txn": [1, 4, 2, 5],
+    })
+    out = fill_missing_time_series(df, "store_id", "date", ["rev_sum", "num_txn"])
+    assert out.columns == df.columns
+    # Each store only spans its own first..last day
+    assert out.group_by("store_id").len().sort("store_id").get_column("len").to_list() == [4, 3]
+    s1 = out.filter(pl.col("store_id") == "s1")
+    assert s1.get_column("rev_sum").to_list() == [1.0, 1.0, 1.0, 4.0]
+    assert fill_missing_time_series(df.lazy(), "store_id", "date", ["rev_sum"]).collect().equals(out)
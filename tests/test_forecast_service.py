@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+import urllib.request
+from datetime import date
+
+import numpy as np
+import polars as pl
+import pytest
+
+from src.pipeline.datasets import write_dataset
+from src.pipeline.forecast_service import ForecastIndex, ForecastService, make_server
+
+
+def _forecast(scale=1.0, n_stores=5, days=14):
+    return pl.DataFrame({
+        "store_id": np.repeat([f"s{i}" for i in range(n_stores)], days),
+        "date": pl.date_range(date(2024, 2, 1), date(2024, 2, days), eager=True).to_list() * n_stores,
+        "rev_fcst": np.outer(np.arange(1, n_stores + 1), np.arange(1, days + 1)).ravel() * scale,
+    })
+
+
+def test_index_store_range_and_top_queries():
+    fcst = _forecast()
+    index = ForecastIndex(fcst.sample(fraction=1.0, shuffle=True, seed=0))
+    rows = index.store("s2", "2024-02-03", "2024-02-05")
+    assert [r["date"] for r in rows] == ["2024-02-03", "2024-02-04", "2024-02-05"]
+    assert [r["rev_fcst"] for r in rows] == [9.0, 12.0, 15.0]
+    assert index.store("s0", "2024-03-01") == []
+    with pytest.raises(KeyError):
+        index.store("missing")
+
+    expected = (
+        fcst.filter(pl.col("date").is_between(date(2024, 2, 10), date(2024, 2, 12)))
+        .group_by("store_id").agg(pl.sum("rev_fcst")).sort("store_id")
+    )
+    assert index.range_totals("2024-02-10", "2024-02-12") == dict(expected.iter_rows())
+    assert [t["store_id"] for t in index.top(2)] == ["s4", "s3"]
+    assert index.top(2)[0]["total"] == pytest.approx(5 * sum(range(1, 15)))
+
+
+def test_service_hot_reloads_file_and_dataset(tmp_path):
+    path = tmp_path / "forecast.parquet"
+    _forecast().write_parquet(path)
+    service = ForecastService(str(path), reload_seconds=0)
+    first = service.summary()
+    assert first["grand_total_forecast"] == pytest.approx(15 * sum(range(1, 15)))
+    assert service.summary() is first  # cached until the forecast changes
+
+    _forecast(scale=2.0).write_parquet(path)
+    os.utime(path, ns=(1, 1))
+    assert service.summary()["grand_total_forecast"] == pytest.approx(2 * first["grand_total_forecast"])
+
+    root = str(tmp_path / "forecast")
+    write_dataset(_forecast(), root, ("date",))
+    service = ForecastService(root, reload_seconds=0)
+    assert service.top(1)[0]["store_id"] == "s4"
+    write_dataset(_forecast(n_stores=6), root, ("date",))
+    assert service.top(1)[0]["store_id"] == "s5"
+
+
+def test_http_endpoints(tmp_path):
+    path = tmp_path / "forecast.parquet"
+    _forecast().write_parquet(path)
+    server = make_server(ForecastService(str(path)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        def get(route):
+            with urllib.request.urlopen(base + route) as resp:
+                return json.loads(resp.read())
+
+        assert get("/health")["status"] == "ok"
+        assert len(get("/stores/s1?start=2024-02-01&end=2024-02-07")["forecast"]) == 7
+        assert get("/top?n=3")["top"][0]["store_id"] == "s4"
+        assert set(get("/range?start=2024-02-14")["stores"]) == {f"s{i}" for i in range(5)}
+        with pytest.raises(urllib.error.HTTPError) as err:
+            get("/stores/nope")
+        assert err.value.code == 404
+    finally:
+        server.shutdown()
+        server.server_close()
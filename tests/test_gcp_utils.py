@@ -0,0 +1,202 @@
+import dataclasses
+import os
+
+import pytest
+
+from src.pipeline import gcp_utils
+from src.pipeline.config import transfer
+
+
+def test_shared_client_and_sliced_download(fake_gcs, tmp_path, monkeypatch):
+    monkeypatch.setattr(gcp_utils, "transfer", dataclasses.replace(
+        transfer, max_workers=4, sliced_threshold_bytes=10, slice_bytes=7,
+    ))
+    payload = bytes(range(256)) * 3
+    fake_gcs.put("raw", "raw/big.bin", payload)
+    assert gcp_utils.get_gcs_client() is gcp_utils.get_gcs_client()
+
+    local = tmp_path / "out" / "big.bin"
+    gcp_utils.gcs_download("raw", "raw/big.bin", str(local))
+    assert local.read_bytes() == payload
+    ranges = [c for c in fake_gcs.calls if c[0] == "range"]
+    assert len(ranges) == -(-len(payload) // 7)
+
+
+def test_sliced_downloads_share_one_pool_and_never_leave_partial_files(fake_gcs, tmp_path, monkeypatch):
+    import threading
+
+    monkeypatch.setattr(gcp_utils, "transfer", dataclasses.replace(
+        transfer, max_workers=3, sliced_threshold_bytes=10, slice_bytes=16,
+    ))
+    monkeypatch.setattr(gcp_utils, "_pool", None)
+    payloads = {f"raw/sales/part-{i}.bin": bytes([i]) * 100 for i in range(4)}
+    for name, data in payloads.items():
+        fake_gcs.put("raw", name, data)
+
+    FakeBlob = type(fake_gcs.bucket("raw").blob(""))
+    threads = set()
+    fetch = FakeBlob.download_as_bytes
+
+    def tracked(self, *args, **kwargs):
+        threads.add(threading.current_thread().name)
+        return fetch(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeBlob, "download_as_bytes", tracked)
+    local = gcp_utils.gcs_download_prefix("raw", "raw/sales/", str(tmp_path / "shards"))
+    assert all(open(local[name], "rb").read() == data for name, data in payloads.items())
+    # Sizes come from the listing, and every slice ran on the one pool's threads
+    assert not [c for c in fake_gcs.calls if c[0] == "reload"]
+    assert 1 <= len(threads) <= 3 and all(t.startswith("gcs-transfer") for t in threads)
+    pool = gcp_utils._pool
+
+    def flaky(self, start=None, end=None, **kwargs):
+        if start == 48:
+            raise ConnectionError("reset")
+        return fetch(self, start=start, end=end, **kwargs)
+
+    monkeypatch.setattr(FakeBlob, "download_as_bytes", flaky)
+    target = tmp_path / "retry" / "part-0.bin"
+    with pytest.raises(ConnectionError):
+        gcp_utils.gcs_download("raw", "raw/sales/part-0.bin", str(target))
+    assert os.listdir(target.parent) == []
+    # Later transfers reuse the pool instead of building their own
+    monkeypatch.setattr(FakeBlob, "download_as_bytes", fetch)
+    gcp_utils.gcs_download("raw", "raw/sales/part-1.bin", str(target))
+    assert gcp_utils._pool is pool
+
+
+def test_concurrent_prefix_download_and_chunked_upload(fake_gcs, tmp_path, monkeypatch):
+    monkeypatch.setattr(gcp_utils, "transfer", dataclasses.replace(
+        transfer, resumable_threshold_bytes=4, upload_chunk_bytes=256 * 1024,
+    ))
+    for i in range(5):
+        fake_gcs.put("raw", f"raw/sales/part-{i}.csv", f"shard {i}".encode())
+    fake_gcs.put("raw", "raw/sales/_SUCCESS", b"")
+
+    local = gcp_utils.gcs_download_prefix("raw", "raw/sales/", str(tmp_path / "shards"), pattern="*.csv")
+    assert sorted(local) == [f"raw/sales/part-{i}.csv" for i in range(5)]
+    assert open(local["raw/sales/part-3.csv"]).read() == "shard 3"
+
+    src = tmp_path / "up.txt"
+    src.write_text("hello world")
+    gcp_utils.gcs_upload_many("processed", [(str(src), "processed/a.txt"), (str(src), "processed/b.txt")])
+    uploads = [c for c in fake_gcs.calls if c[0] == "upload"]
+    assert {c[1] for c in uploads} == {"processed/a.txt", "processed/b.txt"}
+    assert all(c[2] == 256 * 1024 for c in uploads)
+
+
+def test_dataproc_job_reads_and_writes_gs_uris_directly(fake_gcs, monkeypatch):
+    import polars as pl
+
+    from src.pipeline import dataproc_job
+    from src.pipeline.config import GCPConfig
+    from src.pipeline.ingest import read_sales, scan_sales
+
+    monkeypatch.setattr(dataproc_job, "gcp", GCPConfig(bucket_raw="raw", bucket_processed="processed"))
+    sales = pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 11)],
+        "store_id": ["s1", "s2"] * 5,
+        "product_id": ["p1"] * 10,
+        "quantity": list(range(1, 11)),
+        "price": [2.0] * 10,
+    })
+    fake_gcs.put("raw", "raw/sales.csv", sales.write_csv().encode())
+    fake_gcs.put("raw", "raw/customers.csv", b"customer_id,signup_date\nc1,2024-01-01\n")
+
+    dataproc_job.main()
+    out = pl.read_parquet(str(fake_gcs.root + "/processed/processed/forecast.parquet"))
+    assert set(out.get_column("store_id").unique()) == {"s1", "s2"}
+
+    # Parquet over gs:// with column and row-group pruning
+    daily_uri = "gs://processed/processed/daily_store_sales.parquet"
+    assert read_sales(daily_uri, columns=["store_id", "rev_sum"]).columns == ["store_id", "rev_sum"]
+    s1 = scan_sales(daily_uri).filter(pl.col("store_id") == "s1").collect()
+    assert s1.height == 5
+
+
+def test_staged_dataproc_job_uploads_each_output_after_its_write(fake_gcs, monkeypatch):
+    import dataclasses
+
+    import polars as pl
+
+    from src.pipeline import dataproc_job
+    from src.pipeline.config import GCPConfig
+
+    monkeypatch.setattr(dataproc_job, "gcp", GCPConfig(bucket_raw="raw", bucket_processed="processed"))
+    monkeypatch.setattr(dataproc_job, "execution", dataclasses.replace(dataproc_job.execution, stage_locally=True))
+    sales = pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 11)],
+        "store_id": ["s1", "s2"] * 5,
+        "product_id": ["p1"] * 10,
+        "quantity": list(range(1, 11)),
+        "price": [2.0] * 10,
+    })
+    fake_gcs.put("raw", "raw/sales.csv", sales.write_csv().encode())
+    fake_gcs.put("raw", "raw/customers.csv", b"customer_id,signup_date\nc1,2024-01-01\n")
+
+    dataproc_job.main()
+    uploads = {name for kind, name, _ in fake_gcs.calls if kind == "upload"}
+    assert {f"processed/{n}.parquet" for n in dataproc_job.OUTPUT_DATASETS} <= uploads
+    out = pl.read_parquet(str(fake_gcs.root + "/processed/processed/forecast.parquet"))
+    assert set(out.get_column("store_id").unique()) == {"s1", "s2"}
+
+
+def test_in_process_trigger_run_records_pipeline_stages(fake_gcs, tmp_path, monkeypatch):
+    import polars as pl
+
+    from src.pipeline import dataproc_job, runs, trigger
+    from src.pipeline.config import GCPConfig
+
+    monkeypatch.setattr(dataproc_job, "gcp", GCPConfig(bucket_raw="raw", bucket_processed="processed"))
+    monkeypatch.setattr(trigger, "gcp", GCPConfig())
+    sales = pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 11)],
+        "store_id": ["s1", "s2"] * 5,
+        "product_id": ["p1"] * 10,
+        "quantity": list(range(1, 11)),
+        "price": [2.0] * 10,
+    })
+    fake_gcs.put("raw", "raw/2024/sales.csv", sales.write_csv().encode())
+    fake_gcs.put("raw", "raw/customers.csv", b"customer_id,signup_date\nc1,2024-01-01\n")
+
+    store = runs.SQLiteRunStore(str(tmp_path / "runs.sqlite"))
+    runs.set_run_store(store)
+    try:
+        run, created = trigger.submit_run({"sales_blob": "raw/2024/sales.csv"})
+        runs.shutdown(wait=True)
+    finally:
+        runs.set_run_store(None)
+    run = store.get(run.run_id)
+    assert created and run.status == "succeeded", run.error
+    assert {"train_baseline", "forecast", "write_forecast"} <= set(run.stages)
+    assert all(s["status"] == "ok" for s in run.stages.values())
+    assert run.stages["forecast"]["rows_out"] > 0
+
+
+def test_remote_csv_streams_and_ipc_is_staged_in_chunks(fake_gcs, monkeypatch, tmp_path):
+    import gzip
+
+    import polars as pl
+
+    from src.pipeline import ingest
+
+    monkeypatch.setattr(ingest, "_STAGE_CHUNK", 64)
+    sales = pl.DataFrame({
+        "Date": ["2024-01-01", "2024-01-02", "2024-01-03"], "store_id": ["s1", "s2", None],
+        "product_id": ["p1", "p1", "p2"], "quantity": [1, None, 3], "price": [2.0, 3.0, 1.5],
+    })
+    fake_gcs.put("raw", "sales.csv.gz", gzip.compress(sales.write_csv().encode()))
+    local_csv = tmp_path / "sales.csv"
+    sales.write_csv(str(local_csv))
+    ipc = sales.write_ipc(None).getvalue()
+    fake_gcs.put("raw", "sales.arrow", ipc)
+    staged = set(os.listdir(ingest._stage_dir()))
+
+    remote = ingest.read_sales("gs://raw/sales.csv.gz")
+    assert remote.equals(ingest.read_sales(str(local_csv)))
+    assert remote.schema == ingest.read_sales(str(local_csv)).schema
+    assert ingest.scan_sales("gs://raw/sales.csv.gz").filter(pl.col("store_id") == "s2").collect().height == 1
+    from_ipc = ingest.read_ipc("gs://raw/sales.arrow", columns=["store_id", "price"])
+    assert from_ipc.rows() == [("s1", 2.0), ("s2", 3.0), (None, 1.5)]
+    # Nothing is left on local disk: CSVs are never copied, the IPC copy is removed once mapped
+    assert set(os.listdir(ingest._stage_dir())) == staged
@@ -0,0 +1,107 @@
+import dataclasses
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from src.pipeline import orchestrate
+from src.pipeline.hierarchy import aggregation_matrix, hierarchical_forecast, reconcile, store_product_sales
+from src.pipeline.ingest import published, read_table
+
+
+def _series(n_stores=3, n_products=40, days=70, seed=0):
+    # Sparse store x product daily revenue: each pair sells on a random subset of days
+    rng = np.random.default_rng(seed)
+    start = date(2024, 1, 1)
+    rows = []
+    for s in range(n_stores):
+        for p in rng.choice(n_products, size=n_products // 2, replace=False):
+            for d in np.flatnonzero(rng.random(days) < 0.3):
+                rows.append((start + timedelta(days=int(d)), f"s{s}", f"p{p}", 1.0, float(rng.gamma(2.0, 10.0))))
+    return pl.DataFrame(
+        rows, schema=["date", "store_id", "product_id", "qty_sum", "rev_sum"], orient="row"
+    ).with_columns(pl.col("store_id", "product_id").cast(pl.Categorical("lexical")))
+
+
+def test_store_product_sales_keeps_only_days_with_sales():
+    sales = pl.DataFrame({
+        "date": [date(2024, 1, 1)] * 3 + [date(2024, 1, 3)],
+        "store_id": ["s1", "s1", "s2", "s1"],
+        "product_id": ["p1", "p1", "p1", None],
+        "quantity": [1, 2, 1, 1],
+        "revenue": [2.0, 4.0, 3.0, 5.0],
+    })
+    out = store_product_sales(sales).sort(["date", "store_id"])
+    assert out.height == 3
+    assert out.get_column("rev_sum").to_list() == [6.0, 3.0, 5.0]
+    assert out.get_column("product_id").to_list() == ["p1", "p1", None]
+
+
+def test_sparse_reconciliation_matches_dense_projection():
+    rng = np.random.default_rng(1)
+    store_index = np.array([0, 0, 1, 1, 1, 2])
+    C = aggregation_matrix(store_index, 3)
+    bottom, upper = rng.random((6, 4)), rng.random((4, 4)) * 3
+    S = np.vstack([C.toarray(), np.eye(6)])
+    y = np.vstack([upper, bottom])
+
+    for method, w in (("wls", np.concatenate([[6, 2, 3, 1], np.ones(6)])), ("ols", np.ones(10))):
+        W = np.diag(1 / w)
+        dense = np.linalg.solve(S.T @ W @ S, S.T @ W @ y)
+        sparse = reconcile(bottom, upper, C, method)
+        np.testing.assert_allclose(sparse, dense, atol=1e-10)
+    np.testing.assert_array_equal(reconcile(bottom, upper, C, "bottom_up"), bottom)
+
+
+def test_hierarchical_forecast_is_coherent_with_every_level():
+    series = _series()
+    store_forecast = pl.DataFrame({
+        "store_id": pl.Series(["s0", "s1"], dtype=pl.Categorical("lexical")),
+        "date": [date(2024, 3, 11), date(2024, 3, 12)],
+        "rev_fcst": [500.0, 50.0],
+    })
+    bottom, levels = hierarchical_forecast(series, store_forecast, horizon=7, method="wls")
+
+    active = series.select("store_id", "product_id").unique().height
+    assert bottom.height == active * 7 and (bottom.get_column("rev_fcst") >= 0).all()
+    stores = levels.filter(pl.col("level") == "store")
+    sums = bottom.group_by("store_id", "date").agg(pl.col("rev_fcst").sum().alias("bottom"))
+    joined = stores.join(sums, on=["store_id", "date"])
+    assert joined.height == 3 * 7
+    np.testing.assert_allclose(joined.get_column("rev_fcst").to_numpy(), joined.get_column("bottom").to_numpy())
+    chain = levels.filter(pl.col("level") == "chain").sort("date")
+    np.testing.assert_allclose(
+        chain.get_column("rev_fcst").to_numpy(),
+        bottom.group_by("date").agg(pl.col("rev_fcst").sum()).sort("date").get_column("rev_fcst").to_numpy(),
+    )
+    # The model's store forecast is the base where it exists, and pulls the store towards it
+    unreconciled, _ = hierarchical_forecast(series, horizon=7, method="bottom_up")
+    day = (pl.col("store_id") == "s0") & (pl.col("date") == date(2024, 3, 11))
+    base = stores.filter(day)
+    bottom_up = unreconciled.filter(day).get_column("rev_fcst").sum()
+    assert base.get_column("rev_base").item() == 500.0
+    assert bottom_up < base.get_column("rev_fcst").item() < 500.0
+
+
+def test_pipeline_writes_hierarchical_forecasts(tmp_path, monkeypatch):
+    sales_path, cust_path = tmp_path / "sales.csv", tmp_path / "customers.csv"
+    series = _series(n_stores=2, n_products=6, days=90, seed=2)
+    series.select(
+        pl.col("date").dt.strftime("%Y-%m-%d").alias("Date"), "store_id", "product_id",
+        pl.lit(1.0).alias("quantity"), pl.col("rev_sum").alias("price"),
+    ).write_csv(str(sales_path))
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(cust_path))
+    monkeypatch.setattr(
+        orchestrate, "hierarchy_config", dataclasses.replace(orchestrate.hierarchy_config, enabled=True)
+    )
+
+    outputs = {}
+    for lazy in (False, True):
+        out = str(tmp_path / f"out-{lazy}")
+        orchestrate.run_local_pipeline(str(sales_path), str(cust_path), out, lazy=lazy)
+        outputs[lazy] = read_table(published(out, "forecast_store_product")).sort("store_id", "product_id", "date")
+        levels = read_table(published(out, "forecast_hierarchy"))
+        assert set(levels.get_column("level").unique()) == {"chain", "store"}
+    assert outputs[False].height == series.select("store_id", "product_id").unique().height * 14
+    assert_frame_equal(outputs[False], outputs[True], check_dtypes=False)
@@ -0,0 +1,76 @@
+import polars as pl
+import pytest
+
+from src.pipeline.features import customer_features, daily_store_sales
+from src.pipeline.incremental import load_state
+from src.pipeline.orchestrate import run_incremental_pipeline
+from src.pipeline.transform import clean_customers, clean_sales
+
+
+def _sales(days, stores=("s1", "s2")):
+    rows = []
+    for d in days:
+        for i, s in enumerate(stores):
+            rows.append({
+                "date": f"2024-01-{d:02d}", "store_id": s, "product_id": "p1",
+                "quantity": d + i, "price": 2.5, "customer_id": f"c{(d + i) % 3}",
+            })
+    return pl.DataFrame(rows)
+
+
+def test_incremental_matches_full_recompute(tmp_path):
+    customers = pl.DataFrame({"customer_id": ["c0", "c1", "c2", "c9"], "signup_date": ["2023-12-01"] * 4})
+    cust_path = tmp_path / "customers.csv"
+    customers.write_csv(str(cust_path))
+    parts = {}
+    for name, days in [("raw/sales/part-1.csv", range(1, 9)), ("raw/sales/part-2.csv", range(8, 12))]:
+        path = tmp_path / name.replace("/", "_")
+        _sales(days).write_csv(str(path))
+        parts[name] = str(path)
+
+    out_dir = tmp_path / "processed"
+    first = run_incremental_pipeline({"raw/sales/part-1.csv": parts["raw/sales/part-1.csv"]}, str(cust_path), str(out_dir))
+    assert first == ["raw/sales/part-1.csv"]
+    # Second run sees both partitions but only merges the new one
+    second = run_incremental_pipeline(parts, str(cust_path), str(out_dir))
+    assert second == ["raw/sales/part-2.csv"]
+    assert set(load_state(str(out_dir / "state")).partitions) == set(parts)
+
+    sales = clean_sales(pl.concat([_sales(range(1, 9)), _sales(range(8, 12))]))
+    expected_daily = daily_store_sales(sales)
+    expected_cust = customer_features(sales, clean_customers(customers)).sort(pl.col("customer_id").cast(pl.Utf8))
+
+    daily = pl.read_parquet(out_dir / "daily_store_sales.parquet")
+    cust = pl.read_parquet(out_dir / "customer_features.parquet").sort(pl.col("customer_id").cast(pl.Utf8))
+    assert daily.equals(expected_daily.cast(dict(daily.schema)))
+    assert cust.select(expected_cust.columns).equals(expected_cust.cast(dict(cust.schema)))
+
+
+def test_changed_partition_requires_rebuild(tmp_path):
+    cust_path = tmp_path / "customers.csv"
+    pl.DataFrame({"customer_id": ["c0"], "signup_date": ["2023-12-01"]}).write_csv(str(cust_path))
+    part = tmp_path / "part.csv"
+    _sales(range(1, 9)).write_csv(str(part))
+    out_dir = tmp_path / "processed"
+    run_incremental_pipeline({"p": str(part)}, str(cust_path), str(out_dir), fingerprints={"p": "1"})
+    with pytest.raises(RuntimeError):
+        run_incremental_pipeline({"p": str(part)}, str(cust_path), str(out_dir), fingerprints={"p": "2"})
+
+
+def test_partitions_merged_together_match_merged_one_at_a_time(tmp_path):
+    from src.pipeline.incremental import AggregateState, apply_partitions
+
+    paths = {}
+    for name, days in [("a", range(1, 9)), ("b", range(8, 12)), ("c", range(5, 10))]:
+        paths[name] = str(tmp_path / f"{name}.csv")
+        _sales(days).write_csv(paths[name])
+    fingerprints = {name: "1" for name in paths}
+
+    together = apply_partitions(AggregateState.empty(), fingerprints, paths)
+    one_by_one = AggregateState.empty()
+    for name in sorted(paths):
+        one_by_one = apply_partitions(one_by_one, {name: "1"}, paths)
+    assert together.partitions == one_by_one.partitions == fingerprints
+    assert together.daily.equals(one_by_one.daily)
+    by_id = pl.col("customer_id").cast(pl.Utf8)
+    assert together.customers.sort(by_id).equals(one_by_one.customers.sort(by_id))
@@ -0,0 +1,93 @@
+import gzip
+import json
+import os
+
+import polars as pl
+
+from src.pipeline import ingest
+from src.pipeline.transform import clean_sales
+
+
+def _shards(root):
+    # Three shards with drift: gzip'd, header case, a missing optional column, an extra one
+    root.mkdir()
+    (root / "part-0.csv").write_text(
+        "date,store_id,product_id,quantity,price,customer_id\n2024-01-01,s1,p1,1,2.0,c1\n2024-01-01,s2,p1,2,2.0,c2\n"
+    )
+    (root / "part-1.csv.gz").write_bytes(gzip.compress(
+        b"Date,Store_ID,Product_ID,Quantity,Price\n2024-01-02,s1,p2,3,1.5\n"
+    ))
+    (root / "part-2.csv").write_text(
+        "date,store_id,product_id,quantity,price,customer_id,channel\n2024-01-03,s3,p1,1,4.0,c1,web\n"
+    )
+    (root / "_SUCCESS").write_text("")
+    return root
+
+
+def test_directory_glob_and_manifest_inputs_read_concurrently(tmp_path):
+    root = _shards(tmp_path / "sales")
+    expected = clean_sales(pl.concat([
+        pl.read_csv(root / "part-0.csv"),
+        pl.read_csv(root / "part-1.csv.gz").rename(str.lower),
+        pl.read_csv(root / "part-2.csv"),
+    ], how="diagonal_relaxed")).sort(["date", "store_id"])
+
+    (tmp_path / "files.json").write_text(json.dumps({"files": ["sales/part-0.csv", "sales/part-1.csv.gz"]}))
+    assert ingest.expand_inputs(str(tmp_path / "files.json")) == [
+        f"{tmp_path}/sales/part-0.csv", f"{tmp_path}/sales/part-1.csv.gz",
+    ]
+    assert len(ingest.expand_inputs(str(root / "*.csv"))) == 2
+
+    for spec in (str(root), str(root / "part-*")):
+        sales = clean_sales(ingest.read_sales(spec))
+        assert sales.get_column("customer_id").null_count() == 1
+        assert sales.get_column("channel").to_list().count("web") == 1
+        assert sales.select(expected.columns).sort(["date", "store_id"]).equals(expected.cast(dict(sales.schema)))
+        lazy = clean_sales(ingest.scan_sales(spec)).collect()
+        assert lazy.sort(["date", "store_id"]).equals(sales.sort(["date", "store_id"]))
+
+
+def test_csv_shards_are_cached_as_parquet(tmp_path, monkeypatch):
+    import dataclasses
+
+    root = _shards(tmp_path / "sales")
+    cache_dir = tmp_path / "csv_cache"
+    monkeypatch.setattr(ingest, "ingestion", dataclasses.replace(ingest.ingestion, parquet_cache_dir=str(cache_dir)))
+
+    first = ingest.read_sales(str(root))
+    cached = sorted(p.name for p in cache_dir.iterdir())
+    assert len(cached) == 3 and all(name.endswith(".parquet") for name in cached)
+    assert ingest.read_sales(str(root)).equals(first)
+    assert sorted(p.name for p in cache_dir.iterdir()) == cached
+
+    # A rewritten shard gets a new cache entry
+    (root / "part-2.csv").write_text("date,store_id,product_id,quantity,price\n2024-01-04,s3,p1,5,4.0\n")
+    assert ingest.read_sales(str(root)).get_column("quantity").sum() == 11
+    assert len(list(cache_dir.iterdir())) == 4
+
+
+def test_outputs_are_memory_mapped_and_csv_is_exported_on_demand(tmp_path):
+    from datetime import date
+
+    from src.pipeline import orchestrate
+
+    out = str(tmp_path)
+    fcst = pl.DataFrame({"store_id": ["s1", "s2"], "date": [date(2024, 1, 1)] * 2, "rev_fcst": [1.0, 2.0]})
+    orchestrate.write_output(fcst, out, "forecast")
+    orchestrate.write_output(fcst.rename({"rev_fcst": "rev_sum"}), out, "daily_store_sales")
+    # Only the configured CSV is written during the run
+    assert (tmp_path / "forecast.csv").exists() and not (tmp_path / "daily_store_sales.csv").exists()
+
+    daily = ingest.published(out, "daily_store_sales")
+    assert daily.endswith("daily_store_sales.arrow")
+    assert ingest.read_forecast(ingest.published(out, "forecast")).get_column("rev_fcst").to_list() == [1.0, 2.0]
+
+    csv = orchestrate.export_csv(out, "daily_store_sales")
+    assert pl.read_csv(csv).get_column("rev_sum").to_list() == [1.0, 2.0]
+    written = os.path.getmtime(csv)
+    assert orchestrate.export_csv(out, "daily_store_sales") == csv and os.path.getmtime(csv) == written
+
+    # A newer published output is exported again
+    orchestrate.write_output(fcst.rename({"rev_fcst": "rev_sum"}).with_columns(pl.col("rev_sum") * 2), out, "daily_store_sales")
+    os.utime(daily, (written + 10, written + 10))
+    assert pl.read_csv(orchestrate.export_csv(out, "daily_store_sales")).get_column("rev_sum").to_list() == [2.0, 4.0]
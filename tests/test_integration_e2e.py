@@ -35,3 +35,40 @@ def test_e2e_local(tmp_path):
     assert (proc_dir / "forecast.parquet").exists()
 
 
+
+
+def test_single_pass_fold_matches_eager(tmp_path):
+    from src.pipeline.features import customer_features, daily_store_sales, store_customer_mix
+    from src.pipeline.ingest import read_customers, read_sales
+    from src.pipeline.single_pass import fold_sales, spill_sales
+    from src.pipeline.transform import clean_customers, clean_sales
+
+    sales_path = tmp_path / "sales.csv"
+    cust_path = tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": ["2024-01-01", "2024-01-01", "2024-01-02", "2024-01-02"],
+        "store_id": ["s1", "s1", "s1", "s2"],
+        "product_id": ["p1", "p2", "p1", "p3"],
+        "quantity": [1, 2, -1, 3],
+        "price": [10.0, 12.0, 10.0, 8.0],
+        "customer_id": ["c1", "c2", "c1", "c3"],
+    }).write_csv(str(sales_path))
+    pl.DataFrame({
+        "customer_id": ["c1", "c2", "c3"],
+        "signup_date": ["2023-12-15", "2023-11-20", "2023-12-01"],
+    }).write_csv(str(cust_path))
+
+    spill = str(tmp_path / "spill.parquet")
+    assert spill_sales(str(sales_path), spill, explain=True) == 3
+    sales = clean_sales(read_sales(str(sales_path)))
+    customers = clean_customers(read_customers(str(cust_path)))
+    feats = customer_features(sales, customers).sort("customer_id")
+
+    # One row per batch exercises the merging of partial aggregates
+    for batch_rows in (None, 1):
+        out = fold_sales(spill, customers, store_mix=True, batch_rows=batch_rows)
+        assert out.daily_store_sales.equals(daily_store_sales(sales))
+        assert out.customer_features.sort("customer_id").equals(feats)
+        assert out.store_customer_mix.sort("store_id").equals(
+            store_customer_mix(sales, feats).sort("store_id")
+        )
@@ -0,0 +1,79 @@
+import dataclasses
+import json
+
+import numpy as np
+import polars as pl
+from sklearn.linear_model import LinearRegression
+
+from src.pipeline import model, model_store, orchestrate
+from src.pipeline.estimators import ResidualStack
+from src.pipeline.ingest import published
+from src.pipeline.model import forecast, supervised_frame, train_baseline
+from src.pipeline.model_store import load_artifacts, save_artifacts, warm_refit
+from src.pipeline.partitioned import train_partitioned
+
+from test_partitioned import _daily
+
+
+def test_save_load_roundtrip_with_feature_schema(tmp_path):
+    daily = _daily(n_stores=3, n_days=60)
+    art = train_partitioned(daily, n_workers=1, min_rows=20)
+    version = save_artifacts(art, str(tmp_path))
+
+    manifest = json.loads((tmp_path / version / "manifest.json").read_text())
+    assert manifest["feature_cols"] == art.feature_cols and manifest["other_models"] == []
+    assert (tmp_path / "LATEST").read_text() == version
+
+    loaded = load_artifacts(str(tmp_path))
+    assert loaded.version == version and loaded.trained_through == art.trained_through
+    assert set(loaded.registry) == set(art.registry)
+    assert forecast(loaded, daily, 7).equals(forecast(art, daily, 7))
+
+
+def test_linear_warm_refit_matches_full_retrain(tmp_path):
+    daily = _daily(n_stores=2, n_days=90)
+    old = daily.filter(pl.col("date") < pl.date(2024, 3, 1))
+    save_artifacts(train_baseline(old), str(tmp_path))
+
+    refit = warm_refit(load_artifacts(str(tmp_path)), daily)
+    assert refit.trained_through == daily.get_column("date").max()
+    sup = supervised_frame(daily)
+    full = LinearRegression().fit(sup.select(refit.feature_cols).to_numpy(), sup.get_column("rev_sum").to_numpy())
+    np.testing.assert_allclose(refit.model.coef_, full.coef_, rtol=1e-6)
+    np.testing.assert_allclose(refit.model.intercept_, full.intercept_, rtol=1e-6)
+    # No new days: the prior artifact is reused as is
+    assert warm_refit(refit, daily) is refit
+
+
+def test_boosted_artifacts_roundtrip_and_residual_refit(tmp_path, monkeypatch):
+    monkeypatch.setattr(model, "modeling", dataclasses.replace(model.modeling, model_type="hist_gb"))
+    daily = _daily(n_stores=2, n_days=80)
+    old = daily.filter(pl.col("date") < pl.date(2024, 3, 1))
+    save_artifacts(train_baseline(old), str(tmp_path))
+    loaded = load_artifacts(str(tmp_path))
+    refit = warm_refit(loaded, daily)
+    assert isinstance(refit.model, ResidualStack) and refit.model.base is loaded.model
+    assert forecast(refit, daily, 5).get_column("rev_fcst").is_finite().all()
+
+
+def test_forecast_only_uses_persisted_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(model_store, "paths", dataclasses.replace(model_store.paths, models_dir=str(tmp_path / "models")))
+    monkeypatch.setattr(orchestrate, "modeling", dataclasses.replace(orchestrate.modeling, persist=True))
+    sales = tmp_path / "sales.csv"
+    customers = tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 31)],
+        "store_id": ["s1", "s2"] * 15,
+        "product_id": ["p1"] * 30,
+        "quantity": [1 + (d * 7) % 5 for d in range(30)],
+        "price": [2.0] * 30,
+    }).write_csv(str(sales))
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(customers))
+    out = tmp_path / "out"
+    report = orchestrate.run_local_pipeline(str(sales), str(customers), str(out))
+    trained = pl.read_parquet(out / "forecast.parquet")
+
+    served = tmp_path / "served"
+    orchestrate.run_forecast_only(published(str(out), "daily_store_sales"), str(served))
+    assert pl.read_parquet(served / "forecast.parquet").equals(trained)
+    assert report.attributes["model_version"] == model_store.latest_version()
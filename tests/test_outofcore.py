@@ -0,0 +1,68 @@
+import dataclasses
+
+import numpy as np
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from src.pipeline import orchestrate, outofcore
+from src.pipeline.datasets import scan_dataset
+from src.pipeline.features import customer_features, store_customer_mix
+from src.pipeline.ingest import read_customers, read_sales
+from src.pipeline.transform import clean_customers, clean_sales
+
+
+def _inputs(tmp_path, n_rows=3000, n_customers=400):
+    rng = np.random.default_rng(3)
+    sales_path, cust_path = tmp_path / "sales.csv", tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in rng.integers(1, 29, n_rows)],
+        "store_id": [f"s{i}" for i in rng.integers(0, 5, n_rows)],
+        "product_id": [f"p{i}" for i in rng.integers(0, 20, n_rows)],
+        "quantity": rng.integers(1, 5, n_rows),
+        "price": rng.uniform(1, 20, n_rows).round(2),
+        # Some sales have no customer, some customers never buy
+        "customer_id": [f"c{i}" if i < n_customers else None for i in rng.integers(0, n_customers + 30, n_rows)],
+    }).write_csv(str(sales_path))
+    pl.DataFrame({
+        "customer_id": [f"c{i}" for i in range(n_customers + 50)],
+        "signup_date": ["2023-12-01"] * (n_customers + 50),
+    }).write_csv(str(cust_path))
+    return str(sales_path), str(cust_path)
+
+
+def _sorted(df):
+    return df.with_columns(pl.col("customer_id").cast(pl.Utf8)).sort("customer_id")
+
+
+def test_bucketed_customer_features_match_in_memory(tmp_path):
+    sales_path, cust_path = _inputs(tmp_path)
+    sales = clean_sales(read_sales(sales_path))
+    customers = clean_customers(read_customers(cust_path))
+    expected = customer_features(sales, customers)
+
+    # A budget far below the inputs forces many buckets
+    root = str(tmp_path / "customer_features")
+    result = outofcore.customer_features_out_of_core(
+        sales_path, cust_path, root, store_mix=True, budget_bytes=16 * 1024, workers=3
+    )
+    assert result.n_buckets > 4 and result.rows == expected.height
+    got = scan_dataset(root).collect().drop(outofcore.BUCKET_COL).select(expected.columns)
+    assert _sorted(got).equals(_sorted(expected))
+
+    mix = store_customer_mix(sales, expected).sort("store_id")
+    # Same sums, added up in a different order
+    assert_frame_equal(result.store_mix.sort("store_id"), mix, rtol=1e-12)
+
+    assert outofcore.plan_buckets(100, 1000, 4) == (2, 2)
+    assert outofcore.plan_buckets(100, 100, 4, min_buckets=8) == (16, 4)
+
+
+def test_pipeline_writes_customer_features_dataset(tmp_path, monkeypatch):
+    sales_path, cust_path = _inputs(tmp_path, n_rows=500, n_customers=50)
+    monkeypatch.setattr(orchestrate, "outofcore", dataclasses.replace(orchestrate.outofcore, enabled=True))
+    out = tmp_path / "processed"
+    orchestrate.run_local_pipeline(sales_path, cust_path, str(out))
+
+    assert not (out / "customer_features.parquet").exists()
+    feats = scan_dataset(str(out / "customer_features")).collect()
+    assert feats.height == 100 and (out / "forecast.parquet").exists()
@@ -0,0 +1,56 @@
+import numpy as np
+import polars as pl
+
+from src.pipeline.model import forecast
+from src.pipeline.partitioned import cluster_stores, train_partitioned
+
+
+def _daily(n_stores=6, n_days=90, seed=0):
+    rng = np.random.default_rng(seed)
+    frames = []
+    for s in range(n_stores):
+        # Stores differ in level and in how strongly today follows yesterday
+        level, persistence = 100.0 * (s + 1), 0.2 + 0.1 * s
+        rev = [level]
+        for _ in range(n_days - 1):
+            rev.append(level * (1 - persistence) + persistence * rev[-1] + rng.normal(0, 5))
+        frames.append(pl.DataFrame({
+            "date": pl.date_range(pl.date(2024, 1, 1), pl.date(2024, 1, 1) + pl.duration(days=n_days - 1), eager=True),
+            "store_id": f"s{s}",
+            "qty_sum": rng.integers(10, 30, n_days).astype(float),
+            "rev_sum": rev,
+            "num_txn": rng.integers(5, 20, n_days).astype(np.uint32),
+        }))
+    return pl.concat(frames)
+
+
+def test_per_store_models_parallel_matches_serial():
+    daily = _daily()
+    serial = train_partitioned(daily, n_workers=1, min_rows=20)
+    parallel = train_partitioned(daily, n_workers=2, min_rows=20)
+    assert set(serial.registry) == {f"s{i}" for i in range(6)} == set(parallel.registry)
+    for key, model in serial.registry.items():
+        np.testing.assert_allclose(model.coef_, parallel.registry[key].coef_)
+    assert not np.allclose(serial.registry["s0"].coef_, serial.registry["s5"].coef_)
+
+    fc = forecast(serial, daily, 5)
+    assert fc.height == 30
+    # Each store is rolled forward with its own coefficients, near its own level
+    means = fc.group_by("store_id").agg(pl.mean("rev_fcst")).sort("store_id")
+    assert means.get_column("rev_fcst").is_sorted()
+
+
+def test_cluster_models_and_global_fallback():
+    daily = _daily()
+    short = daily.filter((pl.col("store_id") == "s0") & (pl.col("date") < pl.date(2024, 1, 10)))
+    daily = pl.concat([daily.filter(pl.col("store_id") != "s0"), short])
+    groups = cluster_stores(daily, n_clusters=2)
+    assert len(set(groups.values())) == 2
+
+    art = train_partitioned(daily, n_workers=1, min_rows=20)
+    assert "s0" not in art.registry
+    assert art.model_for("s0") is art.model
+
+    clustered = train_partitioned(daily, store_groups=groups, n_workers=1, min_rows=20)
+    assert set(clustered.registry) == set(groups.values())
+    assert clustered.model_for("s3") is clustered.registry[groups["s3"]]
@@ -0,0 +1,71 @@
+import json
+
+import polars as pl
+import pytest
+
+from src.pipeline.orchestrate import run_local_pipeline
+from src.pipeline.profiling import RunReport
+
+
+def test_run_report_covers_every_stage(tmp_path):
+    sales = tmp_path / "sales.csv"
+    customers = tmp_path / "customers.csv"
+    pl.DataFrame({
+        "date": [f"2024-01-{d:02d}" for d in range(1, 11)],
+        "store_id": ["s1", "s2"] * 5,
+        "product_id": ["p1"] * 10,
+        "quantity": list(range(1, 11)),
+        "price": [2.0] * 10,
+    }).write_csv(str(sales))
+    pl.DataFrame({"customer_id": ["c1"], "signup_date": ["2024-01-01"]}).write_csv(str(customers))
+
+    out = tmp_path / "out"
+    run_local_pipeline(str(sales), str(customers), str(out))
+    report = json.loads((out / "run_report.json").read_text())
+    stages = {s["stage"]: s for s in report["stages"]}
+    assert {"clean_sales", "daily_store_sales", "train_baseline", "forecast", "write_forecast"} <= set(stages)
+    assert stages["clean_sales"]["rows_out"] == 10
+    assert stages["daily_store_sales"]["rows_out"] == 10
+    assert stages["write_daily_store_sales"]["bytes_written"] > 0
+    assert all(s["wall_seconds"] >= 0 and s["peak_rss_bytes"] > 0 for s in report["stages"])
+
+
+def test_failed_stage_openmetrics_and_profile(tmp_path):
+    report = RunReport(profile_stage="slow", profile_dir=str(tmp_path))
+    with report.stage("slow", rows_in=3) as st:
+        sum(range(10000))
+        st.rows_out = 1
+    with pytest.raises(ValueError):
+        with report.stage("boom"):
+            raise ValueError("x")
+    assert report.stages[1].status == "failed"
+    assert report.stages[0].profile_path and (tmp_path / report.stages[0].profile_path.split("/")[-1]).exists()
+    text = report.to_openmetrics()
+    assert 'pipeline_stage_rows_out{run_id="%s",stage="slow"} 1' % report.run_id in text
+    assert text.endswith("# EOF\n")
+
+
+def test_concurrent_stages_are_recorded_both_ways():
+    import threading
+
+    report = RunReport()
+    started, release = threading.Event(), threading.Event()
+
+    def background():
+        with report.stage("write"):
+            started.set()
+            release.wait(5)
+
+    t = threading.Thread(target=background)
+    t.start()
+    started.wait(5)
+    with report.stage("train"):
+        release.set()
+    t.join()
+    with report.stage("alone"):
+        pass
+    stages = {m.stage: m for m in report.stages}
+    assert stages["train"].concurrent_stages == ["write"]
+    assert stages["write"].concurrent_stages == ["train"]
+    assert stages["alone"].concurrent_stages == []
+    assert 0 <= stages["train"].thread_cpu_seconds <= stages["train"].cpu_seconds + 1e-3
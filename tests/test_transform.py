@@ -27,3 +27,35 @@ def test_clean_customers_basic():
     assert out.select(pl.col("customer_id").is_not_null().all()).item() is True
 
 
+
+
+def test_sales_read_with_registry_dtypes_and_dictionary_encoded_ids(tmp_path):
+    import pyarrow.parquet as pq
+
+    from src.pipeline.features import daily_store_sales
+    from src.pipeline.ingest import read_daily, read_sales, write_df
+
+    path = tmp_path / "sales.csv"
+    path.write_text(
+        "date,store_id,product_id,quantity,price,customer_id,note\n"
+        "2024-01-02,s2,p1,1,2.5,101,a\n"
+        "2024-01-01,s10,p2,2,3,102,b\n"
+        "not-a-date,s1,p2,2,3,,c\n"
+    )
+    raw = read_sales(str(path))
+    # Fixed dtypes, nothing inferred: unknown columns stay strings, numeric-looking ids are ids
+    assert raw.schema["quantity"] == pl.Float32 and raw.schema["note"] == pl.String
+    assert raw.schema["customer_id"] == pl.Categorical
+
+    sales = clean_sales(raw)
+    assert sales.height == 2
+    assert sales.schema["store_id"] == pl.Categorical and sales.schema["revenue"] == pl.Float32
+
+    daily = daily_store_sales(sales)
+    assert daily.get_column("store_id").cast(pl.Utf8).to_list() == ["s10", "s2"]  # lexical order
+    assert daily.schema["num_txn"] == pl.Int32 and daily.schema["rev_sum"] == pl.Float64
+
+    out = tmp_path / "daily.parquet"
+    write_df(daily, str(out))
+    assert "RLE_DICTIONARY" in pq.ParquetFile(out).metadata.row_group(0).column(1).encodings
+    assert read_daily(str(out)).equals(daily)
@@ -0,0 +1,245 @@
+import concurrent.futures
+import dataclasses
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+
+import pytest
+
+from src.pipeline import runs, trigger
+
+
+def test_entry_points_import_nothing_heavy():
+    code = (
+        "import sys, functions.main, src.pipeline.trigger; "
+        "print([m for m in ('polars', 'pyarrow', 'numpy', 'pandas', 'sklearn', 'google.cloud.storage', 'google.auth') "
+        "if m in sys.modules])"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    ).stdout
+    assert out.strip() == "[]"
+
+
+def test_dataproc_launcher_runs_the_job_from_a_zip_of_src(tmp_path):
+    # Dataproc runs the main file as a script with the pythonFileUris zip on sys.path
+    import zipfile
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    archive = tmp_path / "src.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for folder, _, files in os.walk(os.path.join(root, "src")):
+            for name in files:
+                if name.endswith(".py"):
+                    path = os.path.join(folder, name)
+                    zf.write(path, os.path.relpath(path, root))
+    out = subprocess.run(
+        [sys.executable, os.path.join(root, "scripts", "run_dataproc_job.py"), "--help"],
+        capture_output=True, text=True, check=True, cwd=str(tmp_path),
+        env={**os.environ, "PYTHONPATH": str(archive)},
+    ).stdout
+    assert "--sales-blob" in out and "--run-id" in out
+
+
+class _Request:
+    def __init__(self, path="/", body=None, method="POST"):
+        self.path, self.method, self.args, self._body = path, method, {}, body
+
+    def get_json(self, silent=False):
+        return self._body
+
+
+@pytest.fixture
+def run_store(tmp_path, monkeypatch):
+    store = runs.SQLiteRunStore(str(tmp_path / "runs.sqlite"))
+    runs.set_run_store(store)
+    yield store
+    runs.shutdown()
+    runs.set_run_store(None)
+
+
+def _wait(store, run_id, timeout=10):
+    deadline = time.time() + timeout
+    while store.get(run_id).status in runs.ACTIVE:
+        assert time.time() < deadline
+        time.sleep(0.01)
+    return store.get(run_id)
+
+
+class _FakeDataproc:
+    # Jobs API of one region: submit (idempotent on requestId), cancel, get and filtered list
+    def __init__(self):
+        self.jobs, self.calls = {}, []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, url, headers, body):
+        with self.lock:
+            return self._handle(method, url, headers, body)
+
+    def _handle(self, method, url, headers, body):
+        self.calls.append((method, url, headers, json.loads(body) if body else None))
+        if url == trigger.METADATA_TOKEN_URL:
+            return {"access_token": "tok", "expires_in": 3600}
+        if url.endswith(":submit"):
+            request = json.loads(body)
+            created = f"2024-05-01T10:00:{len(self.jobs):02d}.5Z"
+            job = {**request["job"], "status": {"state": "PENDING", "stateStartTime": created}}
+            return self.jobs.setdefault(request["requestId"], job)
+        if url.endswith(":cancel"):
+            job = self.jobs[url[:-len(":cancel")].rsplit("/", 1)[1]]
+            job["status"] = {"state": "CANCELLED", "stateStartTime": "2024-05-01T10:00:01Z"}
+            return job
+        path, _, query = url.partition("?")
+        if query:
+            terms = urllib.parse.parse_qs(query)["filter"][0].split(" AND ")
+            return {"jobs": [job for job in self.jobs.values() if all(self._match(job, t) for t in terms)]}
+        job_id = path.rsplit("/", 1)[1]
+        if job_id not in self.jobs:
+            raise urllib.error.HTTPError(url, 404, "Not Found", {}, None)
+        return self.jobs[job_id]
+
+    @staticmethod
+    def _match(job, term):
+        field, value = term.split(" = ")
+        if field == "status.state":
+            return job["status"]["state"] not in ("DONE", "ERROR", "CANCELLED")
+        return job["labels"].get(field[len("labels."):]) == value
+
+    def finish(self, job_id, state="DONE"):
+        job = self.jobs[job_id]
+        job["statusHistory"] = [job["status"], {"state": "RUNNING", "stateStartTime": "2024-05-01T10:01:00Z"}]
+        job["status"] = {"state": state, "stateStartTime": "2024-05-01T10:05:00.25Z", "details": "boom"}
+
+
+def test_trigger_submits_dataproc_job_before_responding(monkeypatch):
+    monkeypatch.setattr(trigger, "gcp", dataclasses.replace(
+        trigger.gcp, project_id="proj", region="europe-west1", dataproc_cluster="etl",
+        dataproc_main_uri="gs://code/run_dataproc_job.py", dataproc_python_files=("gs://code/src.zip",),
+    ))
+    monkeypatch.setattr(trigger, "runs_config", dataclasses.replace(trigger.runs_config, max_concurrent=1, max_queued=1))
+    dataproc = _FakeDataproc()
+    trigger.set_transport(dataproc)
+    try:
+        # The job exists once the 202 is returned; the identical request gets the same run
+        body, code, _ = trigger.trigger(_Request(body={"sales_blob": "raw/2024.csv"}))
+        first = json.loads(body)
+        assert code == 202 and first["deduplicated"] is False and first["run_id"] in dataproc.jobs
+        second = json.loads(trigger.trigger(_Request(body={"sales_blob": "raw/2024.csv"}))[0])
+        assert second["run_id"] == first["run_id"] and second["deduplicated"] is True
+        assert json.loads(trigger.trigger(_Request(body={"sales_blob": "raw/2025.csv"}))[0])["deduplicated"] is False
+        assert trigger.trigger(_Request(body={"sales_blob": "raw/2026.csv"}))[1] == 429
+
+        # A retried submit with the same requestId returns the job instead of starting another
+        assert trigger.submit_job(first["run_id"], {"sales_blob": "raw/2024.csv"}) == first["run_id"]
+        assert len(dataproc.jobs) == 2
+
+        # Status comes from the job itself, so any instance can answer it
+        body, code, _ = trigger.trigger(_Request(f"/runs/{first['run_id']}", method="GET"))
+        assert code == 200 and json.loads(body)["status"] == "queued"
+        dataproc.finish(first["run_id"])
+        run = json.loads(trigger.trigger(_Request(f"/runs/{first['run_id']}", method="GET"))[0])
+        assert run["status"] == "succeeded" and run["params"] == {"sales_blob": "raw/2024.csv"}
+        assert run["stages"]["dataproc_job"]["state"] == "DONE" and run["error"] is None
+        assert run["finished_at"] - run["started_at"] == pytest.approx(240.25)
+        assert trigger.trigger(_Request("/runs/nope", method="GET"))[1] == 404
+        assert len(json.loads(trigger.trigger(_Request("/runs", method="GET"))[0])["runs"]) == 2
+        assert trigger.trigger(_Request(body={"bogus": 1}))[1] == 400
+        # Finished runs no longer deduplicate
+        again = json.loads(trigger.trigger(_Request(body={"sales_blob": "raw/2024.csv"}))[0])
+        assert again["run_id"] != first["run_id"]
+    finally:
+        trigger.set_transport(None)
+
+    _, url, headers, payload = next(c for c in dataproc.calls if c[1].endswith(":submit"))
+    assert url == "https://dataproc.googleapis.com/v1/projects/proj/regions/europe-west1/jobs:submit"
+    assert headers["Authorization"] == "Bearer tok"
+    assert payload["requestId"] == payload["job"]["reference"]["jobId"] == first["run_id"]
+    assert payload["job"]["placement"] == {"clusterName": "etl"}
+    assert payload["job"]["labels"]["pipeline-run"] == "trigger"
+    assert payload["job"]["pysparkJob"] == {
+        "mainPythonFileUri": "gs://code/run_dataproc_job.py", "pythonFileUris": ["gs://code/src.zip"],
+        "args": ["--sales-blob=raw/2024.csv", f"--run-id={first['run_id']}"],
+    }
+
+
+def test_concurrent_dataproc_submits_start_one_job_within_the_limit(monkeypatch):
+    monkeypatch.setattr(trigger, "gcp", dataclasses.replace(
+        trigger.gcp, project_id="proj", region="europe-west1", dataproc_cluster="etl",
+        dataproc_main_uri="gs://code/run_dataproc_job.py",
+    ))
+    monkeypatch.setattr(trigger, "runs_config", dataclasses.replace(trigger.runs_config, max_concurrent=1, max_queued=0))
+
+    def race(*bodies):
+        # Every request passes its duplicate/limit checks before any of them submits
+        barrier = threading.Barrier(len(bodies))
+        list_jobs = trigger.list_jobs
+        checked = threading.local()
+
+        def gated_list_jobs(*args, **kwargs):
+            jobs = list_jobs(*args, **kwargs)
+            checked.count = getattr(checked, "count", 0) + 1
+            if checked.count == 2:
+                barrier.wait(timeout=5)
+            return jobs
+
+        monkeypatch.setattr(trigger, "list_jobs", gated_list_jobs)
+        with concurrent.futures.ThreadPoolExecutor(len(bodies)) as pool:
+            results = list(pool.map(lambda b: trigger.trigger(_Request(body=b)), bodies))
+        monkeypatch.setattr(trigger, "list_jobs", list_jobs)
+        return [(code, json.loads(body)) for body, code, _ in results]
+
+    dataproc = _FakeDataproc()
+    trigger.set_transport(dataproc)
+    try:
+        # Identical requests derive the same job id: one job, both callers get it
+        (c1, r1), (c2, r2) = race({"sales_blob": "raw/2024.csv"}, {"sales_blob": "raw/2024.csv"})
+        assert c1 == c2 == 202 and r1["run_id"] == r2["run_id"] and len(dataproc.jobs) == 1
+        assert sorted([r1["deduplicated"], r2["deduplicated"]]) == [False, True]
+        dataproc.finish(r1["run_id"])
+
+        # Distinct requests over the limit: the one ordered last withdraws its job
+        results = race({"sales_blob": "raw/2025.csv"}, {"sales_blob": "raw/2026.csv"})
+        assert sorted(code for code, _ in results) == [202, 429]
+        active = [j for j in dataproc.jobs.values() if j["status"]["state"] == "PENDING"]
+        assert len(active) == 1 and len(dataproc.jobs) == 3
+        accepted = next(r for code, r in results if code == 202)
+        assert active[0]["reference"]["jobId"] == accepted["run_id"]
+    finally:
+        trigger.set_transport(None)
+
+
+def test_worker_pool_bounds_concurrency_and_queue(run_store, monkeypatch):
+    monkeypatch.setattr(runs, "runs_config", dataclasses.replace(runs.runs_config, max_concurrent=1, max_queued=1))
+    release = threading.Event()
+
+    def runner(run_id, params, progress):
+        progress("step", "running")
+        release.wait(5)
+        if params.get("fail"):
+            raise ValueError("bad input")
+        progress("step", "ok", rows_out=3)
+
+    a, created = runs.submit({"n": 1, "fail": True}, runner)
+    b, _ = runs.submit({"n": 2}, runner)
+    assert created and a.run_id != b.run_id
+    with pytest.raises(runs.QueueFull):
+        runs.submit({"n": 3}, runner)
+    time.sleep(0.05)
+    assert run_store.get(b.run_id).status == "queued"  # waits for the single worker
+    release.set()
+    assert _wait(run_store, a.run_id).status == "failed"
+    assert "bad input" in run_store.get(a.run_id).error
+    b = _wait(run_store, b.run_id)
+    assert b.status == "succeeded" and b.stages["step"]["rows_out"] == 3 and b.stages["step"]["attempts"] == 1
+
+    # A run nobody updates any more stops blocking its duplicates
+    monkeypatch.setattr(runs, "runs_config", dataclasses.replace(runs.runs_config, stale_seconds=0))
+    stuck, _ = run_store.claim("key", {})
+    again, created = run_store.claim("key", {})
+    assert created and again.run_id != stuck.run_id and run_store.get(stuck.run_id).status == "abandoned"
@@ -0,0 +1,110 @@
+import dataclasses
+import json
+
+import numpy as np
+import polars as pl
+
+from src.pipeline import orchestrate
+from src.pipeline.transform import clean_sales
+from src.pipeline.validation import DistinctSketch, QuantileSketch, validate_sales
+
+
+def _raw_sales():
+    return pl.DataFrame({
+        "Date": ["2024-01-01", "2024-13-40", None, "2024-01-02", "2024-01-02", "2024-01-03"],
+        "store_id": ["s1", "s1", "s2", None, "s2", "s2"],
+        "product_id": ["p1", "p2", "p1", "p1", "p2", "p1"],
+        "quantity": [1.0, 2.0, 1.0, 3.0, -1.0, None],
+        "price": [10.0, 5.0, 4.0, 2.0, -3.0, 1.0],
+    })
+
+
+def test_rule_bitmask_reasons_and_quarantine(tmp_path):
+    raw = _raw_sales()
+    clean, report = validate_sales(raw, str(tmp_path / "quarantine"))
+    assert clean.equals(clean_sales(raw))
+    assert (report.rows, report.rejected, clean.height) == (6, 5, 1)
+    assert report.rule_counts == {
+        "date_missing": 1, "date_unparsed": 1, "quantity_missing": 1, "quantity_negative": 1,
+        "price_missing": 0, "price_negative": 1, "store_id_missing": 1, "product_id_missing": 0,
+    }
+    quarantined = pl.read_parquet(report.quarantine).sort(["date_raw", "reject_reasons"], nulls_last=True)
+    assert quarantined.get_column("reject_reasons").to_list() == [
+        "quantity_negative,price_negative", "store_id_missing", "quantity_missing", "date_unparsed", "date_missing",
+    ]
+    assert quarantined.get_column("date_raw").to_list()[3] == "2024-13-40"
+    assert report.distinct == {"store_id": 1, "product_id": 1}
+
+
+def test_sketches_are_accurate_and_mergeable():
+    rng = np.random.default_rng(7)
+    ids = pl.DataFrame({"id": [f"c{i}" for i in rng.integers(0, 30_000, 100_000)]})
+    values = pl.DataFrame({"x": np.concatenate([rng.lognormal(2, 1, 50_000), np.zeros(500)])})
+
+    # Two batches sketched separately and merged equal one sketch of everything
+    halves = [DistinctSketch(), DistinctSketch()]
+    for sketch, part in zip(halves, (ids.head(50_000), ids.tail(50_000))):
+        sketch.update(sketch.plan(part.lazy(), "id").collect().to_series())
+    halves[0].merge(halves[1])
+    exact = ids.get_column("id").n_unique()
+    assert abs(halves[0].estimate() - exact) / exact < 0.03
+
+    sketch = QuantileSketch(accuracy=0.01)
+    for part in (values.head(20_000), values.tail(30_500)):
+        sketch.update(sketch.plan(part, "x").to_series())
+    for q in (0.5, 0.9, 0.99):
+        truth = values.get_column("x").quantile(q, interpolation="lower")
+        assert abs(sketch.quantile(q) - truth) / truth < 0.011
+    assert sketch.quantile(0.001) == 0.0
+
+
+def test_lazy_and_eager_pipelines_report_the_same_validation(tmp_path, monkeypatch):
+    sales_path, cust_path = tmp_path / "sales.csv", tmp_path / "customers.csv"
+    days = pl.date_range(pl.date(2024, 1, 1), pl.date(2024, 3, 31), eager=True).dt.strftime("%Y-%m-%d")
+    good = pl.DataFrame({
+        "Date": days, "store_id": "s1", "product_id": "p1", "quantity": 1.0, "price": 2.0,
+    })
+    pl.concat([good, _raw_sales()], how="vertical_relaxed").write_csv(str(sales_path))
+    pl.DataFrame({"customer_id": ["c1", None], "signup_date": ["2024-01-01", "soon"]}).write_csv(str(cust_path))
+    monkeypatch.setattr(
+        orchestrate, "validation_config", dataclasses.replace(orchestrate.validation_config, enabled=True)
+    )
+
+    reports = {}
+    for lazy in (False, True):
+        out = tmp_path / f"out-{lazy}"
+        run = orchestrate.run_local_pipeline(str(sales_path), str(cust_path), str(out), lazy=lazy)
+        reports[lazy] = run.attributes["validation"]
+        assert pl.read_parquet(out / "quarantine" / "sales.parquet").height == 5
+        assert pl.read_parquet(out / "quarantine" / "customers.parquet").height == 1
+        assert json.dumps(reports[lazy], default=str)
+
+    for table in ("sales", "customers"):
+        eager, lazy = reports[False][table], reports[True][table]
+        assert {k: v for k, v in eager.items() if k != "quarantine"} == {k: v for k, v in lazy.items() if k != "quarantine"}
+    assert reports[True]["customers"]["rule_counts"] == {"customer_id_missing": 1, "signup_date_unparsed": 1}
+
+
+def test_streamed_rejects_are_appended_to_the_quarantine_per_batch(tmp_path):
+    from src.pipeline.single_pass import fold_sales, spill_sales
+    from src.pipeline.validation import sales_validator
+
+    sales_path = tmp_path / "sales.csv"
+    pl.concat([_raw_sales()] * 50, how="vertical_relaxed").write_csv(str(sales_path))
+    spill = str(tmp_path / "spill.parquet")
+    spill_sales(str(sales_path), spill, validate=True)
+
+    validator = sales_validator(str(tmp_path / "quarantine"))
+    fold_sales(spill, validator=validator, batch_rows=7)
+    report = validator.finish()
+    quarantined = pl.read_parquet(report.quarantine)
+    assert report.rejected == quarantined.height == 250
+    assert quarantined.get_column("reject_reasons").value_counts().height == 5
+
+    # A batch stream without rejects still replaces the quarantine with an empty file
+    clean = tmp_path / "clean.csv"
+    _raw_sales().head(1).write_csv(str(clean))
+    spill_sales(str(clean), spill, validate=True)
+    validator = sales_validator(str(tmp_path / "quarantine"))
+    fold_sales(spill, validator=validator)
+    assert pl.read_parquet(validator.finish().quarantine).height == 0